@@ -0,0 +1,70 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Micro-benchmark of the hook for received lines (on_parse_gcode).
+
+Feeds "ok" and temperature lines and a long "//" response to the hook,
+with the logging of the plugin replaced by no-ops so only the hook body
+is measured. Needs Python 3 and OctoPrint installed, run from the root of
+the repository:
+
+    python benchmarks/parse_gcode.py
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from octoprint_klipper import plugin as klipper_plugin
+
+OK_LINES = ["ok", "ok T:210.1 /210.0 B:60.0 /60.0", " T:210.1 /210.0 B:60.0 /60.0"] * 1000
+OK_ROUNDS = 100
+RESPONSE_LINES = ["// line {} of a long response".format(i) for i in range(20000)] + ["ok"]
+
+
+def noop(*args, **kwargs):
+    pass
+
+
+def main():
+    for name in ("log_info", "log_error", "update_status"):
+        setattr(klipper_plugin, name, noop)
+    plugin = klipper_plugin.KlipperPlugin()
+
+    def hook(comm, line, *args, **kwargs):
+        return line
+
+    count = len(OK_LINES) * OK_ROUNDS
+    for label, function in (("no-op hook", hook), ("on_parse_gcode", plugin.on_parse_gcode)):
+        start = time.perf_counter()
+        for _ in range(OK_ROUNDS):
+            for line in OK_LINES:
+                function(None, line)
+        elapsed = time.perf_counter() - start
+        print("{}: ok/temperature lines {:.0f} ns per line ({:.1f}M lines/s)".format(
+            label, 1e9 * elapsed / count, count / elapsed / 1e6))
+
+    start = time.perf_counter()
+    for line in RESPONSE_LINES:
+        plugin.on_parse_gcode(None, line)
+    print("on_parse_gcode: a block of {} // lines {:.2f} s".format(
+        len(RESPONSE_LINES) - 1, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
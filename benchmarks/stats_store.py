@@ -0,0 +1,247 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmark of the klippy.log analysis.
+
+Writes a synthetic klippy.log with two MCUs and measures the time and the
+peak memory of parsing and plotting it twice: with the former parser,
+which kept every sample as a dict of strings, and with the typed columns
+of KlipperStatsStore. Then it measures the peak memory of the first
+analysis through the sidecar index and the time of a second one. Needs
+Python 3, run from the root of the repository:
+
+    python benchmarks/stats_store.py [--samples 50000]
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from octoprint_klipper.modules.KlipperLogAnalyzer import KlipperLogAnalyzer
+
+
+class DictLogAnalyzer(object):
+    """The former parse_log and plot_mcu, keeping a list of dicts of strings,
+    as reference.
+    """
+
+    APPLY_PREFIX = KlipperLogAnalyzer.APPLY_PREFIX
+    MAXBANDWIDTH = KlipperLogAnalyzer.MAXBANDWIDTH
+    MAXBUFFER = KlipperLogAnalyzer.MAXBUFFER
+    STATS_INTERVAL = KlipperLogAnalyzer.STATS_INTERVAL
+    TASK_MAX = KlipperLogAnalyzer.TASK_MAX
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+
+    def parse_log(self, logname, mcu=None):
+        if mcu is None:
+            mcu = "mcu"
+        mcu_prefix = mcu + ":"
+        apply_prefix = {p: 1 for p in self.APPLY_PREFIX}
+        out = []
+        with open(logname, "r") as f:
+            for line in f:
+                parts = line.split()
+                if not parts or parts[0] not in ("Stats", "INFO:root:Stats"):
+                    continue
+                prefix = ""
+                keyparts = {}
+                for p in parts[2:]:
+                    if "=" not in p:
+                        prefix = p
+                        if prefix == mcu_prefix:
+                            prefix = ""
+                        continue
+                    name, val = p.split("=", 1)
+                    if name in apply_prefix:
+                        name = prefix + name
+                    keyparts[name] = val
+                if keyparts.get("bytes_write", "0") == "0":
+                    continue
+                keyparts["#sampletime"] = float(parts[1][:-1])
+                out.append(keyparts)
+        return out
+
+    def find_print_restarts(self, data):
+        runoff_samples = {}
+        last_runoff_start = last_buffer_time = last_sampletime = 0.
+        last_print_stall = 0
+        for d in reversed(data):
+            sampletime = d["#sampletime"]
+            buffer_time = float(d.get("buffer_time", 0.))
+            if (last_runoff_start and last_sampletime - sampletime < 5
+                    and buffer_time > last_buffer_time):
+                runoff_samples[last_runoff_start][1].append(sampletime)
+            elif buffer_time < 1.:
+                last_runoff_start = sampletime
+                runoff_samples[last_runoff_start] = [False, [sampletime]]
+            else:
+                last_runoff_start = 0.
+            last_buffer_time = buffer_time
+            last_sampletime = sampletime
+            print_stall = int(d["print_stall"])
+            if print_stall < last_print_stall:
+                if last_runoff_start:
+                    runoff_samples[last_runoff_start][0] = True
+            last_print_stall = print_stall
+        return {sampletime: 1 for stall, samples in list(runoff_samples.values())
+                for sampletime in samples if not stall}
+
+    def plot_mcu(self, data, maxbw):
+        basetime = lasttime = data[0]["#sampletime"]
+        lastbw = float(data[0]["bytes_write"]) + float(data[0]["bytes_retransmit"])
+        sample_resets = self.find_print_restarts(data)
+        times = []
+        bwdeltas = []
+        loads = []
+        awake = []
+        hostbuffers = []
+        for d in data:
+            st = d["#sampletime"]
+            timedelta = st - lasttime
+            if timedelta <= 0.:
+                continue
+            bw = float(d["bytes_write"]) + float(d["bytes_retransmit"])
+            if bw < lastbw:
+                lastbw = bw
+                continue
+            load = float(d["mcu_task_avg"]) + 3 * float(d["mcu_task_stddev"])
+            if st - basetime < 15.:
+                load = 0.
+            hb = float(d["buffer_time"])
+            if hb >= self.MAXBUFFER or st in sample_resets:
+                hb = 0.
+            else:
+                hb = 100. * (self.MAXBUFFER - hb) / self.MAXBUFFER
+            hostbuffers.append(hb)
+            times.append(st)
+            bwdeltas.append(100. * (bw - lastbw) / (maxbw * timedelta))
+            loads.append(100. * load / self.TASK_MAX)
+            awake.append(100. * float(d.get("mcu_awake", 0.)) / self.STATS_INTERVAL)
+            lasttime = st
+            lastbw = bw
+        return dict(times=times, bwdeltas=bwdeltas, loads=loads, awake=awake, buffers=hostbuffers)
+
+
+def write_log(path, samples):
+    random.seed(1)
+    sampletime = 100.
+    bytes_write = dict(mcu=1000, toolhead=500)
+    print_time = 0.
+    print_stall = 0
+    with open(path, "w") as f:
+        for i in range(samples):
+            if i % 997 == 3:
+                f.write("Start printer at Sun Apr 23 10:00:00 2023 (1682236800.0 {:.1f})\n".format(sampletime))
+            sampletime += 5.
+            printing = (i // 300) % 2 == 0
+            if printing:
+                print_time += 5.
+            buffer_time = random.choice([0.5, 1.5, 2.5, 0.2, 1.9]) if printing else 0.
+            if random.random() < 0.01:
+                print_stall += 1
+            parts = ["Stats {:.1f}:".format(sampletime), "gcodein=0"]
+            for mcu in ("mcu", "toolhead"):
+                bytes_write[mcu] += random.randint(100, 5000)
+                parts += [
+                    mcu + ":",
+                    "mcu_awake={:.3f}".format(random.random() * 0.1),
+                    "mcu_task_avg={:.6f}".format(random.random() * 0.001),
+                    "mcu_task_stddev={:.6f}".format(random.random() * 0.0005),
+                    "bytes_write={}".format(bytes_write[mcu]),
+                    "bytes_read={}".format(bytes_write[mcu] * 2),
+                    "bytes_retransmit={}".format(random.randint(0, 20)),
+                    "bytes_invalid=0",
+                    "send_seq={}".format(i),
+                    "receive_seq={}".format(i),
+                    "retransmit_seq=0",
+                    "srtt=0.001",
+                    "rttvar=0.000",
+                    "rto=0.025",
+                    "ready_bytes=0",
+                    "upcoming_bytes=0",
+                    "freq={}".format(16000000 + random.randint(-50, 50)),
+                    "adj={}".format(16000000 + random.randint(-50, 50)),
+                ]
+            parts += [
+                "print_time={:.3f}".format(print_time),
+                "buffer_time={:.3f}".format(buffer_time),
+                "print_stall={}".format(print_stall),
+                "extruder:", "target=0", "temp=25.1", "pwm=0.000",
+                "heater_bed:", "target=0", "temp=24.8", "pwm=0.000",
+                "sysload=0.30", "cputime=1.000", "memavail=100000",
+            ]
+            f.write(" ".join(parts) + "\n")
+
+
+def parse_and_plot(analyzer):
+    # the typed store plots every mcu, the former code only the main one
+    return analyzer.plot_mcu(analyzer.parse_log(analyzer.log_file), analyzer.MAXBANDWIDTH)
+
+
+def measure(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=50000, help="Stats lines of the log")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        log_file = os.path.join(folder, "klippy.log")
+        write_log(log_file, args.samples)
+        print("log: {} Stats lines, {:.1f} MB".format(
+            args.samples, os.path.getsize(log_file) / 1024 / 1024))
+
+        for label, analyzer in (("list of dicts", DictLogAnalyzer), ("typed columns", KlipperLogAnalyzer)):
+            print("{}: parse {:.2f} s, parse + plot {:.2f} s, peak memory {:.0f} MB".format(
+                label,
+                measure(lambda: analyzer(log_file).parse_log(log_file)),
+                measure(lambda: parse_and_plot(analyzer(log_file))),
+                peak_memory(lambda: parse_and_plot(analyzer(log_file)))))
+
+        index_folder = os.path.join(folder, "logindex")
+        print("sidecar index: peak memory of the first analysis {:.0f} MB".format(
+            peak_memory(lambda: KlipperLogAnalyzer(log_file, index_folder=index_folder).analyze())))
+        print("sidecar index: second analysis {:.2f} s".format(
+            measure(lambda: KlipperLogAnalyzer(log_file, index_folder=index_folder).analyze())))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
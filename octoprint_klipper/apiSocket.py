@@ -0,0 +1,206 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Python 3 only, imported on demand by the plugin.
+
+import asyncio
+import json
+import logging
+import threading
+
+ETX = b"\x03"
+
+# the objects and fields the plugin subscribes to
+SUBSCRIPTIONS = {
+    "webhooks": ["state", "state_message"],
+    "print_stats": ["state", "filename", "print_duration", "message"],
+    "toolhead": ["position", "homed_axes", "print_time", "estimated_print_time", "max_velocity"],
+    "extruder": ["temperature", "target", "power"],
+    "heater_bed": ["temperature", "target", "power"],
+    "bed_mesh": ["profile_name"],
+    "mcu": ["mcu_version", "last_stats"],
+}
+
+
+class KlippyApiError(Exception):
+    pass
+
+
+class KlippyApiClient(object):
+    """Client for the JSON API socket of Klippy (klippy -a /tmp/klippy_uds).
+
+    Requests and responses are JSON objects terminated by 0x03. Once Klippy
+    is ready the client subscribes to SUBSCRIPTIONS and Klippy pushes the
+    changed fields as "notify_status_update". The client runs its own
+    asyncio loop in a thread and connects again after Klippy restarted.
+
+    Args:
+        path (str): The path of the socket.
+        on_status (callable): Called with the changed fields and the
+            current status as dicts of object name to fields, on the thread
+            of the client.
+        on_state (callable, optional): Called with "connected", "ready"
+            or "disconnected" and a message.
+    """
+
+    RECONNECT_INTERVAL = 2.
+    READY_POLL_INTERVAL = 1.
+    REQUEST_TIMEOUT = 10.
+
+    def __init__(self, path, on_status, on_state=None, subscriptions=None):
+        self.path = path
+        self.subscriptions = dict(SUBSCRIPTIONS if subscriptions is None else subscriptions)
+        self.status = {}
+        self.connected = False
+        self._on_status = on_status
+        self._on_state = on_state or (lambda state, message: None)
+        self._logger = logging.getLogger("octoprint.plugins.klipper.api_socket")
+        self._loop = None
+        self._writer = None
+        self._pending = {}
+        self._next_id = 1
+        self._running = False
+        self._thread = None
+
+    # -- thread interface
+
+    def start(self):
+        self._running = True
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete,
+                                        args=(self._run(),), name="OctoKlipper API socket")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.):
+        self._running = False
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._close)
+            self._thread.join(timeout)
+
+    def call(self, method, params=None, timeout=REQUEST_TIMEOUT):
+        """Send a request from another thread and wait for the result."""
+        if not self.connected:
+            raise KlippyApiError("Not connected to {}".format(self.path))
+        future = asyncio.run_coroutine_threadsafe(self.request(method, params), self._loop)
+        return future.result(timeout)
+
+    # -- asyncio
+
+    async def request(self, method, params=None):
+        """Send a request and return its result, raise KlippyApiError on an error."""
+        if self._writer is None:
+            raise KlippyApiError("Not connected to {}".format(self.path))
+        request_id = self._next_id
+        self._next_id += 1
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        message = dict(id=request_id, method=method, params=params or {})
+        try:
+            self._writer.write(json.dumps(message).encode("utf-8") + ETX)
+            await self._writer.drain()
+            return await asyncio.wait_for(future, self.REQUEST_TIMEOUT)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _run(self):
+        while self._running:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except (OSError, ValueError):
+                await asyncio.sleep(self.RECONNECT_INTERVAL)
+                continue
+            self.connected = True
+            self._on_state("connected", self.path)
+            reading = asyncio.ensure_future(self._read(reader))
+            try:
+                await self._subscribe()
+                await reading
+            except (OSError, KlippyApiError, asyncio.TimeoutError) as error:
+                self._logger.info("Klippy API socket {}: {}".format(self.path, error))
+            except asyncio.CancelledError:
+                pass
+            finally:
+                reading.cancel()
+                self._close()
+                self.connected = False
+                self.status = {}
+                self._on_state("disconnected", self.path)
+            if self._running:
+                await asyncio.sleep(self.RECONNECT_INTERVAL)
+
+    async def _subscribe(self):
+        # objects can be subscribed to only once klippy is ready
+        while True:
+            info = await self.request("info")
+            if info.get("state") == "ready":
+                break
+            self._on_state(info.get("state", ""), info.get("state_message", ""))
+            await asyncio.sleep(self.READY_POLL_INTERVAL)
+        result = await self.request("objects/subscribe", dict(
+            objects=self.subscriptions,
+            response_template=dict(method="notify_status_update")
+        ))
+        self._on_state("ready", info.get("state_message", ""))
+        self._update(result.get("status", {}))
+
+    async def _read(self, reader):
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    raise KlippyApiError("Klippy closed the connection")
+                parts = (buffer + data).split(ETX)
+                buffer = parts.pop()
+                for part in parts:
+                    try:
+                        message = json.loads(part.decode("utf-8"))
+                    except ValueError:
+                        self._logger.warning("Invalid message from Klippy: {!r}".format(part[:200]))
+                        continue
+                    self._dispatch(message)
+        finally:
+            # no response will arrive anymore
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(KlippyApiError("Disconnected"))
+
+    def _dispatch(self, message):
+        if "id" in message:
+            future = self._pending.get(message["id"])
+            if future is None or future.done():
+                return
+            if "error" in message:
+                future.set_exception(KlippyApiError(message["error"].get("message", message["error"])))
+            else:
+                future.set_result(message.get("result", {}))
+        elif message.get("method") == "notify_status_update":
+            self._update(message.get("params", {}).get("status", {}))
+
+    def _update(self, changes):
+        if not changes:
+            return
+        for name, fields in changes.items():
+            self.status.setdefault(name, {}).update(fields)
+        try:
+            self._on_status(changes, self.status)
+        except Exception:
+            self._logger.exception("Handling a status update failed")
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,278 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+from octoprint_klipper.util import write_file_atomic
+
+
+class BackupStore(object):
+    """Versioned backups of the config files, stored by their content.
+
+    Every backup is an entry of manifest.json with the name of the file,
+    its path relative to the config folder, the time of the backup and the
+    SHA-256 of the content. The content is stored once per hash in blobs/,
+    optionally gzip compressed, so saving unchanged content again only
+    costs hashing it. A retention policy bounds the number of entries and
+    unreferenced blobs are removed.
+    """
+
+    VERSION = 1
+    KEEP_PER_FILE = 20
+    THIN_AFTER_DAYS = 30
+
+    SORTINGS = {
+        # same order as the ItemListHelper of the backup dialog
+        "name": (lambda e: (e["name"].lower(), -e["time"]), False),
+        "date": (lambda e: e["time"], True),
+        "size": (lambda e: e["size"], True),
+    }
+
+    def __init__(self, folder, compress=True, keep_per_file=KEEP_PER_FILE,
+                 thin_after_days=THIN_AFTER_DAYS):
+        self.folder = folder
+        self.blob_folder = os.path.join(folder, "blobs")
+        self.manifest_file = os.path.join(folder, "manifest.json")
+        self.compress = compress
+        self.keep_per_file = keep_per_file
+        self.thin_after_days = thin_after_days
+        self._lock = threading.RLock()
+        self._entries = None
+
+    # -- manifest
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        try:
+            with io.open(self.manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self._entries = manifest.get("entries", [])
+        except (IOError, OSError, ValueError):
+            self._entries = []
+        return self._entries
+
+    def _save(self):
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        data = json.dumps(dict(version=self.VERSION, entries=self._entries), indent=1)
+        write_file_atomic(self.manifest_file, data.encode("utf-8"))
+
+    # -- blobs
+
+    def _blob_file(self, digest, compressed):
+        return os.path.join(self.blob_folder, digest + (".gz" if compressed else ""))
+
+    def _write_blob(self, digest, content):
+        """Store the content unless a blob with its hash exists.
+
+        Returns:
+            bool: Whether the stored blob is compressed.
+        """
+        for compressed in (True, False):
+            if os.path.isfile(self._blob_file(digest, compressed)):
+                return compressed
+        if not os.path.isdir(self.blob_folder):
+            os.makedirs(self.blob_folder)
+        if self.compress:
+            buf = io.BytesIO()
+            # no name and mtime in the header, equal content gives equal blobs
+            with gzip.GzipFile(filename="", mode="wb", fileobj=buf, mtime=0) as gz:
+                gz.write(content)
+            content = buf.getvalue()
+        # synced before the manifest refers to it
+        write_file_atomic(self._blob_file(digest, self.compress), content)
+        return self.compress
+
+    def _read_blob(self, entry):
+        path = self._blob_file(entry["hash"], entry["compressed"])
+        if entry["compressed"]:
+            with gzip.open(path, "rb") as f:
+                return f.read()
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _remove_unreferenced_blobs(self):
+        referenced = set(
+            os.path.basename(self._blob_file(e["hash"], e["compressed"])) for e in self._entries)
+        if not os.path.isdir(self.blob_folder):
+            return
+        for name in os.listdir(self.blob_folder):
+            if name not in referenced:
+                os.remove(os.path.join(self.blob_folder, name))
+
+    # -- backups
+
+    def add(self, path, name=None, backup_time=None):
+        """Back up a file.
+
+        Nothing is stored if the latest backup of the file has the same
+        content.
+
+        Args:
+            path (str): Path of the file.
+            name (str, optional): The path of the file relative to the config
+                folder with "/" as separator, which the versions of a file
+                share. Defaults to the file name.
+            backup_time (float, optional): Time of the backup, defaults to now.
+
+        Returns:
+            dict: The entry of the backup.
+        """
+        with open(path, "rb") as f:
+            content = f.read()
+        return self.add_content(content, name or os.path.basename(path), backup_time)
+
+    def add_content(self, content, name, backup_time=None):
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            entries = self._load()
+            latest = self.latest(name)
+            if latest is not None and latest["hash"] == digest:
+                return latest
+            backup_time = time.time() if backup_time is None else backup_time
+            entry = dict(
+                id=self._unique_id("{}-{}".format(int(backup_time * 1000), digest[:12])),
+                name=name,
+                time=backup_time,
+                hash=digest,
+                size=len(content),
+                compressed=self._write_blob(digest, content)
+            )
+            entries.append(entry)
+            self._apply_retention(name)
+            self._save()
+            self._remove_unreferenced_blobs()
+            return entry
+
+    def _unique_id(self, backup_id):
+        # files with the same content and time, e.g. when migrating copies
+        ids = set(e["id"] for e in self._entries)
+        unique_id = backup_id
+        count = 1
+        while unique_id in ids:
+            unique_id = "{}-{}".format(backup_id, count)
+            count += 1
+        return unique_id
+
+    def latest(self, name):
+        with self._lock:
+            versions = [e for e in self._load() if e["name"] == name]
+        return max(versions, key=lambda e: e["time"]) if versions else None
+
+    def get(self, backup_id):
+        """Return the entry of a backup or None."""
+        with self._lock:
+            for entry in self._load():
+                if entry["id"] == backup_id:
+                    return entry
+        return None
+
+    def read(self, backup_id):
+        """Return the content of a backup as bytes, or None if it is unknown."""
+        entry = self.get(backup_id)
+        if entry is None:
+            return None
+        return self._read_blob(entry)
+
+    def delete(self, backup_id):
+        with self._lock:
+            entries = self._load()
+            remaining = [e for e in entries if e["id"] != backup_id]
+            if len(remaining) == len(entries):
+                return False
+            self._entries = remaining
+            self._save()
+            self._remove_unreferenced_blobs()
+            return True
+
+    def list(self, sort=None, offset=0, limit=None):
+        """Return a page of the backup entries and the number of all entries."""
+        with self._lock:
+            entries = list(self._load())
+        key, reverse = self.SORTINGS.get(sort, self.SORTINGS["date"])
+        entries.sort(key=key, reverse=reverse)
+        end = offset + limit if limit is not None else None
+        return entries[offset:end], len(entries)
+
+    def set_policy(self, compress=None, keep_per_file=None, thin_after_days=None):
+        """Change the settings, a stricter retention applies right away."""
+        with self._lock:
+            if compress is not None:
+                self.compress = compress
+            if keep_per_file is not None:
+                self.keep_per_file = keep_per_file
+            if thin_after_days is not None:
+                self.thin_after_days = thin_after_days
+            entries = self._load()
+            count = len(entries)
+            for name in set(e["name"] for e in entries):
+                self._apply_retention(name)
+            if len(self._entries) != count:
+                self._save()
+                self._remove_unreferenced_blobs()
+
+    def _apply_retention(self, name):
+        """Keep the newest keep_per_file backups of a file. Of the backups
+        older than thin_after_days only the newest of every day is kept.
+        0 disables either rule.
+        """
+        versions = sorted((e for e in self._entries if e["name"] == name),
+                          key=lambda e: e["time"], reverse=True)
+        keep = versions[:self.keep_per_file] if self.keep_per_file > 0 else versions
+        if self.thin_after_days > 0:
+            limit = time.time() - self.thin_after_days * 86400
+            days = set()
+            thinned = []
+            for entry in keep:
+                if entry["time"] < limit:
+                    day = time.strftime("%Y-%m-%d", time.localtime(entry["time"]))
+                    if day in days:
+                        continue
+                    days.add(day)
+                thinned.append(entry)
+            keep = thinned
+        if len(keep) == len(versions):
+            return
+        kept = set(id(e) for e in keep)
+        self._entries = [e for e in self._entries if e["name"] != name or id(e) in kept]
+
+    def migrate_folder(self, folder):
+        """Import the files of the former single-copy backup folder and
+        remove them once they are stored.
+
+        Returns:
+            int: The number of imported files.
+        """
+        if not os.path.isdir(folder):
+            return 0
+        count = 0
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            self.add(path, name, os.path.getmtime(path))
+            os.remove(path)
+            count += 1
+        if not os.listdir(folder):
+            os.rmdir(folder)
+        return count
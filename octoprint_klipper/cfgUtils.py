@@ -1,59 +1,79 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
-import glob
 import os, time, sys
 import io
 import flask
 
 from octoprint_klipper.util import *
+from octoprint_klipper.fileIndex import FileIndex
+from octoprint_klipper.printers import DEFAULT_PRINTER, get_backup_store, get_config_path
+from octoprint_klipper import configDiff, configValidator
 from flask_babel import gettext
-from shutil import copy, copyfile
 
-try:
-    import configparser
-except ImportError:
-    import ConfigParser as configparser
 
-if sys.version_info[0] < 3:
-    import StringIO
+def get_file_index(self, printer):
+    """Return the FileIndex of the config folder of a printer."""
+    folder = get_config_path(printer)
+    key = os.path.realpath(folder)
+    index = self._file_indexes.get(key)
+    if index is None:
+        index = FileIndex(folder, ".cfg", self._file_observer)
+        self._file_indexes[key] = index
+    return index
 
 
-def list_cfg_files(self, path):
+def invalidate_file_indexes(self):
+    """Make the next listing rescan its folder, needed after writes."""
+    for index in self._file_indexes.values():
+        index.invalidate()
+
+
+FILE_SORTINGS = {
+    # same order as the ItemListHelpers of the frontend
+    "name": (lambda f: f["name"].lower(), False),
+    "date": (lambda f: f["date"], True),
+    "size": (lambda f: f["bytes"], True),
+}
+
+
+def list_cfg_files(self, printer, sort=None, offset=0, limit=None):
     """Generate list of config files.
 
     Args:
-        path (str): Path to the config files.
+        printer (dict): The printer, see printers.get_printers.
+        sort (str, optional): Sort by "name", "date" or "size".
+        offset (int, optional): Index of the first file to return.
+        limit (int, optional): Maximum number of files to return.
 
     Returns:
-        list: for every file a dict with keys for name, file, size, mdate, url.
+        tuple: The list of files and the number of all files. For every
+            file a dict with keys for name, file, size, bytes, mdate, date, url.
     """
 
-    files = []
-    if path=="backup":
-        cfg_path = os.path.join(self.get_plugin_data_folder(), "configs", "*")
+    index = get_file_index(self, printer)
+    entries = index.files()
+    if sort in FILE_SORTINGS:
+        key, reverse = FILE_SORTINGS[sort]
+        entries = sorted(entries, key=key, reverse=reverse)
+    total = len(entries)
+    entries = entries[offset:offset + limit if limit is not None else None]
+    log_event(self, "list_cfg_files", folder=index.folder, total=total, returned=len(entries))
+
+    if printer["id"] == DEFAULT_PRINTER:
+        url = flask.url_for("index") + "plugin/klipper/download/configs/"
     else:
-        cfg_path = os.path.expanduser(
-            self._settings.get(["configuration", "config_path"])
-        )
-        cfg_path = os.path.join(cfg_path, "*.cfg")
-    cfg_files = glob.glob(cfg_path)
-    log_debug(self, "list_cfg_files Path: " + cfg_path)
-
-    for f in cfg_files:
-        filesize = os.path.getsize(f)
-        filemdate = time.localtime(os.path.getmtime(f))
-        if path != "backup":
-            url = flask.url_for("index") + "plugin/klipper/download/configs/" + os.path.basename(f)
-        else:
-            url = flask.url_for("index") + "plugin/klipper/download/backup/" + os.path.basename(f)
+        url = flask.url_for("index") + "plugin/klipper/download/printers/{}/".format(printer["id"])
+    files = []
+    for entry in entries:
         files.append(dict(
-            name= os.path.basename(f),
-            file= f,
-            size= " ({:.1f} KB)".format(filesize / 1000.0),
-            mdate= time.strftime("%d.%m.%Y %H:%M", filemdate),
-            url= url,
+            name= entry["name"],
+            file= entry["file"],
+            size= " ({:.1f} KB)".format(entry["bytes"] / 1000.0),
+            bytes= entry["bytes"],
+            mdate= time.strftime("%d.%m.%Y %H:%M", time.localtime(entry["date"])),
+            date= entry["date"],
+            url= url + entry["name"],
         ))
-        log_debug(self, "list_cfg_files " + str(len(files)) + ": " + f)
-    return files
+    return files, total
 
 
 def get_cfg(self, file):
@@ -76,7 +96,7 @@ def get_cfg(self, file):
         )
         file = os.path.join(cfg_path, self._settings.get(["configuration", "baseconfig"]))
     if file_exist(self, file):
-        log_debug(self, "get_cfg_files Path: " + file)
+        log_debug(self, "get_cfg_files Path: {}", file)
         try:
             with io.open(file, "r", encoding='utf-8') as f:
                 response['config'] = f.read()
@@ -110,10 +130,15 @@ def get_cfg(self, file):
         return response
 
 
-def save_cfg(self, content, filename):
+def save_cfg(self, printer, content, filename):
     """Save the configuration file to given file.
 
+    The current file is backed up before it is replaced and the new
+    content is written atomically, so a power loss leaves either the old
+    or the new file. Content equal to the file is not written.
+
     Args:
+        printer (dict): The printer of the configuration.
         content (str): The content of the configuration.
         filename (str): The filename of the configuration file. Default is "printer.cfg"
 
@@ -127,175 +152,250 @@ def save_cfg(self, content, filename):
     )
 
 
-    configpath = os.path.expanduser(self._settings.get(["configuration", "config_path"]))
+    configpath = get_config_path(printer)
     if filename == "":
-        filename = self._settings.get(["configuration", "baseconfig"])
+        filename = printer["baseconfig"]
     if filename[-4:] != ".cfg":
         filename += ".cfg"
 
     filepath = os.path.join(configpath, filename)
 
-    log_debug(self, "Writing Klipper config to {}".format(filepath))
+    if is_unchanged(filepath, content):
+        log_debug(self, "Klipper config {} is unchanged, not written", filepath)
+        return True
+
+    log_debug(self, "Writing Klipper config to {}", filepath)
+    if os.path.isfile(filepath) and not copy_cfg_to_backup(self, printer, filepath):
+        log_error(self, "Error: Klipper config file {} not saved, the backup failed".format(filepath))
+        return False
     try:
-        with io.open(filepath, "w", encoding='utf-8') as f:
-            f.write(content)
-    except IOError:
-        log_error(self, "Error: Couldn't open Klipper config file: {}".format(filepath))
+        write_file_atomic(filepath, content.encode("utf-8"))
+    except (IOError, OSError) as Err:
+        log_error(self, "Error: Couldn't write Klipper config file {}: {}".format(filepath, Err))
         return False
     else:
-        log_debug(self, "Written Klipper config to {}".format(filepath))
+        log_debug(self, "Written Klipper config to {}", filepath)
         return True
     finally:
-        copy_cfg_to_backup(self, filepath)
+        invalidate_file_indexes(self)
 
 
-def check_cfg_ok(self, data):
-    """Checks the given data on parsing errors.
+def is_unchanged(filepath, content):
+    """Whether a file has the given content, compared as text."""
+    try:
+        with io.open(filepath, "r", encoding="utf-8", newline="") as f:
+            return f.read() == content
+    except (IOError, OSError, UnicodeDecodeError):
+        return False
+
+
+def check_cfg(self, printer, data, filename=None, quiet=False):
+    """Checks the given data on parsing and type errors.
+
+    Only the sections changed since the last check of the same file are
+    validated again.
 
     Args:
+        printer (dict): The printer of the config.
         data (str): Content to be validated.
+        filename (str, optional): Name of the file, with the printer the
+            key of the cache.
+        quiet (bool, optional): Do not log the errors, for checks while typing.
 
     Returns:
-        bool: True if the data is valid. False if it is not.
+        dict: is_syntax_ok and the diagnostics for every line with an
+            error or warning, see ConfigValidator.validate.
     """
-    try:
-        dataToValidated = configparser.RawConfigParser(strict=False)
-        if sys.version_info[0] < 3:
-            import StringIO
-            buf = StringIO.StringIO(data)
-            dataToValidated.readfp(buf)
-        else:
-            dataToValidated.read_string(data)
-    except configparser.Error as error:
-        show_error_message(self, error)
-        log_debug(self, 'check_cfg: NOK!')
-        return False
-    else:
-        if not is_float_ok(self, dataToValidated):
-            log_debug(self, "check_cfg: NOK!")
-            return False
-        log_debug(self, "check_cfg: OK")
-        return True
+    started = time.time()
+    key = "{}/{}".format(printer["id"], filename) if filename else None
+    result = self._config_validator.validate(data, key)
+    errors = [d for d in result["diagnostics"] if d["severity"] == configValidator.ERROR]
+    if errors and not quiet:
+        log_error(
+            self,
+            "Error: Invalid Klipper config file:\n"
+            + "\n".join("Line {}: {}".format(d["row"] + 1, d["message"]) for d in errors[:10])
+        )
+    log_event(self, "check_cfg", filename=filename, sections=result["sections"],
+              validated=result["validated"], errors=len(errors),
+              ms=round((time.time() - started) * 1000, 1))
+    return result
 
 
-def show_error_message(self, error):
-    error.message = error.message.replace('\\n', '')
-    if sys.version_info[0] < 3:
-        error.message = error.message.replace('file: u', 'Klipper Configuration', 1)
-        error.message = error.message.replace("'", '', 2)
-        error.message = error.message.replace("u'", "'", 1)
-    else:
-        error.message = error.message.replace('file:', 'Klipper Configuration', 1)
-        error.message = error.message.replace("'", '', 2)
-    log_error(
-        self,
-        ('Error: Invalid Klipper config file:\n' + '{}'.format(str(error))),
-    )
+def list_backups(self, printer, sort=None, offset=0, limit=None):
+    """Generate list of the backups of the config files of a printer.
 
+    Returns:
+        tuple: The list of backups and the number of all backups. For every
+            backup a dict with keys for id, file (the id as well), name,
+            size, bytes, mdate, date, url.
+    """
+    entries, total = get_backup_store(self, printer).list(sort=sort, offset=offset, limit=limit)
+    url = flask.url_for("index") + "plugin/klipper/backup/"
+    files = []
+    for entry in entries:
+        files.append(dict(
+            id= entry["id"],
+            file= entry["id"],
+            name= entry["name"],
+            size= " ({:.1f} KB)".format(entry["size"] / 1000.0),
+            bytes= entry["size"],
+            mdate= time.strftime("%d.%m.%Y %H:%M", time.localtime(entry["time"])),
+            date= entry["time"],
+            url= url + entry["id"] + "/download" + (
+                "" if printer["id"] == DEFAULT_PRINTER else "?printer=" + printer["id"]),
+        ))
+    return files, total
 
-def is_float_ok(self, dataToValidated):
 
-    sections_search_list = [
-        "bltouch",
-        "probe"
-    ]
-    value_search_list = [
-        "x_offset",
-        "y_offset",
-        "z_offset"
-    ]
+def get_backup(self, printer, backup_id):
+    """Get the content of a backup of a printer, in the format of get_cfg."""
+    response = {"config": "",
+                "text": ""}
     try:
-        # cycle through sections and then values
-        for y in sections_search_list:
-            for x in value_search_list:
-                if dataToValidated.has_option(y, x):
-                    a_float = dataToValidated.getfloat(y, x)
-    except ValueError as error:
-        log_error(
-            self,
-            "Error: Invalid Value for <b>" + x + "</b> in Section: <b>" + y + "</b>\n"
-            + "{}".format(str(error))
-        )
-        send_message(
-            self,
-            type = "PopUp",
-            subtype = "warning",
-            title = "Invalid Config data\n",
-            payload = "\n"
-                + "Invalid Value for <b>" + x + "</b> in Section: <b>" + y + "</b>\n"
-                + "{}".format(str(error))
-        )
-        return False
+        content = get_backup_store(self, printer).read(backup_id)
+    except (IOError, OSError) as Err:
+        log_error(self, "Error: Couldn't read backup {}: {}".format(backup_id, Err))
+        response['text'] = str(Err)
+        return response
+    if content is None:
+        response['text'] = gettext("File not found!")
     else:
-        return True
+        response['config'] = content.decode("utf-8", "replace")
+    return response
 
 
-def copy_cfg(self, file, dst):
-    """Copy the config file to the destination.
+def restore_backup(self, printer, backup_id):
+    """Write a backup back to the config folder of its printer.
 
-    Args:
-        file (str): Filepath of the config file to copy.
-        dst (str): Path to copy the config file to.
+    The backup goes to the path it was taken from, relative to the config
+    folder. The file it overwrites is backed up first.
 
     Returns:
-        bool: True if the copy succeeded, False otherwise.
+        bool: True if the backup was restored, False otherwise.
     """
-
-    if os.path.isfile(file):
-        try:
-            copy(file, dst)
-        except IOError:
-            log_error(
-                self,
-                "Error: Klipper config file not found at: {}".format(file)
-            )
+    store = get_backup_store(self, printer)
+    entry = store.get(backup_id)
+    if entry is None:
+        return False
+    configpath = os.path.abspath(get_config_path(printer))
+    dst = os.path.normpath(os.path.join(configpath, entry["name"]))
+    if not dst.startswith(configpath + os.sep):
+        log_error(self, "Error: Backup {} is not in the config folder".format(entry["name"]))
+        return False
+    try:
+        content = store.read(backup_id)
+        if os.path.isfile(dst) and not copy_cfg_to_backup(self, printer, dst):
             return False
-        else:
-            log_debug(
-                self,
-                "File copied: "
-                + file
-            )
-            return True
-    return False
+        if not os.path.isdir(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        write_file_atomic(dst, content)
+    except (IOError, OSError):
+        log_error(self, "Error: Couldn't restore backup {} to {}".format(entry["name"], dst))
+        return False
+    log_debug(self, "Backup {} restored to {}", backup_id, dst)
+    invalidate_file_indexes(self)
+    return True
+
 
+def get_config_name(printer, path):
+    """Return the path of a config file relative to the config folder of its
+    printer, with "/" as separator. It tells apart files of the same name
+    in different folders.
+    """
+    configpath = os.path.abspath(get_config_path(printer))
+    name = os.path.relpath(os.path.abspath(path), configpath)
+    if name.startswith(os.pardir + os.sep):
+        return os.path.basename(path)
+    return name.replace(os.sep, "/")
 
-def copy_cfg_to_backup(self, src):
-    """Copy the config file to backup directory of OctoKlipper.
+
+def copy_cfg_to_backup(self, printer, src):
+    """Store the config file in the backup store of its printer.
 
     Args:
-        src (str): Path to the config file to copy.
+        printer (dict): The printer of the config file.
+        src (str): Path to the config file to back up.
 
     Returns:
-        bool: True if the config file was copied successfully. False otherwise.
+        bool: True if the config file was backed up successfully. False otherwise.
     """
 
     if not os.path.isfile(src):
         return False
 
-    cfg_path = os.path.join(self.get_plugin_data_folder(), "configs", "")
-    filename = os.path.basename(src)
-    if not os.path.exists(cfg_path):
-        try:
-            os.mkdir(cfg_path)
-        except OSError:
-            log_error(self, "Error: Creation of the backup directory {} failed".format(cfg_path))
-            return False
-        else:
-            log_debug(self, "Directory {} created".format(cfg_path))
-
-    dst = os.path.join(cfg_path, filename)
-    log_debug(self, "copy_cfg_to_backup:" + src + " to " + dst)
-    if src == dst:
-        return False
     try:
-        copyfile(src, dst)
-    except IOError:
+        entry = get_backup_store(self, printer).add(src, get_config_name(printer, src))
+    except (IOError, OSError):
         log_error(
             self,
-            "Error: Couldn't copy Klipper config file to {}".format(dst)
+            "Error: Couldn't back up Klipper config file {}".format(src)
         )
         return False
     else:
-        log_debug(self, "CfgBackup " + dst + " written")
+        log_debug(self, "CfgBackup {} of {} stored", entry["id"], src)
         return True
+
+
+def read_config_version(self, printer, version):
+    """Read one side of a diff, aborting with 400 or 404 if it is invalid.
+
+    Args:
+        printer (dict): The printer of the configs and backups.
+        version (dict): {"config": name} for a file of the config folder,
+            {"backup": id} for a backup or {"content": text} for unsaved
+            content of the editor.
+
+    Returns:
+        tuple: The label and the text of the version.
+    """
+    if not isinstance(version, dict):
+        flask.abort(400, description="Invalid request, a version must be an object")
+    if "content" in version:
+        return version.get("label") or "editor", version["content"] or ""
+    if "backup" in version:
+        store = get_backup_store(self, printer)
+        entry = store.get(version["backup"])
+        if entry is None:
+            flask.abort(404, description="Unknown backup {}".format(version["backup"]))
+        content = store.read(entry["id"])
+        label = "{} ({})".format(entry["name"], time.strftime(
+            "%d.%m.%Y %H:%M", time.localtime(entry["time"])))
+        return label, content.decode("utf-8", "replace")
+    if "config" in version:
+        configpath = os.path.realpath(get_config_path(printer))
+        path = os.path.realpath(os.path.join(configpath, version["config"]))
+        if not path.startswith(configpath + os.sep) or not os.path.isfile(path):
+            flask.abort(404, description="Unknown config {}".format(version["config"]))
+        with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+            return version["config"], f.read()
+    flask.abort(400, description="Invalid request, a version needs config, backup or content")
+
+
+def diff_cfg(self, printer, from_version, to_version, format="sections", context=configDiff.CONTEXT):
+    """Compare two versions of a config of a printer, see configDiff.diff_configs."""
+    from_label, from_text = read_config_version(self, printer, from_version)
+    to_label, to_text = read_config_version(self, printer, to_version)
+    result = configDiff.diff_configs(from_text, to_text, from_label, to_label, format, context)
+    log_event(self, "diff_cfg", from_label=from_label, to_label=to_label,
+              format=format, changed=len(result["changed_lines"]))
+    return result
+
+
+def get_include_graph(self, printer, base=None):
+    """Resolve the includes of a config of a printer, its base config by default.
+    Aborts with 404 if the config is not in the config folder.
+
+    Returns:
+        dict: See ConfigGraph.resolve.
+    """
+    configpath = os.path.realpath(get_config_path(printer))
+    base = base or printer["baseconfig"]
+    if not os.path.realpath(os.path.join(configpath, base)).startswith(configpath + os.sep):
+        flask.abort(404, description="Unknown config {}".format(base))
+    graph = self._config_graph.resolve(configpath, base)
+    log_event(self, "include_graph", base=base, files=len(graph["files"]),
+              sections=len(graph["sections"]), cycles=len(graph["cycles"]))
+    for cycle in graph["cycles"]:
+        log_error(self, "Error: Recursive include of config file: {}".format(" -> ".join(cycle)))
+    return graph
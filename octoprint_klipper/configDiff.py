@@ -0,0 +1,146 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import difflib
+
+FORMATS = ("unified", "sections")
+CONTEXT = 3
+
+
+def split_sections(lines):
+    """Split the lines of a config into its sections.
+
+    Lines before the first section header belong to a section without a
+    name. A name used more than once gets its occurrence appended, like
+    "gcode_macro foo#2", so every section can be matched by its key.
+
+    Returns:
+        list: (key, index of the first line, lines) for every section.
+    """
+    sections = []
+    seen = {}
+    key, start = "", 0
+    for i, line in enumerate(lines):
+        if line.startswith("["):
+            end = line.find("]")
+            if end > 0:
+                if i > start or key:
+                    sections.append((key, start, lines[start:i]))
+                key = line[1:end].strip()
+                seen[key] = seen.get(key, 0) + 1
+                if seen[key] > 1:
+                    key = "{}#{}".format(key, seen[key])
+                start = i
+    if lines[start:] or key:
+        sections.append((key, start, lines[start:]))
+    return sections
+
+
+def _hunks(a, b, a_start, b_start, context):
+    """Return the hunks of a diff of two line lists with 1-based line
+    numbers of the whole files and the lines prefixed like a unified diff.
+    """
+    hunks = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for group in matcher.get_grouped_opcodes(context):
+        lines = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines.extend(" " + line for line in a[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                lines.extend("-" + line for line in a[i1:i2])
+            if tag in ("replace", "insert"):
+                lines.extend("+" + line for line in b[j1:j2])
+        first, last = group[0], group[-1]
+        from_count = last[2] - first[1]
+        to_count = last[4] - first[3]
+        # like diff, an empty range starts at the line before it
+        hunks.append(dict(
+            from_start=a_start + first[1] + (1 if from_count else 0),
+            from_count=from_count,
+            to_start=b_start + first[3] + (1 if to_count else 0),
+            to_count=to_count,
+            lines=lines
+        ))
+    return hunks
+
+
+def changed_lines(a, b):
+    """Return the changes of b against a for highlighting b.
+
+    Returns:
+        tuple: The 0-based indexes of the changed or added lines of b and
+            the indexes of the lines of b before which lines were removed.
+    """
+    changed, removed = [], []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ("replace", "insert"):
+            changed.extend(range(j1, j2))
+        elif tag == "delete":
+            removed.append(j1)
+    return changed, removed
+
+
+def diff_configs(from_text, to_text, from_label="from", to_label="to",
+                 format="sections", context=CONTEXT):
+    """Compare two versions of a config.
+
+    Args:
+        format (str): "unified" for the text of a unified diff, "sections"
+            for the added, removed and changed sections with their hunks.
+        context (int): Number of unchanged lines around a change.
+
+    Returns:
+        dict: identical, changed_lines and removed_at (see changed_lines)
+            and the diff in unified or sections.
+    """
+    a = from_text.splitlines()
+    b = to_text.splitlines()
+    result = dict(
+        format=format,
+        from_label=from_label,
+        to_label=to_label,
+        identical=a == b
+    )
+    result["changed_lines"], result["removed_at"] = changed_lines(a, b)
+    if format == "unified":
+        result["unified"] = "\n".join(difflib.unified_diff(
+            a, b, from_label, to_label, n=context, lineterm=""))
+        return result
+
+    added_sections = split_sections(b)
+    to_sections = dict((key, (start, lines)) for key, start, lines in added_sections)
+    sections = []
+    for key, start, lines in split_sections(a):
+        if key not in to_sections:
+            sections.append(dict(
+                name=key, status="removed",
+                hunks=_hunks(lines, [], start, 0, context)))
+            continue
+        to_start, to_lines = to_sections.pop(key)
+        if lines != to_lines:
+            sections.append(dict(
+                name=key, status="changed",
+                hunks=_hunks(lines, to_lines, start, to_start, context)))
+    for key, start, lines in added_sections:
+        if key in to_sections:
+            sections.append(dict(
+                name=key, status="added",
+                hunks=_hunks([], lines, 0, start, context)))
+    result["sections"] = sections
+    return result
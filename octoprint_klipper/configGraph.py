@@ -0,0 +1,138 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import glob
+import io
+import os
+import threading
+
+from octoprint_klipper.configDiff import split_sections
+
+_MAGIC = ("*", "?", "[")
+
+
+class ConfigGraph(object):
+    """Resolves the [include ...] tree of a config like Klipper does.
+
+    Includes are relative to the including file and may be globs. The
+    sections of an included file take the place of the include line, so
+    the merged index has the sections in the order Klipper reads them. A
+    file included twice is read twice, only an include of a file that is
+    still being read is a cycle.
+
+    Parsed files are cached with their mtime and size and only parsed
+    again after a change.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _parse(self, path):
+        """Return the sections and includes of a file, from the cache if
+        it did not change.
+
+        Returns:
+            list: (name, row) for every section, (None, row, pattern) for
+                every include, in the order of the file.
+        """
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None and cached[0] == (stat.st_mtime, stat.st_size):
+            return cached[1]
+        with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+        items = []
+        for key, start, section_lines in split_sections(lines):
+            if not key:
+                continue
+            name = key.split("#", 1)[0]
+            if name.startswith("include "):
+                items.append((None, start, name[len("include "):].strip()))
+            else:
+                items.append((name, start))
+        with self._lock:
+            self._files[path] = ((stat.st_mtime, stat.st_size), items)
+        return items
+
+    def resolve(self, folder, base):
+        """Resolve the include tree of a base config.
+
+        Args:
+            folder (str): The config folder, paths are reported relative to it.
+            base (str): The base config, relative to the folder.
+
+        Returns:
+            dict:
+                files: file and includes (the included files) for every file
+                    in the order they are read, once per time it is read.
+                sections: name and definitions (file and 0-based row) of
+                    every section in the order they are read, a section
+                    defined in several files has several definitions.
+                cycles: The chains of files that include themselves.
+                missing: file, row and include of includes without a file.
+        """
+        folder = os.path.realpath(folder)
+        files = []
+        sections = []
+        index = {}
+        cycles = []
+        missing = []
+
+        def relative(path):
+            return os.path.relpath(path, folder)
+
+        def visit(path, stack):
+            try:
+                items = self._parse(path)
+            except (IOError, OSError):
+                missing.append(dict(file=relative(stack[-1]) if stack else None,
+                                    row=None, include=relative(path)))
+                return
+            includes = []
+            files.append(dict(file=relative(path), includes=includes))
+            stack = stack + [path]
+            for item in items:
+                if item[0] is not None:
+                    name, row = item
+                    if name not in index:
+                        index[name] = dict(name=name, definitions=[])
+                        sections.append(index[name])
+                    index[name]["definitions"].append(dict(file=relative(path), row=row))
+                    continue
+                row, pattern = item[1], item[2]
+                full_pattern = os.path.join(os.path.dirname(path), os.path.expanduser(pattern))
+                matches = sorted(glob.glob(full_pattern))
+                if not matches and not any(c in pattern for c in _MAGIC):
+                    missing.append(dict(file=relative(path), row=row, include=pattern))
+                for match in matches:
+                    match = os.path.realpath(match)
+                    includes.append(relative(match))
+                    if match in stack:
+                        cycles.append([relative(p) for p in stack[stack.index(match):]] + [relative(match)])
+                    else:
+                        visit(match, stack)
+
+        visit(os.path.realpath(os.path.join(folder, base)), [])
+        return dict(base=base, files=files, sections=sections, cycles=cycles, missing=missing)
+
+    def forget(self, path=None):
+        with self._lock:
+            if path is None:
+                self._files.clear()
+            else:
+                self._files.pop(os.path.realpath(path), None)
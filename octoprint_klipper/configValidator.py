@@ -0,0 +1,212 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from octoprint_klipper.configDiff import split_sections
+
+ERROR = "error"
+WARNING = "warning"
+
+FLOAT_OPTIONS = frozenset((
+    "rotation_distance", "position_endstop", "position_min", "position_max",
+    "homing_speed", "second_homing_speed", "homing_retract_dist", "homing_retract_speed",
+    "max_velocity", "max_accel", "max_accel_to_decel", "minimum_cruise_ratio",
+    "square_corner_velocity", "max_z_velocity", "max_z_accel",
+    "x_offset", "y_offset", "z_offset", "speed", "lift_speed",
+    "sample_retract_dist", "samples_tolerance",
+    "nozzle_diameter", "filament_diameter", "max_extrude_cross_section",
+    "max_extrude_only_distance", "max_extrude_only_velocity", "max_extrude_only_accel",
+    "pressure_advance", "pressure_advance_smooth_time", "instantaneous_corner_velocity",
+    "min_temp", "max_temp", "min_extrude_temp", "max_power", "smooth_time",
+    "pullup_resistor", "pid_kp", "pid_ki", "pid_kd", "max_delta",
+    "pwm_cycle_time", "cycle_time", "kick_start_time", "off_below", "shutdown_speed",
+    "run_current", "hold_current", "sense_resistor", "value", "shutdown_value",
+    "stealthchop_threshold",
+))
+
+INT_OPTIONS = frozenset((
+    "microsteps", "full_steps_per_rotation", "baud", "samples",
+    "samples_tolerance_retries", "driver_sgthrs", "chain_count", "tachometer_ppr",
+))
+
+BOOLEANS = ("true", "false", "yes", "no", "on", "off", "1", "0")
+
+ENUM_OPTIONS = {
+    "kinematics": ("cartesian", "corexy", "corexz", "hybrid_corexy", "hybrid_corexz",
+                   "limited_cartesian", "limited_corexy", "limited_corexz",
+                   "generic_cartesian", "delta", "deltesian", "rotary_delta", "polar",
+                   "winch", "none"),
+    "control": ("pid", "watermark"),
+    "homing_positive_dir": BOOLEANS,
+    "interpolate": BOOLEANS,
+    "hardware_pwm": BOOLEANS,
+    "is_non_critical": BOOLEANS,
+}
+
+# Klipper keeps adding values to these, others are only warned about
+OPEN_ENUM_OPTIONS = frozenset(("kinematics",))
+
+# sections with templates or menus, where the options are not typed
+UNTYPED_SECTIONS = ("gcode_macro", "delayed_gcode", "menu", "gcode_button", "gcode_shell_command")
+
+_OPTION = re.compile(r"^([^:=\s][^:=]*?)\s*[:=]\s?(.*)$")
+_INLINE_COMMENT = re.compile(r"\s+[#;].*$")
+# a pin of the linux host mcu may name its chip, e.g. host:gpiochip0/gpio20
+_PIN = re.compile(r"^[\^~!\s]*([A-Za-z_]\w*\s*:\s*)?[A-Za-z0-9_./]+$")
+_FLOAT = re.compile(r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+_INT = re.compile(r"^[-+]?\d+$")
+
+
+def _diagnostic(row, severity, message, section, option=None):
+    return dict(row=row, column=0, severity=severity, message=message,
+                section=section, option=option)
+
+
+def _check_value(option, value):
+    """Return the severity and the message of a type error of an option or None."""
+    if option in FLOAT_OPTIONS:
+        if not _FLOAT.match(value):
+            return ERROR, "{} must be a number, got '{}'".format(option, value)
+    elif option in INT_OPTIONS:
+        if not _INT.match(value):
+            return ERROR, "{} must be an integer, got '{}'".format(option, value)
+    elif option in ENUM_OPTIONS:
+        if value.lower() not in ENUM_OPTIONS[option]:
+            if option in OPEN_ENUM_OPTIONS:
+                return WARNING, "{} '{}' is unknown, expected one of {}".format(
+                    option, value, ", ".join(ENUM_OPTIONS[option]))
+            return ERROR, "{} must be one of {}, got '{}'".format(
+                option, ", ".join(ENUM_OPTIONS[option]), value)
+    elif option == "pin" or option.endswith("_pin"):
+        if not _PIN.match(value):
+            return ERROR, "{} is not a valid pin, got '{}'".format(option, value)
+    return None
+
+
+def validate_section(key, lines):
+    """Validate the lines of one section.
+
+    Returns:
+        list: The diagnostics with the rows relative to the first line.
+    """
+    diagnostics = []
+    section = key.split("#", 1)[0]
+    typed = section.split(" ", 1)[0] not in UNTYPED_SECTIONS
+    options = set()
+    current = None
+    for row, line in enumerate(lines):
+        if key and row == 0:
+            # the header
+            if not _INLINE_COMMENT.sub("", line).rstrip().endswith("]"):
+                diagnostics.append(_diagnostic(row, ERROR, "Invalid section header", section))
+            continue
+        stripped = line.strip()
+        if not stripped or stripped[0] in "#;":
+            continue
+        if line[0] in " \t":
+            # continues the value of the current option
+            if current is None:
+                diagnostics.append(_diagnostic(row, ERROR, "Indented line without an option", section))
+            continue
+        match = _OPTION.match(line)
+        if match is None:
+            diagnostics.append(_diagnostic(
+                row, ERROR, "Invalid line, expected 'option: value'", section))
+            current = None
+            continue
+        option = match.group(1).lower()
+        if not key:
+            diagnostics.append(_diagnostic(
+                row, ERROR, "Option '{}' outside of a section".format(option), None, option))
+        if option in options:
+            diagnostics.append(_diagnostic(
+                row, WARNING, "Option '{}' is set more than once, the last value is used".format(
+                    option), section, option))
+        options.add(option)
+        current = option
+        value = _INLINE_COMMENT.sub("", match.group(2)).strip()
+        if typed and value:
+            # only single line values have a type
+            error = _check_value(option, value)
+            if error is not None:
+                diagnostics.append(_diagnostic(row, error[0], error[1], section, option))
+    return diagnostics
+
+
+class ConfigValidator(object):
+    """Validates configs section by section and caches the results.
+
+    The diagnostics of every section are cached by the hash of its lines,
+    per file, so after an edit only the changed sections are validated
+    again. The cache of a file holds the sections of its latest version
+    and up to MAX_FILES files are kept.
+    """
+
+    MAX_FILES = 10
+
+    def __init__(self, max_files=MAX_FILES):
+        self._max_files = max_files
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate(self, content, filename=None):
+        """Validate a config.
+
+        Returns:
+            dict: is_syntax_ok, diagnostics (row, column, severity,
+                message, section, option) sorted by row, the number of
+                sections and how many of them were validated again.
+        """
+        lines = content.splitlines()
+        with self._lock:
+            cached = self._files.pop(filename, {}) if filename else {}
+        results = {}
+        diagnostics = []
+        validated = 0
+        sections = split_sections(lines)
+        for key, start, section_lines in sections:
+            digest = hashlib.sha1(
+                "\n".join([key] + section_lines).encode("utf-8")).hexdigest()
+            result = cached.get(digest)
+            if result is None:
+                result = results.get(digest)
+            if result is None:
+                result = validate_section(key, section_lines)
+                validated += 1
+            results[digest] = result
+            for diagnostic in result:
+                diagnostic = dict(diagnostic)
+                diagnostic["row"] += start
+                diagnostics.append(diagnostic)
+        if filename:
+            with self._lock:
+                self._files[filename] = results
+                while len(self._files) > self._max_files:
+                    self._files.popitem(last=False)
+        return dict(
+            is_syntax_ok=not any(d["severity"] == ERROR for d in diagnostics),
+            diagnostics=diagnostics,
+            sections=len(sections),
+            validated=validated
+        )
+
+    def forget(self, filename):
+        with self._lock:
+            self._files.pop(filename, None)
@@ -0,0 +1,135 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import threading
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class FileIndex(object):
+    """In-memory listing of the files in a folder.
+
+    The folder is read with a single scandir pass and read again only
+    after a change. Changes are reported by watchdog if it is available,
+    otherwise a changed mtime of the folder triggers the next scan. Writes
+    that keep the mtime of the folder, like overwriting a file in place,
+    have to call invalidate().
+    """
+
+    def __init__(self, folder, suffix="", observer=None):
+        self.folder = folder
+        self.suffix = suffix
+        self._files = None
+        self._folder_mtime = None
+        self._dirty = True
+        self._watch = None
+        self._lock = threading.Lock()
+        if observer is not None and os.path.isdir(folder):
+            try:
+                self._watch = observer.schedule(_ChangeHandler(self), folder, recursive=False)
+            except Exception:
+                # e.g. out of inotify watches, the mtime check still works
+                self._watch = None
+
+    def invalidate(self):
+        self._dirty = True
+
+    def files(self):
+        """Return a dict of name, file, bytes and date (mtime) for every file."""
+        with self._lock:
+            if self._watch is None:
+                try:
+                    mtime = os.stat(self.folder).st_mtime
+                except OSError:
+                    mtime = None
+                if mtime != self._folder_mtime:
+                    self._folder_mtime = mtime
+                    self._dirty = True
+            if self._dirty or self._files is None:
+                # cleared before the scan, so changes during it are not lost
+                self._dirty = False
+                self._files = self._scan()
+            return self._files
+
+    def unwatch(self, observer):
+        if self._watch is not None:
+            observer.unschedule(self._watch)
+            self._watch = None
+
+    def _matches(self, name):
+        # like glob, hidden files are left out
+        return not name.startswith(".") and name.endswith(self.suffix)
+
+    def _scan(self):
+        files = []
+        if not os.path.isdir(self.folder):
+            return files
+        if scandir is not None:
+            for entry in scandir(self.folder):
+                if not self._matches(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append(self._entry(entry.name, entry.path, stat))
+        else:
+            for name in os.listdir(self.folder):
+                path = os.path.join(self.folder, name)
+                if not self._matches(name) or not os.path.isfile(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append(self._entry(name, path, stat))
+        return files
+
+    @staticmethod
+    def _entry(name, path, stat):
+        return dict(name=name, file=path, bytes=stat.st_size, date=stat.st_mtime)
+
+
+class _ChangeHandler(FileSystemEventHandler):
+
+    def __init__(self, index):
+        self._index = index
+
+    def on_any_event(self, event):
+        self._index.invalidate()
+
+
+def create_observer():
+    """Return a started watchdog observer or None if watchdog is not available."""
+    if Observer is None:
+        return None
+    observer = Observer()
+    observer.daemon = True
+    observer.start()
+    return observer
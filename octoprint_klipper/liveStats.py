@@ -0,0 +1,229 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import threading
+import time
+from collections import deque
+
+from octoprint_klipper.util import log_event, send_message
+from octoprint_klipper.modules.KlipperLogAnalyzer import KlipperLogAnalyzer
+from octoprint_klipper.modules.KlipperStatsStore import KlipperStatsStore
+
+
+class LiveStats(object):
+    """Follows the active klippy.log and pushes new Stats samples.
+
+    The log is read from the last position every INTERVAL seconds. The
+    points of the last WINDOW seconds are kept in a ring buffer and only
+    the new points are sent, as plugin message "stats" / "live" in the
+    format of the performance graph plus the print stalls and the
+    retransmitted bytes of every point, and the id of the printer.
+
+    Following the log runs while at least one client holds a lease, which
+    the client renews every LEASE / 2 seconds while its live view is on.
+    """
+
+    INTERVAL = 2.
+    WINDOW = 600.
+    LEASE = 60.
+    # read when following starts, to fill the window
+    PREFILL_BYTES = 2 * 1024 * 1024
+
+    def __init__(self, plugin, log_file, printer_id, interval=INTERVAL, window=WINDOW):
+        self._plugin = plugin
+        self._log_file = log_file
+        self._printer_id = printer_id
+        self._interval = interval
+        self._window = window
+        # Klippy logs one Stats line per second
+        self._points = deque(maxlen=int(window) + 1)
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self._points.clear()
+        self._offset = None
+        self._file_id = None
+        self._last = None
+        self._basetime = None
+
+    # -- leases
+
+    def subscribe(self, client_id):
+        """Start or renew the lease of a client.
+
+        Returns:
+            dict: The points in the window, like the deltas.
+        """
+        with self._lock:
+            self._leases[client_id] = time.time() + self.LEASE
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="OctoKlipper live stats")
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+        return self.snapshot()
+
+    def unsubscribe(self, client_id):
+        with self._lock:
+            self._leases.pop(client_id, None)
+
+    def shutdown(self):
+        with self._lock:
+            self._leases.clear()
+        self._wakeup.set()
+
+    def _active(self):
+        now = time.time()
+        with self._lock:
+            for client_id, expires in list(self._leases.items()):
+                if expires < now:
+                    del self._leases[client_id]
+            if not self._leases:
+                self._thread = None
+                self._reset()
+                return False
+            return True
+
+    def _work(self):
+        log_event(self._plugin, "live_stats_started", log_file=self._log_file())
+        while self._active():
+            try:
+                points = self.poll()
+                if points is not None:
+                    points["printer"] = self._printer_id
+                    send_message(self._plugin, type="stats", subtype="live", payload=points)
+            except Exception:
+                self._plugin._logger.exception("Following the klippy log failed")
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+        log_event(self._plugin, "live_stats_stopped")
+
+    # -- points
+
+    def snapshot(self):
+        with self._lock:
+            return self._columns(list(self._points))
+
+    def poll(self):
+        """Read the samples added to the log since the last call.
+
+        Returns:
+            dict: The new points or None if there are none.
+        """
+        log_file = self._log_file()
+        try:
+            stat = os.stat(log_file)
+        except OSError:
+            return None
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._offset:
+            # first read, or the log was rotated or truncated
+            with self._lock:
+                self._reset()
+            self._file_id = file_id
+            self._offset = max(0, stat.st_size - self.PREFILL_BYTES)
+        if stat.st_size == self._offset:
+            return None
+
+        analyzer = KlipperLogAnalyzer(log_file)
+        samples = analyzer.parse_log(log_file, self._offset)
+        self._offset = analyzer.offset
+        if not len(samples):
+            return None
+        if self._basetime is None:
+            self._basetime = samples.times[0]
+        store = KlipperStatsStore()
+        if self._last is not None:
+            # the previous sample is the base of the deltas of the first new one
+            store.extend(self._last)
+        store.extend(samples)
+        self._last = samples.tail(1)
+
+        points = self._points_of(analyzer, store)
+        if not points:
+            return None
+        start = points[-1]["time"] - self._window
+        points = [point for point in points if point["time"] >= start]
+        with self._lock:
+            self._points.extend(points)
+            while self._points and self._points[0]["time"] < start:
+                self._points.popleft()
+        return self._columns(points)
+
+    def _points_of(self, analyzer, store):
+        plot = analyzer.plot_mcu(store, analyzer.MAXBANDWIDTH, basetime=self._basetime)
+        if not plot:
+            return []
+        # the samples of the plot, its times are a subsequence of the store
+        rows = []
+        i = 0
+        for st in plot["times"]:
+            while store.times[i] != st:
+                i += 1
+            rows.append(i)
+            i += 1
+        print_stalls = store.column("print_stall")
+        retransmits = [store.column(name + ":bytes_retransmit") for name in plot["mcus"]]
+        points = []
+        last = 0
+        for n, i in enumerate(rows):
+            points.append(dict(
+                time=plot["times"][n],
+                buffer=plot["buffers"][n],
+                mcus=dict((name, dict(
+                    load=series["loads"][n],
+                    bwdelta=series["bwdeltas"][n],
+                    awake=series["awake"][n]
+                )) for name, series in plot["mcus"].items()),
+                # counters start again after a restart of klippy
+                stalls=int(max(0., print_stalls[i] - print_stalls[last])),
+                retransmits=int(sum(max(0., column[i] - column[last]) for column in retransmits))
+            ))
+            last = i
+        return points
+
+    @staticmethod
+    def _columns(points):
+        """Return the points in the format of the plot of the graph."""
+        mcus = {}
+        for n, point in enumerate(points):
+            for name, values in point["mcus"].items():
+                series = mcus.get(name)
+                if series is None:
+                    series = mcus[name] = dict(
+                        loads=[None] * n, bwdeltas=[None] * n, awake=[None] * n)
+                series["loads"].append(values["load"])
+                series["bwdeltas"].append(values["bwdelta"])
+                series["awake"].append(values["awake"])
+            for series in mcus.values():
+                if len(series["loads"]) <= n:
+                    for key in ("loads", "bwdeltas", "awake"):
+                        series[key].append(None)
+        main = KlipperLogAnalyzer.DEFAULT_MCU
+        return dict(
+            times=[point["time"] for point in points],
+            buffers=[point["buffer"] for point in points],
+            stalls=[point["stalls"] for point in points],
+            retransmits=[point["retransmits"] for point in points],
+            mcu=main if main in mcus or not mcus else sorted(mcus)[0],
+            mcus=mcus,
+            frequency={}
+        )
@@ -0,0 +1,168 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from octoprint_klipper.util import log_error, log_event, send_message
+from octoprint_klipper.printers import get_printers, get_log_path
+from octoprint_klipper.modules.KlipperLogAnalyzer import KlipperLogAnalyzer, AnalysisCancelled
+from octoprint_klipper.modules.KlipperResultCache import KlipperResultCache
+
+
+class LogAnalysisJob(object):
+
+    def __init__(self, key, cache_key, log_file, params):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.cache_key = cache_key
+        self.log_file = log_file
+        self.params = params
+        self.subscribers = 1
+        self.cancelled = False
+        self.progress = 0
+        self.last_progress_sent = 0.
+
+
+class LogAnalysisJobs(object):
+    """Runs the analysis of klippy logs on a bounded thread pool.
+
+    Progress and results are pushed to the frontend as plugin messages of
+    type "stats" carrying the id of the job. Requests for the same log with
+    the same parameters share one job while it is running, and finished
+    results are kept in a KlipperResultCache. Only the results of rotated
+    logs are written to its disk tier, the klippy.log of a printer keeps
+    growing.
+    """
+
+    MAX_WORKERS = 2
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, plugin, index_folder, cache_folder=None, max_workers=MAX_WORKERS):
+        self._plugin = plugin
+        self._index_folder = index_folder
+        self.cache = KlipperResultCache(cache_folder=cache_folder)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get_cached(self, log_file, **params):
+        """Return the cached result of an analysis or None."""
+        result = self.cache.get(KlipperResultCache.make_key(log_file, **params))
+        if result is not None:
+            log_event(self._plugin, "log_analysis_cache_hit", log_file=log_file, **params)
+        return result
+
+    def submit(self, log_file, **params):
+        """Start the analysis of a log, or join a running one.
+
+        Returns:
+            str: The id of the job.
+        """
+        key = (log_file, tuple(sorted(params.items())))
+        cache_key = KlipperResultCache.make_key(log_file, **params)
+        with self._lock:
+            job_id = self._keys.get(key)
+            if job_id is not None:
+                job = self._jobs[job_id]
+                job.subscribers += 1
+                log_event(self._plugin, "log_analysis_joined", job_id=job_id, subscribers=job.subscribers)
+                return job_id
+            job = LogAnalysisJob(key, cache_key, log_file, params)
+            self._jobs[job.id] = job
+            self._keys[key] = job.id
+        self._executor.submit(self._run, job)
+        log_event(self._plugin, "log_analysis_started", job_id=job.id, log_file=log_file, **params)
+        return job.id
+
+    def cancel(self, job_id):
+        """Leave a job. It is stopped once no one is waiting for it anymore.
+
+        Returns:
+            bool: True if the job was running.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.subscribers -= 1
+            if job.subscribers <= 0:
+                job.cancelled = True
+            return True
+
+    def is_active_log(self, log_file):
+        """Return True if the log is the klippy.log of a printer, which
+        Klippy still writes to.
+        """
+        path = os.path.realpath(log_file)
+        return any(
+            os.path.realpath(get_log_path(printer)) == path
+            for printer in get_printers(self._plugin) if printer["logpath"]
+        )
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancelled = True
+        self._executor.shutdown(wait=False)
+
+    def _send(self, job, subtype, **payload):
+        payload["jobId"] = job.id
+        send_message(self._plugin, type="stats", subtype=subtype, payload=payload)
+
+    def _on_progress(self, job, position, size):
+        if job.cancelled:
+            raise AnalysisCancelled()
+        progress = int(100 * position / size) if size else 100
+        now = time.time()
+        if progress != job.progress and now - job.last_progress_sent >= self.PROGRESS_INTERVAL:
+            job.progress = progress
+            job.last_progress_sent = now
+            self._send(job, "progress", progress=progress)
+
+    def _run(self, job):
+        subtype = "result"
+        payload = {}
+        try:
+            self._send(job, "progress", progress=0)
+            analyzer = KlipperLogAnalyzer(
+                job.log_file,
+                index_folder=self._index_folder,
+                progress=lambda position, size: self._on_progress(job, position, size)
+            )
+            payload["result"] = analyzer.analyze(**job.params)
+            self.cache.put(job.cache_key, payload["result"],
+                           persist=not self.is_active_log(job.log_file))
+        except AnalysisCancelled:
+            log_event(self._plugin, "log_analysis_cancelled", job_id=job.id)
+            subtype = "cancelled"
+        except Exception as error:
+            self._plugin._logger.exception("Log analysis of {} failed".format(job.log_file))
+            log_error(self._plugin, "Log analysis of {} failed: {}".format(job.log_file, error))
+            subtype = "error"
+            payload["error"] = str(error)
+
+        # a request arriving from now on starts a new job instead of
+        # joining one whose result was already sent
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            if self._keys.get(job.key) == job.id:
+                del self._keys[job.key]
+        self._send(job, subtype, **payload)
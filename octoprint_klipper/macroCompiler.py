@@ -0,0 +1,192 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import re
+import threading
+
+TYPES = ("int", "float", "enum", "string")
+
+# a parameter like {label:Target Temperature, unit:C, default:190}
+_PARAM = re.compile(r"{(.*?)}")
+_KEY_VALUE = re.compile("(\\w*)\\s*:\\s*([\\w\\s\u00b0\"|.+\\-]*)")
+_LINES = re.compile(r"\r\n|\r|\n")
+_INT = re.compile(r"^[-+]?\d+$")
+_FLOAT = re.compile(r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+
+
+def _number(value):
+    return float(value) if value is not None and _FLOAT.match(value) else None
+
+
+def compile_param(text, number):
+    """Parse the text between the braces of a parameter into its schema.
+
+    The type is given by type, or is enum with options, float with a
+    numeric default and string otherwise.
+
+    Returns:
+        dict: label, unit, type, default, options, min and max.
+    """
+    fields = {}
+    for key, value in _KEY_VALUE.findall(text):
+        if key:
+            fields[key] = value.strip()
+    options = [o.strip() for o in fields["options"].split("|")] if "options" in fields else None
+    default = fields.get("default")
+    param_type = fields.get("type")
+    if param_type not in TYPES:
+        if options is not None:
+            param_type = "enum"
+        elif default is not None and _FLOAT.match(default):
+            param_type = "float"
+        else:
+            param_type = "string"
+    return dict(
+        label=fields.get("label") or "Input {}".format(number),
+        unit=fields.get("unit", ""),
+        type=param_type,
+        default=default,
+        options=options,
+        min=_number(fields.get("min")),
+        max=_number(fields.get("max")),
+    )
+
+
+def compile_macro(text):
+    """Compile the text of a macro.
+
+    Returns:
+        dict: parts, the text between the parameters, and params, the
+            schema of every parameter, so parts[n] comes before params[n].
+    """
+    split = _PARAM.split(text)
+    params = [compile_param(param, n + 1) for n, param in enumerate(split[1::2])]
+    return dict(parts=split[0::2], params=params)
+
+
+def check_value(param, value):
+    """Validate the value of a parameter.
+
+    Returns:
+        tuple: The value as text and None, or None and the error message.
+    """
+    if value is None or "{}".format(value).strip() == "":
+        if param["default"] is None:
+            return None, "A value is required"
+        value = param["default"]
+    value = "{}".format(value).strip()
+    if _LINES.search(value):
+        return None, "The value must be a single line"
+    if param["type"] == "enum":
+        if not param["options"]:
+            return None, "The parameter has no options"
+        if value not in param["options"]:
+            return None, "The value must be one of {}".format(", ".join(param["options"]))
+        return value, None
+    if param["type"] == "int" and not _INT.match(value):
+        return None, "The value must be an integer"
+    if param["type"] == "float" and not _FLOAT.match(value):
+        return None, "The value must be a number"
+    if param["type"] in ("int", "float"):
+        if param["min"] is not None and float(value) < param["min"]:
+            return None, "The value must be at least {:g}".format(param["min"])
+        if param["max"] is not None and float(value) > param["max"]:
+            return None, "The value must be at most {:g}".format(param["max"])
+    return value, None
+
+
+def expand_macro(compiled, values):
+    """Put the values of the parameters into a compiled macro.
+
+    Args:
+        compiled (dict): The result of compile_macro.
+        values (list): The values of the parameters in their order, missing
+            values take the default.
+
+    Returns:
+        tuple: The G-code lines and the errors, a list of param (the
+            index) and message. There are no lines if there are errors.
+    """
+    values = list(values or [])
+    values += [None] * (len(compiled["params"]) - len(values))
+    text = [compiled["parts"][0]]
+    errors = []
+    for n, param in enumerate(compiled["params"]):
+        value, error = check_value(param, values[n])
+        if error is not None:
+            errors.append(dict(param=n, message=error))
+            continue
+        text.append(value)
+        text.append(compiled["parts"][n + 1])
+    if errors:
+        return [], errors
+    return _LINES.split("".join(text)), []
+
+
+class MacroCache(object):
+    """The compiled macros of the settings.
+
+    Macros are compiled when the settings are loaded or saved, a macro with
+    an unchanged text keeps its compiled form. Names need not be unique, so
+    every macro gets an id from its position, name and text, which no
+    longer matches once the macro was changed or moved.
+    """
+
+    def __init__(self):
+        self._compiled = {}
+        self._macros = []
+        self._lock = threading.Lock()
+
+    def update(self, macros):
+        """Compile the macros of the settings.
+
+        Returns:
+            int: The number of macros that were compiled again.
+        """
+        with self._lock:
+            cache = self._compiled
+        compiled = {}
+        entries = []
+        count = 0
+        for n, macro in enumerate(macros or []):
+            name = macro.get("name") or ""
+            text = macro.get("macro") or ""
+            entry = compiled.get(text) or cache.get(text)
+            if entry is None:
+                entry = compile_macro(text)
+                count += 1
+            compiled[text] = entry
+            digest = hashlib.sha1("{}\n{}".format(name, text).encode("utf-8")).hexdigest()
+            entries.append(("{}-{}".format(n, digest[:8]), name, entry))
+        with self._lock:
+            self._compiled = compiled
+            self._macros = entries
+        return count
+
+    def get(self, macro_id):
+        """Return the compiled macro with the id or None."""
+        with self._lock:
+            for entry_id, _, entry in self._macros:
+                if entry_id == macro_id:
+                    return entry
+        return None
+
+    def schemas(self):
+        """Return the id, the name and the params of every macro, in their order."""
+        with self._lock:
+            return [dict(id=macro_id, name=name, params=entry["params"])
+                    for macro_id, name, entry in self._macros]
@@ -0,0 +1,179 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
+import time
+from collections import deque
+
+from octoprint_klipper.printerState import merge_deltas
+
+
+class MessageBus(object):
+    """Collects the plugin messages to the frontend and sends them in batches.
+
+    Messages posted within INTERVAL seconds are sent as one message of type
+    "batch" holding them in its payload. Messages with a coalesce key
+    replace a pending message with the same key, so only the latest status
+    is sent, the deltas of the printer state are merged instead. Once
+    MAX_PENDING messages are waiting, debug messages are dropped and any
+    other message makes the posting thread send the pending batch itself.
+
+    The latest messages of type "log" are kept in a ring buffer with an
+    increasing id, so the frontend can load the history after a reload.
+    """
+
+    INTERVAL = 0.1
+    MAX_PENDING = 500
+    HISTORY_SIZE = 500
+
+    def __init__(self, plugin, interval=INTERVAL, max_pending=MAX_PENDING, history_size=HISTORY_SIZE):
+        self._plugin = plugin
+        self._interval = interval
+        self._max_pending = max_pending
+        self._pending = []
+        self._coalesced = {}
+        self._history = deque(maxlen=max(1, history_size))
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = True
+        self.sent = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._work, name="OctoKlipper message bus")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @staticmethod
+    def coalesce_key(message):
+        if message["type"] == "status":
+            return "status"
+        if message["type"] == "stats" and message["subtype"] == "progress":
+            return "stats:progress:{}".format(message["payload"]["jobId"])
+        if message["type"] == "printer_state":
+            return "printer_state"
+        return None
+
+    @staticmethod
+    def merge(pending, message):
+        """Return the message that takes the place of a pending message
+        with the same coalesce key.
+        """
+        if message["type"] == "printer_state":
+            return dict(message, payload=merge_deltas(pending["payload"], message["payload"]))
+        return message
+
+    def post(self, message):
+        key = self.coalesce_key(message)
+        with self._lock:
+            if message["type"] == "log" and "id" not in message:
+                message["id"] = self._next_id
+                self._next_id += 1
+                self._history.append(message)
+            if key is not None and key in self._coalesced:
+                index = self._coalesced[key]
+                self._pending[index] = self.merge(self._pending[index], message)
+                return
+            if len(self._pending) >= self._max_pending:
+                if message["subtype"] == "debug":
+                    self.dropped += 1
+                    return
+                full = True
+            else:
+                full = False
+                if key is not None:
+                    self._coalesced[key] = len(self._pending)
+                self._pending.append(message)
+        if full:
+            self.flush()
+            self.post(message)
+        else:
+            self._wakeup.set()
+
+    def flush(self):
+        """Send all pending messages now."""
+        with self._send_lock:
+            with self._lock:
+                messages = self._pending
+                dropped = self.dropped
+                self._pending = []
+                self._coalesced = {}
+                self.dropped = 0
+            if dropped:
+                messages.append(dict(
+                    time=time.strftime("%H:%M:%S"),
+                    type="console",
+                    subtype="debug",
+                    title="",
+                    payload="{} debug messages dropped".format(dropped)
+                ))
+            if not messages:
+                return
+            if len(messages) == 1:
+                message = messages[0]
+            else:
+                message = dict(type="batch", subtype="", title="", payload=messages)
+            self._plugin._plugin_manager.send_plugin_message(self._plugin._identifier, message)
+            self.sent += 1
+
+    def set_history_size(self, size):
+        with self._lock:
+            if size != self._history.maxlen:
+                self._history = deque(self._history, maxlen=max(1, size))
+
+    def history(self, before=None, limit=100):
+        """Return a page of the kept log messages, oldest first.
+
+        Args:
+            before (int, optional): Only return messages with a lower id.
+            limit (int): The maximum number of messages, the newest are
+                returned if there are more.
+
+        Returns:
+            dict: messages, the id of the oldest kept message in first_id
+                and the size of the ring buffer in capacity.
+        """
+        with self._lock:
+            messages = [message for message in self._history
+                        if before is None or message["id"] < before]
+            first_id = self._history[0]["id"] if self._history else None
+            capacity = self._history.maxlen
+        return dict(
+            messages=messages[-limit:] if limit > 0 else [],
+            first_id=first_id,
+            capacity=capacity
+        )
+
+    def clear_history(self):
+        with self._lock:
+            self._history.clear()
+
+    def shutdown(self):
+        self._running = False
+        self._wakeup.set()
+        self._thread.join(1.)
+        self.flush()
+
+    def _work(self):
+        while self._running:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # collect what is posted within the interval
+            time.sleep(self._interval)
+            try:
+                self.flush()
+            except Exception:
+                self._plugin._logger.exception("Sending messages to the frontend failed")
@@ -13,9 +13,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import flask
-import optparse, datetime
-from octoprint_klipper.util import log_error
+import bisect
+import logging
+import os
+from .KlipperLogFile import DECOMPRESSION_ERRORS, KlipperLogFile, uncompressed_size
+from .KlipperLogIndex import KlipperLogIndex
+from .KlipperStatsStore import KlipperStatsStore
+
+class AnalysisCancelled(Exception):
+   pass
 
 class KlipperLogAnalyzer():
    MAXBANDWIDTH=25000.
@@ -24,76 +30,377 @@ class KlipperLogAnalyzer():
    TASK_MAX=0.0025
    APPLY_PREFIX = ['mcu_awake', 'mcu_task_avg', 'mcu_task_stddev', 'bytes_write',
                    'bytes_read', 'bytes_retransmit', 'freq', 'adj']
+   DEFAULT_MCU = 'mcu'
+   CHECKPOINT_INTERVAL = 120.
+   SESSION_IDLE_GAP = 60.
+   CHUNK_SIZE = 64 * 1024
+   LOG_PAGE_SIZE = 256 * 1024
 
-   def __init__(self, log_file):
+   def __init__(self, log_file, chunk_size=CHUNK_SIZE, index_folder=None, progress=None):
+      """
+      Args:
+         log_file (str): Path of the klippy.log to analyze.
+         chunk_size (int): Number of bytes read from the log at once.
+         index_folder (str, optional): Folder for the sidecar index of the log.
+         progress (callable, optional): Called with the bytes read and the
+            size of the log after every chunk. It may raise AnalysisCancelled
+            to stop the analysis.
+      """
       self.log_file = log_file
+      self.chunk_size = chunk_size
+      self.index_folder = index_folder
+      self.progress = progress
+      self.offset = 0
+      self.restart = False
+      self._logger = logging.getLogger("octoprint.plugins.klipper.analyzer")
+
+   def iter_lines(self, logname, offset=0):
+      """Yield the lines of a log file as bytes, reading it in fixed-size chunks.
+
+      An unterminated last line is still being written by Klippy and is
+      left for the next read. `self.offset` is the position after the last
+      line yielded.
+      """
+      self.offset = offset
+      with KlipperLogFile(logname) as f:
+         size = f.raw_size()
+         f.seek(offset)
+         remainder = b''
+         while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+               break
+            if self.progress:
+               self.progress(f.raw_position(), size)
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            for line in lines:
+               self.offset += len(line) + 1
+               yield line
+
+   def read_log_file(self, logname, offset=0, limit=LOG_PAGE_SIZE):
+      """Read one page of the raw log text.
+
+      The page ends on a line boundary unless a single line is longer than
+      `limit`. `next_offset` is the position to continue reading from.
+      Offsets and size refer to the decompressed text of compressed logs,
+      size is None if the compressed format does not record it.
+      """
+      size = uncompressed_size(logname)
+      if size is not None:
+         offset = min(offset, size)
+      with KlipperLogFile(logname) as f:
+         f.seek(offset)
+         chunk = f.read(limit)
+      eof = len(chunk) < limit or (size is not None and offset + len(chunk) >= size)
+      if not eof:
+         cut = chunk.rfind(b'\n')
+         if cut >= 0:
+            chunk = chunk[:cut + 1]
+      return dict(
+         data=chunk.decode('utf-8', 'replace'),
+         offset=offset,
+         next_offset=offset + len(chunk),
+         size=size,
+         eof=eof
+      )
+
+   def analyze(self, max_points=None, time_from=None, time_to=None):
+      """Analyze the log file.
+
+      Args:
+         max_points (int, optional): Upper limit for the number of points
+            returned per series. Defaults to all points.
+         time_from (float, optional): Only return points from this sample time on.
+         time_to (float, optional): Only return points up to this sample time.
 
-   def read_log_file(self, logname):
+      Returns:
+         dict: plot with the series or an error, sessions with the print
+            sessions overlapping the requested time range.
+      """
+      summary = None
+      sessions = []
+      error = None
       try:
-         f = open(logname, 'r')
-         logdata = f.read()
-         f.close()
-      except IOError:
-         print("Couldn't open log file")
-      return logdata
-
-   def analyze(self):
-      data = self.parse_log(self.log_file, None)
-      if not data:
-         result1 = dict(error= "No relevant data available in \"{}\"".format(self.log_file))
+         window = None
+         if self.index_folder and (time_from is not None or time_to is not None):
+            window = self.load_window_stats(time_from, time_to)
+         if window is not None:
+            store, basetime = window
+            # the sessions and the range of the whole log, not of the window
+            summary = self.load_indexed_summary()
+         elif self.index_folder:
+            size = os.path.getsize(self.log_file)
+            store = self.load_indexed_stats()
+            basetime = None
+         else:
+            store = self.parse_log(self.log_file)
+            basetime = None
+         result = self.plot_mcu(store, self.MAXBANDWIDTH, basetime=basetime)
+         if self.index_folder and window is None and result:
+            summary = self.summarize(result)
+            self.save_indexed_summary(size, summary)
+      except DECOMPRESSION_ERRORS as e:
+         # before IOError, BadGzipFile is one
+         self._logger.error("Couldn't decompress log file {}: {}".format(self.log_file, e))
+         result = None
+         error = "The compressed log file \"{}\" is truncated or corrupt".format(self.log_file)
+      except (IOError, OSError):
+         self._logger.error("Couldn't open log file: {}".format(self.log_file))
+         result = None
+      if not result:
+         result = dict(error= error or "No relevant data available in \"{}\"".format(self.log_file))
       else:
-         result1 = self.plot_mcu(data, self.MAXBANDWIDTH)
-      result = dict(plot = result1,
-                    logfiledata = self.read_log_file(self.log_file)
-                  )
-      return result
+         if summary is None:
+            summary = self.summarize(result)
+         result.pop('sessions')
+         if summary['range']:
+            result['range'] = summary['range']
+         sessions = [session for session in summary['sessions']
+                     if (time_from is None or session['end'] >= time_from)
+                     and (time_to is None or session['start'] <= time_to)]
+         result = self.select_window(result, time_from, time_to)
+         result['samples'] = len(result['times'])
+         if max_points:
+            result = self.downsample(result, max_points)
+      return dict(plot = result, sessions = sessions)
 
-   def parse_log(self, logname, mcu):
-      if mcu is None:
-         mcu = "mcu"
-      mcu_prefix = mcu + ":"
-      apply_prefix = { p: 1 for p in self.APPLY_PREFIX }
-      out = []
+   @staticmethod
+   def _groups(plot):
+      # the main series and the frequency series of every mcu have their own times
+      return [plot] + list(plot.get('frequency', {}).values())
 
-      try:
-         f = open(logname, 'r')
+   @staticmethod
+   def _group_series(group):
+      """Return (container, key) of every series sharing the times of a group."""
+      size = len(group['times'])
+      found = []
+      containers = [group]
+      while containers:
+         container = containers.pop()
+         for key, values in container.items():
+            if key == 'times':
+               continue
+            if isinstance(values, list) and len(values) == size:
+               found.append((container, key))
+            elif isinstance(values, dict) and 'times' not in values:
+               containers.append(values)
+      return found
+
+   def _select(self, group, indices):
+      for container, key in self._group_series(group) + [(group, 'times')]:
+         values = container[key]
+         container[key] = [values[i] for i in indices]
+
+   def select_window(self, plot, time_from=None, time_to=None):
+      """Keep only the points of the plot between time_from and time_to."""
+      if time_from is None and time_to is None:
+         return plot
+      if time_from is None:
+         time_from = float('-inf')
+      if time_to is None:
+         time_to = float('inf')
+      for group in self._groups(plot):
+         self._select(group, [i for i, st in enumerate(group['times'])
+                              if time_from <= st <= time_to])
+      return plot
+
+   def downsample(self, plot, max_points):
+      """Reduce the points of all series to at most max_points.
+
+      The points are split into buckets and the minimum and maximum of
+      every series are kept for each bucket, so spikes like buffer runoffs
+      stay visible. Series sharing their times keep sharing them.
+      """
+      for group in self._groups(plot):
+         size = len(group['times'])
+         if size <= max_points:
+            continue
+         series = self._group_series(group)
+         buckets = max(1, max_points // (2 * max(1, len(series))))
+         selected = set()
+         for bucket in range(buckets):
+            start = bucket * size // buckets
+            end = (bucket + 1) * size // buckets
+            for container, key in series:
+               chunk = [(v, i) for i, v in enumerate(container[key][start:end]) if v is not None]
+               if chunk:
+                  selected.add(start + min(chunk)[1])
+                  selected.add(start + max(chunk)[1])
+         self._select(group, sorted(selected))
+      return plot
+
+   def load_indexed_stats(self):
+      """Return the Stats samples of the log using the sidecar index.
+
+      Only the part of the log appended since the last call is parsed, the
+      samples before it are read from the index.
+      """
+      index = KlipperLogIndex(self.index_folder, self.log_file)
+      with index.lock:
+         index.load()
+         store = index.load_store()
+         checkpoints = []
+         # continue where the last parse stopped, with the time of its last
+         # sample and a restart line not followed by a sample yet
+         tail = self.parse_log(self.log_file, index.offset, checkpoints=checkpoints,
+                               last_sampletime=index.meta["end_time"],
+                               restart=index.meta["restart"])
+         store.extend(tail)
+         index.append(tail, self.offset, store, checkpoints, self.restart)
+      return store
+
+   @staticmethod
+   def summarize(plot):
+      """Return the sessions and the time range of a plot of the whole log."""
+      times = plot['times']
+      return dict(
+         sessions= plot['sessions'],
+         range= dict(start=times[0], end=times[-1]) if times else None
+      )
+
+   def load_indexed_summary(self):
+      """Return the summary of the whole log for an analysis of a time range.
+
+      The summary stored in the sidecar index is used while the log did not
+      change, otherwise the index is brought up to date and the summary is
+      computed from all samples, so sessions are never cut at the edges of
+      the time range.
+      """
+      index = KlipperLogIndex(self.index_folder, self.log_file)
+      size = os.path.getsize(self.log_file)
+      with index.lock:
+         if index.load():
+            summary = index.meta.get("summary")
+            if summary is not None and summary["size"] == size:
+               return summary
+      plot = self.plot_mcu(self.load_indexed_stats(), self.MAXBANDWIDTH)
+      summary = self.summarize(plot) if plot else dict(sessions=[], range=None)
+      self.save_indexed_summary(size, summary)
+      return summary
+
+   def save_indexed_summary(self, size, summary):
+      """Store the summary of the log with the size of the log it is valid for."""
+      index = KlipperLogIndex(self.index_folder, self.log_file)
+      with index.lock:
+         if index.load():
+            index.meta["summary"] = dict(summary, size=size)
+            index.save()
+
+   def load_window_stats(self, time_from, time_to):
+      """Parse only the region of the log between two sample times.
+
+      The sparse checkpoints of the sidecar index give the offset to start
+      reading at, parsing stops after time_to.
+
+      Returns:
+         tuple: The samples and the time of the first sample of the whole
+            log, or None if the index has no usable checkpoints yet.
+      """
+      index = KlipperLogIndex(self.index_folder, self.log_file)
+      with index.lock:
+         if not index.load():
+            return None
+      checkpoints = index.meta["checkpoints"]
+      times = [checkpoint[0] for checkpoint in checkpoints]
+      if not times or any(a > b for a, b in zip(times, times[1:])):
+         return None
+      offset = 0
+      if time_from is not None:
+         # start early enough to have a previous sample for the deltas
+         pos = bisect.bisect_right(times, time_from - 2 * self.STATS_INTERVAL) - 1
+         if pos >= 0:
+            offset = checkpoints[pos][1]
+      store = self.parse_log(self.log_file, offset, stop_time=time_to)
+      return store, index.meta["start_time"]
+
+   def parse_log(self, logname, offset=0, checkpoints=None, stop_time=None,
+                 last_sampletime=None, restart=False):
+      """Parse the Stats samples of a log into a KlipperStatsStore.
+
+      The values of every mcu are stored with the name of the mcu as prefix,
+      e.g. "mcu:bytes_write" or "toolhead:bytes_write". `self.restart` is
+      True if the log ends with a restart not followed by a sample yet.
 
-         for line in f:
-            parts = line.split()
-            if not parts or parts[0] not in ('Stats', 'INFO:root:Stats'):
-               #if parts and parts[0] == 'INFO:root:shutdown:':
-               #    break
+      Args:
+         logname (str): Path of the log.
+         offset (int): Position to start parsing at.
+         checkpoints (list, optional): Gets a (sample time, offset of the
+            line) pair appended for the first sample of the log and the
+            first sample of every CHECKPOINT_INTERVAL seconds.
+         stop_time (float, optional): Stop after the first sample past it.
+         last_sampletime (float, optional): The time of the last sample
+            before offset, to continue a previous parse.
+         restart (bool): If the previous parse ended with a restart.
+      """
+      apply_prefix = { p: 1 for p in self.APPLY_PREFIX }
+      store = KlipperStatsStore()
+
+      for line in self.iter_lines(logname, offset):
+         if not (line.startswith(b'Stats') or line.startswith(b'INFO:root:Stats')):
+            if line.startswith(b'Start printer at'):
+               restart = True
+            continue
+         parts = line.decode('utf-8', 'replace').split()
+         if not parts or parts[0] not in ('Stats', 'INFO:root:Stats'):
+            #if parts and parts[0] == 'INFO:root:shutdown:':
+            #    break
+            continue
+         prefix = self.DEFAULT_MCU + ":"
+         keyparts = {}
+         has_bytes_write = False
+         for p in parts[2:]:
+            name, sep, val = p.partition('=')
+            if not sep:
+               prefix = p
                continue
-            prefix = ""
-            keyparts = {}
-            for p in parts[2:]:
-               if '=' not in p:
-                  prefix = p
-                  if prefix == mcu_prefix:
-                     prefix = ''
-                  continue
-               name, val = p.split('=', 1)
-               if name in apply_prefix:
-                  name = prefix + name
-               keyparts[name] = val
-            if keyparts.get('bytes_write', '0') == '0':
+            try:
+               val = float(val)
+            except ValueError:
                continue
-            keyparts['#sampletime'] = float(parts[1][:-1])
-            out.append(keyparts)
-         f.close()
-      except IOError:
-          log_error(self, "Couldn't open log file: {}".format(logname))
-          print("Couldn't open log file")
-      return out
-
-   def find_print_restarts(self, data):
+            if name in apply_prefix:
+               if name == 'bytes_write' and val:
+                  has_bytes_write = True
+               name = prefix + name
+            keyparts[name] = val
+         if not has_bytes_write:
+            continue
+         try:
+            sampletime = float(parts[1][:-1])
+         except ValueError:
+            continue
+         if restart:
+            # marks the first sample after klippy (re)started
+            keyparts['restart'] = 1.
+            restart = False
+         if checkpoints is not None and (
+               last_sampletime is None
+               or sampletime // self.CHECKPOINT_INTERVAL
+               != last_sampletime // self.CHECKPOINT_INTERVAL):
+            checkpoints.append((sampletime, self.offset - len(line) - 1))
+         last_sampletime = sampletime
+         store.append(sampletime, keyparts)
+         if stop_time is not None and sampletime > stop_time:
+            break
+      self.restart = restart
+      return store
+
+   def list_mcus(self, store):
+      """Return the names of all mcus found in the samples."""
+      return sorted(key[:-len(':bytes_write')] for key in store.keys()
+                    if key.endswith(':bytes_write'))
+
+   def find_print_restarts(self, store):
+      sampletimes = store.times
+      buffer_times = store.column('buffer_time')
+      print_stalls = store.column('print_stall')
       runoff_samples = {}
       last_runoff_start = last_buffer_time = last_sampletime = 0.
       last_print_stall = 0
-      for d in reversed(data):
+      for i in range(len(sampletimes) - 1, -1, -1):
          # Check for buffer runoff
-         sampletime = d['#sampletime']
-         buffer_time = float(d.get('buffer_time', 0.))
+         sampletime = sampletimes[i]
+         buffer_time = buffer_times[i]
          if (last_runoff_start and last_sampletime - sampletime < 5
             and buffer_time > last_buffer_time):
             runoff_samples[last_runoff_start][1].append(sampletime)
@@ -105,7 +412,7 @@ class KlipperLogAnalyzer():
          last_buffer_time = buffer_time
          last_sampletime = sampletime
          # Check for print stall
-         print_stall = int(d['print_stall'])
+         print_stall = print_stalls[i]
          if print_stall < last_print_stall:
             if last_runoff_start:
                runoff_samples[last_runoff_start][0] = True
@@ -114,66 +421,186 @@ class KlipperLogAnalyzer():
                         for sampletime in samples if not stall}
       return sample_resets
 
-   def plot_mcu(self, data, maxbw):
-      # Generate data for plot
-      basetime = lasttime = data[0]['#sampletime']
-      lastbw = float(data[0]['bytes_write']) + float(data[0]['bytes_retransmit'])
-      sample_resets = self.find_print_restarts(data)
-      times = []
-      bwdeltas = []
-      loads = []
-      awake = []
-      hostbuffers = []
-      for d in data:
-         st = d['#sampletime']
+   def _plot_mcu_rows(self, store, mcu, maxbw, basetime=None):
+      """Compute load, bandwidth and awake time of one mcu for every sample.
+
+      Returns:
+         tuple: the indices of the samples valid for the mcu and three lists
+            with a value for every sample, None where the sample is not valid.
+      """
+      size = len(store)
+      loads = [None] * size
+      bwdeltas = [None] * size
+      awake = [None] * size
+      rows = []
+      bw_scale = 100. / maxbw
+      load_scale = 100. / self.TASK_MAX
+      awake_scale = 100. / self.STATS_INTERVAL
+      prefix = mcu + ":"
+      if basetime is None:
+         basetime = store.times[0]
+      lasttime = lastbw = None
+      for i, (st, bytes_write, retransmit, task_avg, task_stddev, mcu_awake) in enumerate(zip(
+            store.times,
+            store.columns[prefix + 'bytes_write'],
+            store.column(prefix + 'bytes_retransmit'),
+            store.column(prefix + 'mcu_task_avg'),
+            store.column(prefix + 'mcu_task_stddev'),
+            store.column(prefix + 'mcu_awake'))):
+         if bytes_write != bytes_write:
+            continue
+         bw = bytes_write + retransmit
+         if lastbw is None:
+            lasttime = st
+            lastbw = bw
          timedelta = st - lasttime
          if timedelta <= 0.:
             continue
-         bw = float(d['bytes_write']) + float(d['bytes_retransmit'])
          if bw < lastbw:
             lastbw = bw
             continue
-         load = float(d['mcu_task_avg']) + 3*float(d['mcu_task_stddev'])
+         load = task_avg + 3*task_stddev
          if st - basetime < 15.:
             load = 0.
-         pt = float(d['print_time'])
-         hb = float(d['buffer_time'])
-         if hb >= self.MAXBUFFER or st in sample_resets:
-            hb = 0.
-         else:
-            hb = 100. * (self.MAXBUFFER - hb) / self.MAXBUFFER
-         hostbuffers.append(hb)
-         times.append(st)
-         bwdeltas.append(100. * (bw - lastbw) / (maxbw * timedelta))
-         loads.append(100. * load / self.TASK_MAX)
-         awake.append(100. * float(d.get('mcu_awake', 0.)) / self.STATS_INTERVAL)
+         rows.append(i)
+         bwdeltas[i] = bw_scale * (bw - lastbw) / timedelta
+         loads[i] = load_scale * load
+         awake[i] = awake_scale * mcu_awake
          lasttime = st
          lastbw = bw
+      return rows, loads, bwdeltas, awake
+
+   def plot_mcu(self, store, maxbw, mcu=None, basetime=None):
+      """Generate the plot data of all mcus with one pass over the columns of each.
+
+      The samples valid for the main mcu define the times of the plot, the
+      series of the other mcus hold None where their sample is not valid.
+      basetime is the first sample time of the log if the store only holds
+      a part of it.
+      """
+      mcus = self.list_mcus(store) if len(store) else []
+      if not mcus:
+         return None
+      if mcu not in mcus:
+         mcu = self.DEFAULT_MCU if self.DEFAULT_MCU in mcus else mcus[0]
+      sample_resets = self.find_print_restarts(store)
+      mcu_rows = {name: self._plot_mcu_rows(store, name, maxbw, basetime) for name in mcus}
+      rows = mcu_rows[mcu][0]
+
+      times = [store.times[i] for i in rows]
+      hostbuffers = []
+      maxbuffer = self.MAXBUFFER
+      buffer_times = store.column('buffer_time')
+      for i, st in zip(rows, times):
+         hb = buffer_times[i]
+         if hb >= maxbuffer or st in sample_resets:
+            hostbuffers.append(0.)
+         else:
+            hostbuffers.append(100. * (maxbuffer - hb) / maxbuffer)
+
+      mcu_series = {}
+      for name, (_, loads, bwdeltas, awake) in mcu_rows.items():
+         mcu_series[name] = dict(
+            loads= [loads[i] for i in rows],
+            bwdeltas= [bwdeltas[i] for i in rows],
+            awake= [awake[i] for i in rows]
+         )
 
       result = dict(
          times= times,
-         bwdeltas= bwdeltas,
-         loads= loads,
-         awake= awake,
-         buffers= hostbuffers
+         buffers= hostbuffers,
+         mcu= mcu,
+         mcus= mcu_series,
+         frequency= self.plot_frequency(store, None),
+         sessions= self.find_sessions(store, rows, mcu_rows)
       )
       return result
 
-   def plot_frequency(self, data, mcu):
-      all_keys = {}
-      for d in data:
-         all_keys.update(d)
-      one_mcu = mcu is not None
-      graph_keys = { key: ([], []) for key in all_keys
-                   if (key in ("freq", "adj") or (not one_mcu and (
-                           key.endswith(":freq") or key.endswith(":adj")))) }
-      basetime = lasttime = data[0]['#sampletime']
-      for d in data:
-         st = d['#sampletime']
-         for key, (times, values) in list(graph_keys.items()):
-            val = d.get(key)
-            if val not in (None, '0', '1'):
-               times.append(st)
-               values.append(float(val)/1000000.0)
-
-      return values
+   def find_sessions(self, store, rows, mcu_rows):
+      """Split the samples into print sessions.
+
+      A session holds the samples during which the print time of the
+      toolhead advances. It ends at a restart of klippy, at a reset of the
+      print_stall counter or once the print time did not advance for
+      SESSION_IDLE_GAP seconds.
+
+      Args:
+         store (KlipperStatsStore): The samples.
+         rows (list): Indices of the samples of the plot.
+         mcu_rows (dict): The result of _plot_mcu_rows for every mcu.
+
+      Returns:
+         list: A dict for every session with start, end, duration, the
+            peaks of load and bandwidth, the retransmitted bytes and the
+            print stalls, per mcu in mcus and as the maximum / sum of all.
+      """
+      print_times = store.column('print_time')
+      print_stalls = store.column('print_stall')
+      restarts = store.column('restart')
+      retransmits = {name: store.column(name + ':bytes_retransmit') for name in mcu_rows}
+      sessions = []
+      session = None
+      last = None
+      for i in rows:
+         st = store.times[i]
+         if last is not None and (restarts[i] or st < store.times[last]
+                                  or print_stalls[i] < print_stalls[last]):
+            session = None
+            last = None
+         if last is None:
+            last = i
+            continue
+         if print_times[i] > print_times[last]:
+            if session is None or st - session['end'] > self.SESSION_IDLE_GAP:
+               session = dict(
+                  start= store.times[last],
+                  end= st,
+                  stalls= 0,
+                  mcus= {name: dict(peak_load= 0., peak_bandwidth= 0., retransmits= 0)
+                         for name in mcu_rows}
+               )
+               sessions.append(session)
+            session['end'] = st
+            session['stalls'] += int(max(0., print_stalls[i] - print_stalls[last]))
+            for name, (_, loads, bwdeltas, _) in mcu_rows.items():
+               stats = session['mcus'][name]
+               if loads[i] is not None:
+                  stats['peak_load'] = max(stats['peak_load'], loads[i])
+                  stats['peak_bandwidth'] = max(stats['peak_bandwidth'], bwdeltas[i])
+               retransmit = retransmits[name][i] - retransmits[name][last]
+               if retransmit > 0:
+                  stats['retransmits'] += int(retransmit)
+         last = i
+      for session in sessions:
+         stats = list(session['mcus'].values())
+         session['duration'] = session['end'] - session['start']
+         session['peak_load'] = max(mcu['peak_load'] for mcu in stats)
+         session['peak_bandwidth'] = max(mcu['peak_bandwidth'] for mcu in stats)
+         session['retransmits'] = sum(mcu['retransmits'] for mcu in stats)
+      return sessions
+
+   def plot_frequency(self, store, mcu):
+      """Return the clock frequency and adjusted frequency in MHz.
+
+      Returns:
+         dict: for the given mcu, or all mcus if mcu is None, a dict with
+            the keys times, freq and adj.
+      """
+      mcus = self.list_mcus(store) if mcu is None else [mcu]
+      result = {}
+      for name in mcus:
+         freq_column = store.columns.get(name + ':freq')
+         if freq_column is None:
+            continue
+         adj_column = store.columns.get(name + ':adj', freq_column)
+         times = []
+         freq = []
+         adj = []
+         for st, freq_val, adj_val in zip(store.times, freq_column, adj_column):
+            if freq_val != freq_val or freq_val in (0., 1.):
+               continue
+            times.append(st)
+            freq.append(freq_val / 1000000.0)
+            adj.append(None if adj_val != adj_val or adj_val in (0., 1.) else adj_val / 1000000.0)
+         result[name] = dict(times= times, freq= freq, adj= adj)
+      return result
@@ -0,0 +1,170 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import gzip
+import os
+import struct
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# raised while reading a truncated or corrupt compressed log
+DECOMPRESSION_ERRORS = (EOFError, zlib.error)
+if hasattr(gzip, "BadGzipFile"):
+    DECOMPRESSION_ERRORS += (gzip.BadGzipFile,)
+if lzma is not None:
+    DECOMPRESSION_ERRORS += (lzma.LZMAError,)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+COMPRESSIONS = {
+    ".gz": "gzip",
+    ".xz": "xz",
+    ".lzma": "xz",
+    ".zst": "zstd",
+}
+
+
+def compression_of(path):
+    """Return the compression of a rotated log by its extension, or None."""
+    return COMPRESSIONS.get(os.path.splitext(path)[1].lower())
+
+
+class KlipperLogFile(object):
+    """Binary, read-only access to a plain or compressed klippy log.
+
+    Compressed logs are decompressed while reading, positions and offsets
+    always refer to the decompressed data.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.compression = compression_of(path)
+        self.raw = open(path, "rb")
+        try:
+            self.stream = self._open_stream()
+        except Exception:
+            self.raw.close()
+            raise
+
+    def _open_stream(self):
+        if self.compression is None:
+            return self.raw
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=self.raw, mode="rb")
+        if self.compression == "xz":
+            if lzma is None:
+                raise IOError("Reading {} needs the lzma module".format(self.path))
+            return lzma.LZMAFile(self.raw)
+        if zstandard is None:
+            raise IOError("Reading {} needs the zstandard module".format(self.path))
+        return zstandard.ZstdDecompressor().stream_reader(self.raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+    def read(self, size):
+        return self.stream.read(size)
+
+    def seek(self, offset):
+        """Move to an offset of the decompressed data.
+
+        Compressed streams get there by decompressing everything before it.
+        """
+        if offset:
+            self.stream.seek(offset)
+
+    def raw_position(self):
+        """Return the position in the file on disk, used for progress."""
+        return self.raw.tell()
+
+    def raw_size(self):
+        return os.fstat(self.raw.fileno()).st_size
+
+
+def uncompressed_size(path):
+    """Return the size of the decompressed log without decompressing it.
+
+    Returns:
+        int: The size, or None if the format does not record it.
+    """
+    compression = compression_of(path)
+    try:
+        if compression is None:
+            return os.path.getsize(path)
+        with open(path, "rb") as f:
+            if compression == "gzip":
+                # ISIZE of the last member, modulo 2^32
+                f.seek(-4, 2)
+                return struct.unpack("<I", f.read(4))[0]
+            if compression == "xz":
+                return _xz_uncompressed_size(f)
+            if zstandard is not None:
+                size = zstandard.frame_content_size(f.read(18))
+                return size if size >= 0 else None
+    except Exception:
+        # corrupt or truncated file, zstandard raises its own error type
+        pass
+    return None
+
+
+def _read_multibyte(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = bytearray(data[pos:pos + 1])[0]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _xz_uncompressed_size(f):
+    # The stream footer points to the index, which lists the uncompressed
+    # size of every block. Only single-stream files are supported.
+    f.seek(-12, 2)
+    footer = f.read(12)
+    if footer[10:12] != b"YZ":
+        return None
+    backward_size = (struct.unpack("<I", footer[4:8])[0] + 1) * 4
+    f.seek(-12 - backward_size, 2)
+    index = f.read(backward_size)
+    if index[0:1] != b"\x00":
+        return None
+    records, pos = _read_multibyte(index, 1)
+    total = 0
+    for _ in range(records):
+        _, pos = _read_multibyte(index, pos)
+        size, pos = _read_multibyte(index, pos)
+        total += size
+    return total
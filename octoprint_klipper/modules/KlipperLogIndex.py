@@ -0,0 +1,264 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from .KlipperLogFile import compression_of
+from .KlipperStatsStore import KlipperStatsStore
+
+_replace = getattr(os, "replace", os.rename)
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _get_lock(path):
+    with _locks_lock:
+        if path not in _locks:
+            _locks[path] = threading.Lock()
+        return _locks[path]
+
+
+class KlipperLogIndex(object):
+    """Sidecar index of the Stats samples already parsed from a klippy.log.
+
+    The index is stored as two files in the index folder: a small JSON
+    file with the identity of the log and the byte offset reached, and a
+    binary file the parsed samples are appended to. Each refresh appends
+    one block holding the sample times and one column per metric as
+    little-endian doubles, each flagged if it holds missing values.
+
+    The index is reset whenever the log was rotated or truncated, that is
+    when the inode, the beginning of the file or the size no longer match.
+    Compressed logs never grow, their offset refers to the decompressed
+    data and any change of their size resets the index.
+
+    The JSON file also holds sparse checkpoints mapping sample times to the
+    offset of their line, so a time range can be read without a full scan,
+    and the summary of the whole log (its print sessions and time range)
+    until new samples are appended.
+    """
+
+    VERSION = 6
+    FINGERPRINT_SIZE = 4096
+    MAX_BLOCKS = 64
+    BLOCK = struct.Struct("<II")
+    COLUMN = struct.Struct("<HB")
+
+    def __init__(self, index_folder, log_file):
+        self.log_file = os.path.realpath(log_file)
+        self.compressed = compression_of(self.log_file) is not None
+        self.name = hashlib.sha1(self.log_file.encode("utf-8")).hexdigest()
+        self.meta_file = os.path.join(index_folder, self.name + ".json")
+        self.index_folder = index_folder
+        self.lock = _get_lock(self.meta_file)
+        self.meta = None
+        self._stale_data_files = []
+
+    @property
+    def offset(self):
+        return self.meta["offset"]
+
+    @property
+    def data_file(self):
+        return os.path.join(
+            self.index_folder, "{}.{}.bin".format(self.name, self.meta["generation"]))
+
+    def _fingerprint(self, length):
+        # of the raw file, the first bytes of a compressed log are enough
+        if self.compressed:
+            length = self.FINGERPRINT_SIZE
+        with open(self.log_file, "rb") as f:
+            return hashlib.sha1(f.read(min(length, self.FINGERPRINT_SIZE))).hexdigest()
+
+    def _empty_meta(self, stat, old_meta=None):
+        generation = 0
+        if old_meta and isinstance(old_meta.get("generation"), int):
+            generation = old_meta["generation"] + 1
+            self._stale_data_files.append(os.path.join(
+                self.index_folder, "{}.{}.bin".format(self.name, old_meta["generation"])))
+        return dict(
+            version=self.VERSION,
+            path=self.log_file,
+            inode=stat.st_ino,
+            size=stat.st_size,
+            offset=0,
+            fingerprint="",
+            keys=[],
+            samples=0,
+            checkpoints=[],
+            start_time=None,
+            end_time=None,
+            restart=False,
+            summary=None,
+            blocks=0,
+            generation=generation,
+            data_size=0
+        )
+
+    def load(self):
+        """Load the index and check that it still belongs to the log.
+
+        Returns:
+            bool: True if the stored samples can be reused, False if the
+                index was reset.
+        """
+        stat = os.stat(self.log_file)
+        try:
+            with io.open(self.meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            meta = None
+
+        if (
+            meta is None
+            or meta.get("version") != self.VERSION
+            or meta.get("path") != self.log_file
+            or meta.get("inode") != stat.st_ino
+            or (not self.compressed and meta.get("offset", 0) > stat.st_size)
+            or (self.compressed and meta.get("size") != stat.st_size)
+            or meta.get("fingerprint") != self._fingerprint(meta.get("offset", 0))
+        ):
+            self.meta = self._empty_meta(stat, meta)
+            return False
+        self.meta = meta
+        if meta["data_size"] and (
+            not os.path.isfile(self.data_file)
+            or os.path.getsize(self.data_file) < meta["data_size"]
+        ):
+            self.meta = self._empty_meta(stat, meta)
+            return False
+        return True
+
+    def load_store(self):
+        """Return the stored samples as a KlipperStatsStore."""
+        store = KlipperStatsStore()
+        size = self.meta["data_size"]
+        if not size:
+            return store
+        with open(self.data_file, "rb") as f:
+            data = f.read(size)
+        keys = self.meta["keys"]
+        pos = 0
+        while pos < len(data):
+            rows, cols = self.BLOCK.unpack_from(data, pos)
+            pos += self.BLOCK.size
+            block = KlipperStatsStore()
+            block.times, pos = self._read_column(data, pos, rows)
+            for _ in range(cols):
+                key_id, missing = self.COLUMN.unpack_from(data, pos)
+                pos += self.COLUMN.size
+                block.columns[keys[key_id]], pos = self._read_column(data, pos, rows)
+                if missing:
+                    block.missing.add(keys[key_id])
+            store.extend(block)
+        return store
+
+    @staticmethod
+    def _read_column(data, pos, rows):
+        end = pos + 8 * rows
+        column = array("d")
+        if hasattr(column, "frombytes"):
+            column.frombytes(bytes(data[pos:end]))
+        else:
+            column.fromstring(bytes(data[pos:end]))
+        if sys.byteorder != "little":
+            column.byteswap()
+        return column, end
+
+    @staticmethod
+    def _column_bytes(column):
+        if sys.byteorder != "little":
+            column = array("d", column)
+            column.byteswap()
+        if hasattr(column, "tobytes"):
+            return column.tobytes()
+        return column.tostring()
+
+    def _encode_block(self, store, key_ids):
+        keys = self.meta["keys"]
+        buf = bytearray(self.BLOCK.pack(len(store), len(store.columns)))
+        buf += self._column_bytes(store.times)
+        for key, column in store.columns.items():
+            if key not in key_ids:
+                key_ids[key] = len(keys)
+                keys.append(key)
+            buf += self.COLUMN.pack(key_ids[key], key in store.missing)
+            buf += self._column_bytes(column)
+        return buf
+
+    def append(self, store, offset, full_store=None, checkpoints=(), restart=False):
+        """Append newly parsed samples and store the offset reached.
+
+        `restart` tells if the log ends with a restart that belongs to the
+        next sample. If `full_store` holding all samples is given and the
+        data file has grown to many small blocks, it is rewritten as a
+        single block.
+        """
+        if not len(store) and offset == self.meta["offset"]:
+            return
+        self.meta["checkpoints"].extend(checkpoints)
+        self.meta["restart"] = restart
+        if len(store):
+            if self.meta["start_time"] is None:
+                self.meta["start_time"] = store.times[0]
+            self.meta["end_time"] = store.times[-1]
+            self.meta["summary"] = None
+        self._stale_data_files.append(self.data_file)
+        if full_store is not None and self.meta["blocks"] >= self.MAX_BLOCKS:
+            self.meta["keys"] = []
+            self.meta["blocks"] = 0
+            self.meta["samples"] = 0
+            self.meta["data_size"] = 0
+            self.meta["generation"] += 1
+            store = full_store
+        keys = self.meta["keys"]
+        key_ids = {key: i for i, key in enumerate(keys)}
+        buf = self._encode_block(store, key_ids) if len(store) else bytearray()
+        if not os.path.isdir(self.index_folder):
+            os.makedirs(self.index_folder)
+        mode = "r+b" if self.meta["data_size"] and os.path.isfile(self.data_file) else "wb"
+        with open(self.data_file, mode) as f:
+            # drop anything written after the last successful update
+            f.seek(self.meta["data_size"])
+            f.truncate()
+            f.write(buf)
+        self.meta["data_size"] += len(buf)
+        self.meta["samples"] += len(store)
+        self.meta["blocks"] += 1 if buf else 0
+        self.meta["offset"] = offset
+        self.meta["size"] = os.path.getsize(self.log_file)
+        self.meta["fingerprint"] = self._fingerprint(offset)
+        self.save()
+
+        for stale_file in self._stale_data_files:
+            if stale_file != self.data_file and os.path.isfile(stale_file):
+                os.remove(stale_file)
+        self._stale_data_files = []
+
+    def save(self):
+        """Write the JSON file of the index."""
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(json.dumps(self.meta).encode("utf-8"))
+        _replace(tmp_file, self.meta_file)
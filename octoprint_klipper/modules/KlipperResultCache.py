@@ -0,0 +1,163 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+_replace = getattr(os, "replace", os.rename)
+
+
+class KlipperResultCache(object):
+    """Bounded LRU cache for the results of the log analysis.
+
+    A result is keyed by the identity of the log file (path, inode, size
+    and mtime) and the analysis parameters, so a changed log never hits an
+    old entry. The memory tier is limited by the size of the results as
+    JSON. An optional disk tier keeps results across restarts and is
+    limited the same way. It only gets the results of logs that no longer
+    change, the result of a log still being written is replaced with every
+    refresh and stays in memory.
+    """
+
+    MAX_MEMORY = 16 * 1024 * 1024
+    MAX_DISK = 64 * 1024 * 1024
+
+    def __init__(self, max_memory=MAX_MEMORY, cache_folder=None, max_disk=MAX_DISK):
+        self.max_memory = max_memory
+        self.cache_folder = cache_folder
+        self.max_disk = max_disk
+        self._entries = OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(log_file, **params):
+        """Return the cache key of a log file and the analysis parameters."""
+        stat = os.stat(log_file)
+        return json.dumps([
+            os.path.realpath(log_file),
+            stat.st_ino,
+            stat.st_size,
+            stat.st_mtime,
+            sorted(params.items())
+        ])
+
+    def _disk_file(self, key):
+        return os.path.join(
+            self.cache_folder, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        """Return the cached result or None."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[0]
+        result = self._load(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, result, len(json.dumps(result)))
+        return result
+
+    def put(self, key, result, persist=True):
+        """Cache a result, on disk too if persist is set."""
+        data = json.dumps(result)
+        self._remember(key, result, len(data))
+        if persist and self.cache_folder:
+            self._store(key, data)
+
+    def _remember(self, key, result, size):
+        if size > self.max_memory:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._memory -= old[1]
+            self._entries[key] = (result, size)
+            self._memory += size
+            while self._memory > self.max_memory:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._memory -= evicted_size
+                self.evictions += 1
+
+    def _load(self, key):
+        if not self.cache_folder:
+            return None
+        path = self._disk_file(key)
+        try:
+            with io.open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        # keep recently used files from being evicted first
+        os.utime(path, None)
+        return entry.get("result")
+
+    def _store(self, key, data):
+        if len(data) > self.max_disk:
+            return
+        if not os.path.isdir(self.cache_folder):
+            os.makedirs(self.cache_folder)
+        path = self._disk_file(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write('{{"key": {}, "result": {}}}'.format(json.dumps(key), data).encode("utf-8"))
+        _replace(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.cache_folder):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_folder, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(files):
+            if total <= self.max_disk:
+                break
+            os.remove(path)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def info(self):
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                memory=self._memory,
+                max_memory=self.max_memory,
+                hits=self.hits,
+                disk_hits=self.disk_hits,
+                misses=self.misses,
+                evictions=self.evictions
+            )
@@ -0,0 +1,108 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+from array import array
+
+try:
+    from sys import intern
+except ImportError:
+    pass
+
+NAN = float("nan")
+
+
+class KlipperStatsStore(object):
+    """Columnar store of the Stats samples of a klippy.log.
+
+    Every metric is kept in its own array of doubles which shares its
+    index with the `times` column. A metric missing from a sample is
+    stored as NaN. Metric names are interned once, when their column is
+    created.
+    """
+
+    def __init__(self):
+        self.times = array("d")
+        self.columns = {}
+        # keys of the columns holding a NaN
+        self.missing = set()
+
+    def __len__(self):
+        return len(self.times)
+
+    def keys(self):
+        return list(self.columns.keys())
+
+    def append(self, sampletime, fields):
+        """Add one sample.
+
+        Args:
+            sampletime (float): Time of the sample.
+            fields (dict): Value of every metric in the sample.
+        """
+        columns = self.columns
+        size = len(self.times)
+        for key, value in fields.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[intern(key)] = array("d", [NAN]) * size
+                if size:
+                    self.missing.add(key)
+            column.append(value)
+        self.times.append(sampletime)
+        if len(fields) != len(columns):
+            size += 1
+            for key, column in columns.items():
+                if len(column) < size:
+                    column.append(NAN)
+                    self.missing.add(key)
+
+    def extend(self, other):
+        """Append all samples of another store."""
+        size = len(self.times)
+        other_size = len(other.times)
+        for key, values in other.columns.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[intern(key)] = array("d", [NAN]) * size
+                if size:
+                    self.missing.add(key)
+            column.extend(values)
+        self.missing.update(other.missing)
+        self.times.extend(other.times)
+        for key, column in self.columns.items():
+            if len(column) < size + other_size:
+                column.extend(array("d", [NAN]) * (size + other_size - len(column)))
+                self.missing.add(key)
+
+    def column(self, key, default=0.):
+        """Return the values of a metric with missing values set to `default`."""
+        column = self.columns.get(key)
+        if column is None:
+            return array("d", [default]) * len(self.times)
+        if key in self.missing:
+            return array("d", [default if v != v else v for v in column])
+        return column
+
+    def tail(self, count):
+        """Return a new store with the last `count` samples."""
+        store = KlipperStatsStore()
+        start = max(0, len(self.times) - count)
+        store.times = self.times[start:]
+        for key, column in self.columns.items():
+            store.columns[key] = column[start:]
+        store.missing = set(key for key in self.missing
+                            if any(v != v for v in store.columns[key]))
+        return store
@@ -0,0 +1,977 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import logging
+import octoprint.plugin
+import octoprint.plugin.core
+import glob
+import os
+import time
+import sys
+import threading
+
+from octoprint.server import NO_CONTENT
+from octoprint.util import is_hidden_path
+from octoprint.util import get_formatted_size
+from octoprint.util import RepeatedTimer
+from octoprint_klipper import cfgUtils, configDiff, __plugin_settings_overlay__
+from octoprint_klipper.util import *
+from octoprint.util.comm import parse_firmware_line
+from octoprint.access.permissions import Permissions, ADMIN_GROUP
+from .modules import KlipperLogAnalyzer
+from .modules.KlipperLogFile import compression_of, uncompressed_size
+from .logAnalysis import LogAnalysisJobs
+from .liveStats import LiveStats
+from .messageBus import MessageBus
+from .fileIndex import create_observer
+from .backupStore import BackupStore
+from .configValidator import ConfigValidator
+from .configGraph import ConfigGraph
+from .printerState import PrinterState
+from .macroCompiler import MacroCache, expand_macro
+from .printers import (get_printers, get_printer, get_config_path, get_log_path,
+                       get_backup_store, get_live_stats)
+from octoprint.server.util.flask import restricted_access
+import flask
+from flask_babel import gettext
+
+if sys.version_info[0] < 3:
+    import StringIO
+
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5Mb
+MAX_LOG_PAGE_SIZE = 1024 * 1024  # 1Mb
+MAX_RESPONSE_LINES = 200
+LOGGED_RESPONSES = ("// probe", "// Failed to verify BLTouch")
+# seconds between the updates of the printer state without the API socket
+PRINTER_STATE_POLL_INTERVAL = 2.
+
+class KlipperPlugin(
+        octoprint.plugin.StartupPlugin,
+        octoprint.plugin.TemplatePlugin,
+        octoprint.plugin.SettingsPlugin,
+        octoprint.plugin.AssetPlugin,
+        octoprint.plugin.SimpleApiPlugin,
+        octoprint.plugin.EventHandlerPlugin,
+        octoprint.plugin.ShutdownPlugin,
+        octoprint.plugin.BlueprintPlugin):
+
+    _parsing_response = False
+    _parsing_check_response = True
+
+    def __init__(self):
+        self._logger = logging.getLogger("octoprint.plugins.klipper")
+        self._octoklipper_logger = logging.getLogger("octoprint.plugins.klipper.debug")
+        self._message_lines = []
+        self._dropped_message_lines = 0
+        self._message_bus = None
+        self._file_indexes = {}
+        self._file_observer = None
+        self._backup_store = None
+        self._backup_stores = {}
+        self._live_stats = {}
+        self._printers_lock = threading.Lock()
+        self._macro_cache = MacroCache()
+        self._config_validator = ConfigValidator()
+        self._config_graph = ConfigGraph()
+        self._api_socket = None
+        self._printer_state = PrinterState(self)
+        self._printer_state_timer = None
+
+    # -- Startup Plugin
+    def on_startup(self, host, port):
+        from octoprint.logging.handlers import CleaningTimedRotatingFileHandler
+        octoklipper_logging_handler = CleaningTimedRotatingFileHandler(
+            self._settings.get_plugin_logfile_path(postfix="debug"), when="D", backupCount=3)
+        octoklipper_logging_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s"))
+        octoklipper_logging_handler.setLevel(logging.DEBUG)
+
+        self._octoklipper_logger.addHandler(octoklipper_logging_handler)
+        set_debug_logging(self)
+        self._octoklipper_logger.propagate = False
+
+        self.set_plugin_settings_overlay()
+        self._macro_cache.update(self._settings.get(["macros"]))
+
+        self._message_bus = MessageBus(self, history_size=self.get_log_history_size())
+        self._file_observer = create_observer()
+        self._backup_store = BackupStore(os.path.join(self.get_plugin_data_folder(), "backups"))
+        self.set_backup_policy()
+        try:
+            migrated = self._backup_store.migrate_folder(
+                os.path.join(self.get_plugin_data_folder(), "configs"))
+        except (IOError, OSError):
+            self._logger.exception("Moving the old backups to the backup store failed")
+        else:
+            if migrated:
+                log_info(self, "Moved {} backups to the backup store.".format(migrated))
+        self._log_analysis = LogAnalysisJobs(
+            self,
+            os.path.join(self.get_plugin_data_folder(), "logindex"),
+            os.path.join(self.get_plugin_data_folder(), "statscache")
+        )
+        self.start_api_socket()
+
+    def on_after_startup(self):
+        additional_ports = self._settings.global_get(
+            ["serial", "additionalPorts"])
+
+        for printer in get_printers(self):
+            klipper_port = printer["port"]
+            if klipper_port and klipper_port not in additional_ports:
+                additional_ports.append(klipper_port)
+                self._settings.global_set(
+                    ["serial", "additionalPorts"], additional_ports)
+                self._settings.save()
+                log_info(
+                    self,
+                    "Added klipper serial port {} to list of additional ports.".format(klipper_port)
+                )
+
+        self._printer_state_timer = RepeatedTimer(PRINTER_STATE_POLL_INTERVAL, self.poll_printer_state)
+        self._printer_state_timer.start()
+
+    # -- Shutdown Plugin
+
+    def on_shutdown(self):
+        self._log_analysis.shutdown()
+        for live_stats in list(self._live_stats.values()):
+            live_stats.shutdown()
+        self.stop_api_socket()
+        if self._printer_state_timer is not None:
+            self._printer_state_timer.cancel()
+        self._message_bus.shutdown()
+        if self._file_observer is not None:
+            self._file_observer.stop()
+
+    # -- Settings Plugin
+
+    def get_additional_permissions(self, *args, **kwargs):
+        return [
+            {
+                "key": "CONFIG",
+                "name": "Config Klipper",
+                "description": gettext("Allows to config klipper"),
+                "default_groups": [ADMIN_GROUP],
+                "dangerous": True,
+                "roles": ["admin"]
+            },
+            {
+                "key": "MACRO",
+                "name": "Use Klipper Macros",
+                "description": gettext("Allows to use klipper macros"),
+                "default_groups": [ADMIN_GROUP],
+                "dangerous": True,
+                "roles": ["admin"]
+            },
+        ]
+
+    def get_settings_defaults(self):
+        # TODO #69 put some settings on the localStorage
+        return dict(
+            connection=dict(
+                port="/tmp/printer",
+                replace_connection_panel=True,
+                hide_editor_button=False,
+                use_api_socket=False,
+                api_socket="/tmp/klippy_uds"
+            ),
+            # more Klipper hosts, each a dict with id, name, port,
+            # config_path, baseconfig and logpath
+            printers=[],
+            macros=[dict(
+                name="E-Stop",
+                macro="M112",
+                sidebar=True,
+                tab=True
+            )],
+            probe=dict(
+                height=0,
+                lift=5,
+                speed_xy=1500,
+                speed_z=500,
+                points=[dict(
+                    name="point-1",
+                    x=0,
+                    y=0
+                )]
+            ),
+            configuration=dict(
+                debug_logging=False,
+                config_path="~/",
+                baseconfig="printer.cfg",
+                logpath="/tmp/klippy.log",
+                restart_service_command="sudo service klipper restart",
+                reload_command="RESTART",
+                restart_onsave=True,
+                confirm_reload=True,
+                shortStatus_navbar=True,
+                shortStatus_sidebar=True,
+                parse_check=False,
+                fontsize=12,
+                hide_error_popups=False,
+                log_history=500,
+                backup_compress=True,
+                backup_keep_per_file=BackupStore.KEEP_PER_FILE,
+                backup_thin_after_days=BackupStore.THIN_AFTER_DAYS
+            )
+        )
+
+    def on_settings_save(self, data):
+        old_debug_logging = self._settings.get_boolean(["configuration", "debug_logging"])
+        old_restart_service_command = self._settings.get(["configuration", "restart_service_command"])
+        old_api_socket = self.get_api_socket_setting()
+        old_macros = self._settings.get(["macros"])
+
+        octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
+
+        if old_debug_logging != self._settings.get_boolean(["configuration", "debug_logging"]):
+            set_debug_logging(self)
+
+        new_restart_service_command = self._settings.get(["configuration", "restart_service_command"])
+        if old_restart_service_command != new_restart_service_command:
+            self.set_plugin_settings_overlay()
+
+        self._message_bus.set_history_size(self.get_log_history_size())
+        self.set_backup_policy()
+        new_macros = self._settings.get(["macros"])
+        if old_macros != new_macros:
+            compiled = self._macro_cache.update(new_macros)
+            log_event(self, "macros_compiled", macros=len(new_macros or []), compiled=compiled)
+
+        if old_api_socket != self.get_api_socket_setting():
+            self.start_api_socket()
+
+    # -- Klippy API socket
+
+    def get_api_socket_setting(self):
+        """Return the path of the API socket, None if it is not used."""
+        if not self._settings.get_boolean(["connection", "use_api_socket"]):
+            return None
+        return os.path.expanduser(self._settings.get(["connection", "api_socket"]))
+
+    def start_api_socket(self):
+        """Connect to the API socket of Klippy if enabled, in addition to
+        the serial port, to get the state pushed instead of polling it.
+        """
+        self.stop_api_socket()
+        path = self.get_api_socket_setting()
+        if path is None:
+            return
+        if sys.version_info[0] < 3:
+            log_info(self, "The Klippy API socket needs Python 3.")
+            return
+        from .apiSocket import KlippyApiClient
+        self._api_socket = KlippyApiClient(path, self.on_klippy_status, self.on_klippy_state)
+        self._api_socket.start()
+
+    def stop_api_socket(self):
+        if self._api_socket is not None:
+            self._api_socket.stop()
+            self._api_socket = None
+
+    def on_klippy_state(self, state, message):
+        log_event(self, "klippy_api_socket", state=state, message=message)
+        if state == "disconnected":
+            self._printer_state.clear()
+            update_status(self, "info", "Klipper: API socket disconnected")
+        elif state != "connected":
+            # klippy is starting up or failed, before it can be subscribed to
+            self._printer_state.update(dict(webhooks=dict(state=state, state_message=message)))
+
+    def on_klippy_status(self, changes, status):
+        self._printer_state.update(changes)
+
+    def poll_printer_state(self):
+        """Feed the printer state from what OctoPrint knows about the printer,
+        while the API socket does not push it.
+        """
+        if self._api_socket is not None and self._api_socket.connected:
+            return
+        if not self._printer.is_operational():
+            self._printer_state.clear()
+            return
+        data = self._printer.get_current_data()
+        flags = data["state"]["flags"]
+        if flags.get("printing"):
+            state = "printing"
+        elif flags.get("paused") or flags.get("pausing"):
+            state = "paused"
+        elif flags.get("error"):
+            state = "error"
+        else:
+            state = "standby"
+        changes = dict(print_stats=dict(
+            state=state,
+            filename=(data["job"].get("file") or {}).get("name") or "",
+            print_duration=data["progress"].get("printTime") or 0.
+        ))
+        temperatures = self._printer.get_current_temperatures()
+        for name, heater in (("tool0", "extruder"), ("bed", "heater_bed")):
+            if name in temperatures:
+                changes[heater] = dict(
+                    temperature=temperatures[name].get("actual"),
+                    target=temperatures[name].get("target")
+                )
+        self._printer_state.update(changes)
+
+    def get_backup_policy(self):
+        return dict(
+            compress=self._settings.get_boolean(["configuration", "backup_compress"]),
+            keep_per_file=self._settings.get_int(["configuration", "backup_keep_per_file"]) or 0,
+            thin_after_days=self._settings.get_int(["configuration", "backup_thin_after_days"]) or 0
+        )
+
+    def set_backup_policy(self):
+        policy = self.get_backup_policy()
+        self._backup_store.set_policy(**policy)
+        with self._printers_lock:
+            stores = list(self._backup_stores.values())
+        for store in stores:
+            store.set_policy(**policy)
+
+    def get_request_printer(self, data=None):
+        """Return the printer of a request, given by the parameter printer,
+        the default printer without it. Aborts with 400 for an unknown printer.
+        """
+        if data is None:
+            data = flask.request.values
+        printer = get_printer(self, data.get("printer"))
+        if printer is None:
+            flask.abort(400, description="Invalid request, unknown printer {}".format(data.get("printer")))
+        return printer
+
+    def get_log_history_size(self):
+        return self._settings.get_int(["configuration", "log_history"]) or MessageBus.HISTORY_SIZE
+
+    def get_settings_restricted_paths(self):
+        return dict(
+            admin=[
+                ["connection", "port"],
+                ["configuration", "config_path"],
+                ["printers"],
+                ["configuration", "replace_connection_panel"]
+            ],
+            user=[
+                ["macros"],
+                ["probe"]
+            ]
+        )
+
+    def get_settings_version(self):
+        # Settings_Versionhistory:
+        # 3 = add shortstatus on navbar. migrate the navbar setting for this
+        # 4 = -change of configpath to config_path with only path without filename
+        #     -parse configpath into config_path and baseconfig
+        #     -switch setting for 'restart on editor save' to true if it was not set to manually
+        #     -remove old_config
+        #     -remove config on root settingsdirectory
+        return 4
+
+    #migrate Settings
+    def on_settings_migrate(self, target, current):
+        settings = self._settings
+        if current is None:
+            migrate_old_settings(self, settings)
+
+        if current is not None and current < 3:
+            self.migrate_settings_3(settings)
+
+        if current is not None and current < 4:
+            self.migrate_settings_4(settings)
+
+    def migrate_settings_3(self, settings):
+        migrate_settings_configuration(
+            self,
+            settings,
+            "shortStatus_navbar",
+            "navbar",
+        )
+
+    def migrate_settings_4(self, settings):
+        if settings.has(["configuration", "configpath"]):
+            cfg_path = settings.get(["configuration", "configpath"])
+            new_cfg_path, baseconfig = os.path.split(cfg_path)
+            log_info(self, "migrate setting for 'configuration/config_path': " + cfg_path + " -> " + new_cfg_path)
+            log_info(self, "migrate setting for 'configuration/baseconfig': printer.cfg -> " + baseconfig)
+            settings.set(["configuration", "config_path"], new_cfg_path)
+            settings.set(["configuration", "baseconfig"], baseconfig)
+            settings.remove(["configuration", "configpath"])
+        if (
+            settings.has(["configuration", "reload_command"])
+            and settings.get(["configuration", "reload_command"]) == "manually"
+        ):
+            log_info(self, "migrate setting for 'configuration/restart_onsave': True -> False")
+            settings.set(["configuration", "restart_onsave"], False)
+            settings.remove(["configuration", "reload_command"])
+
+        if settings.has(["config"]):
+            log_info(self, "remove old setting for 'config'")
+            settings.remove(["config"])
+
+        if settings.has(["configuration", "old_config"]):
+            log_info(self, "remove old setting for 'configuration/old_config'")
+            settings.remove(["configuration", "old_config"])
+
+
+    # -- Template Plugin
+    def get_template_configs(self):
+        return [
+            dict(type="navbar", custom_bindings=True),
+            dict(type="settings", custom_bindings=True),
+            dict(
+                type="generic",
+                name="Assisted Bed Leveling",
+                template="klipper_leveling_dialog.jinja2",
+                custom_bindings=True
+            ),
+            dict(
+                type="generic",
+                name="PID Tuning",
+                template="klipper_pid_tuning_dialog.jinja2",
+                custom_bindings=True
+            ),
+            dict(
+                type="generic",
+                name="Coordinate Offset",
+                template="klipper_offset_dialog.jinja2",
+                custom_bindings=True
+            ),
+            dict(
+                type="tab",
+                name="Klipper",
+                template="klipper_tab_main.jinja2",
+                suffix="_main",
+                custom_bindings=True
+            ),
+            dict(type="sidebar",
+                custom_bindings=True,
+                icon="rocket",
+                replaces="connection" if self._settings.get_boolean(
+                    ["connection", "replace_connection_panel"]) else ""
+            ),
+            dict(
+                type="generic",
+                name="Performance Graph",
+                template="klipper_graph_dialog.jinja2",
+                custom_bindings=True
+            ),
+            dict(
+                type="generic",
+                name="Config Backups",
+                template="klipper_backups_dialog.jinja2",
+                custom_bindings=True
+            ),
+            dict(
+                type="generic",
+                name="Config Editor",
+                template="klipper_editor.jinja2",
+                custom_bindings=True
+            ),
+            dict(
+                type="generic",
+                name="Macro Dialog",
+                template="klipper_param_macro_dialog.jinja2",
+                custom_bindings=True
+            )
+        ]
+
+    def get_template_vars(self):
+        return {
+            "max_upload_size": MAX_UPLOAD_SIZE,
+            "max_upload_size_str": get_formatted_size(MAX_UPLOAD_SIZE),
+        }
+
+    # -- Asset Plugin
+
+    def get_assets(self):
+        return dict(
+            js=["js/klipper.js",
+                "js/klipper_settings.js",
+                "js/klipper_leveling.js",
+                "js/klipper_pid_tuning.js",
+                "js/klipper_offset.js",
+                "js/klipper_param_macro.js",
+                "js/klipper_graph.js",
+                "js/klipper_backup.js",
+                "js/klipper_editor.js"
+            ],
+            clientjs=["clientjs/klipper.js"],
+            css=["css/klipper.css"]
+        )
+
+    # -- Event Handler Plugin
+
+    def on_event(self, event, payload):
+        if event == "UserLoggedIn":
+            log_info(self, "Klipper: Standby")
+        if event == "Connecting":
+            log_info(self, "Klipper: Connecting ...")
+        elif event == "Connected":
+            log_info(self, "Klipper: Connected to host")
+            log_info(
+                self,
+                "Connected to host via {} @{}bps".format(payload["port"], payload["baudrate"]))
+        elif event == "Disconnected":
+            log_info(self, "Klipper: Disconnected from host")
+
+        elif event == "Error":
+            log_error(self, payload["error"])
+
+    def processAtCommand(self, comm_instance, phase, command, parameters, tags=None, *args, **kwargs):
+        if command != "SWITCHCONFIG":
+            return
+
+        config = parameters
+        log_info(self, "SWITCHCONFIG detected config:{}".format(config))
+        return None
+
+    # -- GCODE Hook
+    def process_sent_GCODE(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+        if cmd == "SAVE_CONFIG":
+            log_info(self, "SAVE_CONFIG detected")
+            send_message(self, type = "reload", subtype = "config")
+
+    def on_parse_gcode(self, comm, line, *args, **kwargs):
+        # Runs on the comm thread for every received line. Klipper starts
+        # its responses with "//" or "!!" and acknowledges M115 with
+        # "ok FIRMWARE_NAME:Klipper FIRMWARE_VERSION:...", so the first
+        # character decides and other "ok" and temperature lines pass with
+        # at most one more check.
+        first = line[:1]
+        if first not in "/!Fo" or (first == "o" and "FIRMWARE_VERSION" not in line):
+            if self._parsing_response:
+                self.write_parsing_response_buffer()
+            return line
+        if "FIRMWARE_VERSION" in line:
+            printerInfo = parse_firmware_line(line)
+            if "FIRMWARE_VERSION" in printerInfo:
+                log_info(self, "Firmware version: {}".format(
+                    printerInfo["FIRMWARE_VERSION"]))
+            if first != "/":
+                self.write_parsing_response_buffer()
+        elif first == "/" and line.startswith("//"):
+            if line.startswith(LOGGED_RESPONSES):
+                log_info(self, line.strip('/'))
+                self.write_parsing_response_buffer()
+            else:
+                # add lines with // to a buffer
+                if len(self._message_lines) < MAX_RESPONSE_LINES:
+                    self._message_lines.append(line.strip('/'))
+                else:
+                    self._dropped_message_lines += 1
+                if not self._parsing_response:
+                    update_status(self, "info", self._message_lines[0])
+                self._parsing_response = True
+        elif first == "!" and line.startswith("!!"):
+            log_error(self, line.strip('!'))
+            self.write_parsing_response_buffer()
+        else:
+            self.write_parsing_response_buffer()
+        return line
+
+    def write_parsing_response_buffer(self):
+        # write buffer with // lines after a gcode response without //
+        if self._parsing_response:
+            self._parsing_response = False
+            message = "".join(self._message_lines)
+            if self._dropped_message_lines:
+                message += " ... ({} more lines)".format(self._dropped_message_lines)
+            log_info(self, message)
+            self._message_lines = []
+            self._dropped_message_lines = 0
+
+    def get_api_commands(self):
+        return dict(
+            listLogFiles=[],
+            getStats=["logFile"],
+            cancelStats=["jobId"],
+            getStatsCache=[],
+            liveStats=["clientId"],
+            getLogData=["logFile"]
+        )
+
+    def on_api_command(self, command, data):
+        if command == "listLogFiles":
+            files = []
+            logpath = get_log_path(self.get_request_printer(data))
+            if logpath and file_exist(self, logpath):
+                for f in glob.glob(logpath + "*"):
+                    filesize = os.path.getsize(f)
+                    filemdate = time.strftime("%d.%m.%Y %H:%M",time.localtime(os.path.getctime(f)))
+                    files.append(dict(
+                        name=os.path.basename(f) + " (" + filemdate + ")",
+                        file=f,
+                        size=filesize,
+                        compression=compression_of(f),
+                        uncompressed_size=uncompressed_size(f)
+                    ))
+            return flask.jsonify(data=files)
+        elif command == "getStats":
+            log_file = self.get_log_file(data)
+            params = dict(
+                max_points=get_int_param(data, "maxPoints"),
+                time_from=get_float_param(data, "from"),
+                time_to=get_float_param(data, "to")
+            )
+            result = self._log_analysis.get_cached(log_file, **params)
+            if result is not None:
+                return flask.jsonify(result=result)
+            job_id = self._log_analysis.submit(log_file, **params)
+            return flask.jsonify(jobId=job_id)
+        elif command == "cancelStats":
+            return flask.jsonify(cancelled=self._log_analysis.cancel(data["jobId"]))
+        elif command == "getStatsCache":
+            return flask.jsonify(self._log_analysis.cache.info())
+        elif command == "liveStats":
+            # enable starts or renews the lease of the client
+            live_stats = get_live_stats(self, self.get_request_printer(data))
+            if data.get("enable", True):
+                return flask.jsonify(
+                    live=live_stats.subscribe(data["clientId"]),
+                    lease=LiveStats.LEASE,
+                    window=LiveStats.WINDOW
+                )
+            live_stats.unsubscribe(data["clientId"])
+            return flask.jsonify(live=None)
+        elif command == "getLogData":
+            log_file = self.get_log_file(data)
+            offset = max(0, get_int_param(data, "offset", 0))
+            limit = min(
+                max(1, get_int_param(data, "limit", KlipperLogAnalyzer.KlipperLogAnalyzer.LOG_PAGE_SIZE)),
+                MAX_LOG_PAGE_SIZE
+            )
+            log_analyzer = KlipperLogAnalyzer.KlipperLogAnalyzer(log_file)
+            return flask.jsonify(log_analyzer.read_log_file(log_file, offset, limit))
+
+    def get_log_file(self, data):
+        """Return the requested klippy log, aborting if it is not one of the
+        files offered by listLogFiles for the printer.
+        """
+        logpath = get_log_path(self.get_request_printer(data))
+        if not logpath:
+            flask.abort(404, description="The printer has no log file")
+        logpath = os.path.realpath(logpath)
+        log_folder = os.path.dirname(logpath) + os.sep
+        log_file = os.path.realpath(data.get("logFile", ""))
+        if (
+            not log_file.startswith(log_folder)
+            or os.sep in log_file[len(log_folder):]
+            or not os.path.basename(log_file).startswith(os.path.basename(logpath))
+            or not os.path.isfile(log_file)
+        ):
+            flask.abort(400, description="Invalid request, unknown log file")
+        return log_file
+
+    def is_blueprint_protected(self):
+        return False
+
+    def route_hook(self, server_routes, *args, **kwargs):
+        from octoprint.server.util.tornado import LargeResponseHandler, path_validation_factory
+        from octoprint.util import is_hidden_path
+        configpath = os.path.expanduser(
+                        self._settings.get(["configuration", "config_path"])
+                    )
+
+        return [
+            (r"/download/configs/(.*)", LargeResponseHandler, dict(path=configpath,
+                                                           as_attachment=True,
+                                                           path_validation=path_validation_factory(lambda path: not is_hidden_path(path),
+                                                                                                   status_code=404)))
+        ]
+
+# API for the printer state
+    # Get the cached state of the printer objects and its version
+    @octoprint.plugin.BlueprintPlugin.route("/printer/state", methods=["GET"])
+    @restricted_access
+    @Permissions.STATUS.require(403)
+    def get_printer_state(self):
+        return flask.jsonify(self._printer_state.snapshot())
+
+# API for Macros
+    # Get the parameters of the macros, compiled from the settings
+    @octoprint.plugin.BlueprintPlugin.route("/macros", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_MACRO.require(403)
+    def get_macros(self):
+        return flask.jsonify(macros = self._macro_cache.schemas())
+
+    # Send a macro with the given parameter values to the printer
+    @octoprint.plugin.BlueprintPlugin.route("/macros/execute", methods=["POST"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_MACRO.require(403)
+    def execute_macro(self):
+        data = flask.request.json or {}
+        compiled = self._macro_cache.get(data.get("id"))
+        if compiled is None:
+            flask.abort(404, description="Unknown macro {}".format(data.get("id")))
+        values = data.get("values", [])
+        if not isinstance(values, list):
+            flask.abort(400, description="Invalid request, values must be a list")
+        lines, errors = expand_macro(compiled, values)
+        if errors:
+            return flask.make_response(flask.jsonify(errors = errors), 400)
+        if not self._printer.is_operational():
+            flask.abort(409, description="The printer is not connected")
+        self._printer.commands(lines)
+        log_event(self, "macro_executed", id=data.get("id"), lines=len(lines))
+        return flask.jsonify(commands = lines)
+
+# API for the message log
+    # Get a page of the latest log messages
+    @octoprint.plugin.BlueprintPlugin.route("/log", methods=["GET"])
+    @restricted_access
+    @Permissions.MONITOR_TERMINAL.require(403)
+    def get_log_messages(self):
+        data = flask.request.values
+        return flask.jsonify(self._message_bus.history(
+            before=get_int_param(data, "before"),
+            limit=get_int_param(data, "limit", 100)
+        ))
+
+    # Clear the kept log messages
+    @octoprint.plugin.BlueprintPlugin.route("/log", methods=["DELETE"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def clear_log_messages(self):
+        self._message_bus.clear_history()
+        return NO_CONTENT
+
+# API for Backups
+    # Get Content of a Backupconfig
+    @octoprint.plugin.BlueprintPlugin.route("/backup/<backup_id>", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def get_backup(self, backup_id):
+        response = cfgUtils.get_backup(self, self.get_request_printer(), backup_id)
+        return flask.jsonify(response = response)
+
+    # Download a Backupconfig
+    @octoprint.plugin.BlueprintPlugin.route("/backup/<backup_id>/download", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def download_backup(self, backup_id):
+        store = get_backup_store(self, self.get_request_printer())
+        entry = store.get(backup_id)
+        if entry is None:
+            flask.abort(404)
+        response = flask.make_response(store.read(backup_id))
+        response.headers["Content-Type"] = "text/plain; charset=utf-8"
+        response.headers["Content-Disposition"] = 'attachment; filename="{}"'.format(
+            os.path.basename(entry["name"]))
+        return response
+
+    # Delete a Backupconfig
+    @octoprint.plugin.BlueprintPlugin.route("/backup/<backup_id>", methods=["DELETE"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def delete_backup(self, backup_id):
+        try:
+            get_backup_store(self, self.get_request_printer()).delete(backup_id)
+        except Exception:
+            self._octoklipper_logger.exception("Could not delete backup {}".format(backup_id))
+            raise
+        return NO_CONTENT
+
+    # Get a list of all backed up configfiles
+    @octoprint.plugin.BlueprintPlugin.route("/backup/list", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def list_backups(self):
+        files, total = self.list_files(
+            cfgUtils.list_backups, BackupStore.SORTINGS, self.get_request_printer())
+        return flask.jsonify(files = files, total = total)
+
+    # restore a backed up configfile
+    @octoprint.plugin.BlueprintPlugin.route("/backup/restore/<backup_id>", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def restore_backup(self, backup_id):
+        return flask.jsonify(restored = cfgUtils.restore_backup(self, self.get_request_printer(), backup_id))
+
+# API for Configs
+    # Download a Configfile of a printer besides the default one, whose
+    # files are served by the route hook
+    @octoprint.plugin.BlueprintPlugin.route("/download/printers/<printer_id>/<path:filename>", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def download_config(self, printer_id, filename):
+        printer = get_printer(self, printer_id)
+        if printer is None:
+            flask.abort(404)
+        cfg_path = os.path.realpath(get_config_path(printer))
+        full_path = os.path.realpath(os.path.join(cfg_path, filename))
+        if (
+            not full_path.startswith(cfg_path + os.sep)
+            or not os.path.isfile(full_path)
+            or is_hidden_path(full_path)
+        ):
+            flask.abort(404)
+        return flask.send_file(full_path, as_attachment=True)
+
+    # Get Content of a Configfile
+    # (included files may be in subfolders)
+    @octoprint.plugin.BlueprintPlugin.route("/config/<path:filename>", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def get_config(self, filename):
+        cfg_path = os.path.realpath(get_config_path(self.get_request_printer()))
+        full_path = os.path.realpath(os.path.join(cfg_path, filename))
+        if not full_path.startswith(cfg_path + os.sep):
+            flask.abort(404)
+        response = cfgUtils.get_cfg(self, full_path)
+        return flask.jsonify(response = response)
+
+    # Delete a Configfile
+    @octoprint.plugin.BlueprintPlugin.route("/config/<path:filename>", methods=["DELETE"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def delete_config(self, filename):
+        cfg_path = os.path.realpath(get_config_path(self.get_request_printer()))
+        full_path = os.path.realpath(os.path.join(cfg_path, filename))
+        if (
+            full_path.startswith(cfg_path + os.sep)
+            and os.path.exists(full_path)
+            and not is_hidden_path(full_path)
+        ):
+            try:
+                os.remove(full_path)
+            except Exception:
+                self._octoklipper_logger.exception("Could not delete {}".format(filename))
+                raise
+            cfgUtils.invalidate_file_indexes(self)
+        return NO_CONTENT
+
+    # Get a list of all configfiles
+    @octoprint.plugin.BlueprintPlugin.route("/config/list", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def list_configs(self):
+        printer = self.get_request_printer()
+        files, total = self.list_files(cfgUtils.list_cfg_files, cfgUtils.FILE_SORTINGS, printer)
+        path = get_config_path(printer)
+        return flask.jsonify(files = files, total = total, path = path, max_upload_size = MAX_UPLOAD_SIZE)
+
+    def list_files(self, lister, sortings, printer):
+        """List config or backup files of a printer with the optional query
+        parameters sort (name, date or size), offset and limit.
+        """
+        data = flask.request.values
+        sort = data.get("sort")
+        if sort is not None and sort not in sortings:
+            flask.abort(400, description="Invalid request, unknown sort {}".format(sort))
+        offset = get_int_param(data, "offset", 0)
+        limit = get_int_param(data, "limit")
+        if offset < 0 or (limit is not None and limit < 0):
+            flask.abort(400, description="Invalid request, offset and limit must not be negative")
+        return lister(self, printer, sort=sort, offset=offset, limit=limit)
+
+    # Get the include tree and the merged section index of a config
+    @octoprint.plugin.BlueprintPlugin.route("/config/includes", methods=["GET"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def get_config_includes(self):
+        return flask.jsonify(cfgUtils.get_include_graph(
+            self, self.get_request_printer(), flask.request.values.get("base")))
+
+    # compare two versions of a config, each a configfile, a backup or content
+    @octoprint.plugin.BlueprintPlugin.route("/config/diff", methods=["POST"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def diff_config(self):
+        data = flask.request.json or {}
+        diff_format = data.get("format", "sections")
+        if diff_format not in configDiff.FORMATS:
+            flask.abort(400, description="Invalid request, unknown format {}".format(diff_format))
+        context = get_int_param(data, "context", configDiff.CONTEXT)
+        if context < 0:
+            flask.abort(400, description="Invalid request, context must not be negative")
+        result = cfgUtils.diff_cfg(
+            self, self.get_request_printer(), data.get("from"), data.get("to"), diff_format, context)
+        return flask.jsonify(result)
+
+    # check syntax of a given data
+    @octoprint.plugin.BlueprintPlugin.route("/config/check", methods=["POST"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def check_config(self):
+        data = flask.request.json
+        data_to_check = data.get("DataToCheck", "")
+        result = cfgUtils.check_cfg(
+            self, self.get_request_printer(), data_to_check, data.get("filename") or None, bool(data.get("quiet")))
+        return flask.jsonify(result)
+
+    # save a configfile
+    @octoprint.plugin.BlueprintPlugin.route("/config/save", methods=["POST"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def save_config(self):
+        data = flask.request.json
+        filename = data.get("filename", [])
+        if filename == []:
+            flask.abort(
+                400,
+                description="Invalid request, the filename is not set",
+            )
+        Filecontent = data.get("DataToSave", [])
+        saved = cfgUtils.save_cfg(self, self.get_request_printer(), Filecontent, filename)
+        if saved == True:
+            send_message(self, type = "reload", subtype = "configlist")
+        return flask.jsonify(saved = saved)
+
+    # restart klipper
+    @octoprint.plugin.BlueprintPlugin.route("/restart", methods=["POST"])
+    @restricted_access
+    @Permissions.PLUGIN_KLIPPER_CONFIG.require(403)
+    def restart_klipper(self):
+        reload_command = self._settings.get(["configuration", "reload_command"])
+
+        if reload_command != "manually":
+
+            # Restart klippy to reload config
+            self._printer.commands(reload_command)
+            log_info(self, "Restarting Klipper.")
+        return flask.jsonify(command = reload_command)
+# APIs end
+
+    def set_plugin_settings_overlay(self):
+        command = self._settings.get(["configuration", "restart_service_command"])
+
+        __plugin_settings_overlay__['system']['actions'][0]['command'] = command
+        __plugin_settings_overlay__['system']['actions'][0]['confirm'] = '<h3><center><b>' + gettext("You are about to restart Klipper!") + '<br>' + gettext("This will stop ongoing prints!") + '</b></center></h3><br>Command = "' + command + '"'
+
+    def get_update_information(self):
+        return dict(
+            klipper=dict(
+                displayName=self._plugin_name,
+                displayVersion=self._plugin_version,
+                type="github_release",
+                current=self._plugin_version,
+                user="thelastWallE",
+                repo="OctoprintKlipperPlugin",
+                pip="https://github.com/thelastWallE/OctoprintKlipperPlugin/archive/{target_version}.zip",
+                stable_branch=dict(
+                    name="Stable",
+                    branch="master",
+                    comittish=["master"]
+                ),
+                prerelease_branches=[
+                    dict(
+                        name="Release Candidate",
+                        branch="rc",
+                        comittish=["rc", "master"]
+                    )]
+            )
+        )
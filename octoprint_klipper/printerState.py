@@ -0,0 +1,148 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
+
+from octoprint_klipper.util import send_message
+
+# the printer objects and fields that are cached
+FIELDS = {
+    "webhooks": ("state", "state_message"),
+    "toolhead": ("position", "homed_axes"),
+    "extruder": ("temperature", "target"),
+    "heater_bed": ("temperature", "target"),
+    "bed_mesh": ("profile_name",),
+    "print_stats": ("state", "filename", "print_duration", "message"),
+}
+
+# the decimals kept of values that change with every update, so noise
+# below what is shown causes no delta
+PRECISION = {
+    "temperature": 1,
+    "target": 1,
+    "position": 2,
+    "print_duration": 0,
+}
+
+
+def _normalize(field, value):
+    digits = PRECISION.get(field)
+    if digits is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [round(v, digits) if isinstance(v, float) else v for v in value]
+    if isinstance(value, float):
+        return round(value, digits)
+    return value
+
+
+def merge_deltas(pending, delta):
+    """Merge a delta into a delta that has not been sent yet.
+
+    Both are payloads of the "printer_state" / "delta" message, the
+    result takes the state from the base of the first to the version of
+    the second.
+    """
+    if delta["reset"]:
+        return dict(delta, base=pending["base"])
+    changes = dict((name, dict(fields)) for name, fields in pending["changes"].items())
+    for name, fields in delta["changes"].items():
+        changes.setdefault(name, {}).update(fields)
+    return dict(base=pending["base"], version=delta["version"],
+                reset=pending["reset"], changes=changes)
+
+
+class PrinterState(object):
+    """Cache of the state of the Klipper printer objects in FIELDS.
+
+    Any backend feeds it with update(), with the changed fields of the
+    objects like the status of the Klippy API. Only the fields that really
+    changed are sent to the frontend as plugin message "printer_state" /
+    "delta" with the payload:
+
+        base: the version the delta applies to
+        version: the version after the delta
+        reset: if the state is cleared before the changes are applied
+        changes: object name to changed fields
+
+    Clients load snapshot() when they connect and apply the deltas with a
+    version above the one of the snapshot. A delta with a base above the
+    version of a client means it missed one, and it loads the snapshot
+    again.
+    """
+
+    def __init__(self, plugin):
+        self._plugin = plugin
+        self._state = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def update(self, changes):
+        """Merge changed fields into the state.
+
+        Args:
+            changes (dict): Object name to fields, objects and fields not in
+                FIELDS are ignored.
+
+        Returns:
+            dict: The fields that changed, empty if none did.
+        """
+        delta = {}
+        with self._lock:
+            for name, fields in changes.items():
+                cached = FIELDS.get(name)
+                if cached is None:
+                    continue
+                current = self._state.setdefault(name, {})
+                for field, value in fields.items():
+                    if field not in cached:
+                        continue
+                    value = _normalize(field, value)
+                    if field not in current or current[field] != value:
+                        current[field] = value
+                        delta.setdefault(name, {})[field] = value
+            if delta:
+                self._post(reset=False, changes=delta)
+        return delta
+
+    def clear(self):
+        """Forget the state, after the backend lost the printer."""
+        with self._lock:
+            if not self._state:
+                return
+            self._state = {}
+            self._post(reset=True, changes={})
+
+    def _post(self, reset, changes):
+        # posted under the lock, so the deltas reach the bus in order
+        self._version += 1
+        send_message(self._plugin, type="printer_state", subtype="delta", payload=dict(
+            base=self._version - 1,
+            version=self._version,
+            reset=reset,
+            changes=changes
+        ))
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                version=self._version,
+                state=dict((name, dict(fields)) for name, fields in self._state.items())
+            )
+
+    def get(self, name, field, default=None):
+        with self._lock:
+            return self._state.get(name, {}).get(field, default)
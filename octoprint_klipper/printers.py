@@ -0,0 +1,119 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import re
+
+from octoprint_klipper.backupStore import BackupStore
+from octoprint_klipper.liveStats import LiveStats
+
+DEFAULT_PRINTER = "default"
+
+# ids are used as folder names
+_PRINTER_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def get_printers(self):
+    """Return the Klipper printers managed by the plugin.
+
+    The default printer is the one of the connection and configuration
+    settings, more printers are in the setting printers. Printers without
+    a valid id or a config folder are skipped.
+
+    Returns:
+        list: For every printer a dict with id, name, port, config_path,
+            baseconfig and logpath.
+    """
+    printers = [dict(
+        id=DEFAULT_PRINTER,
+        name="Default",
+        port=self._settings.get(["connection", "port"]),
+        config_path=self._settings.get(["configuration", "config_path"]),
+        baseconfig=self._settings.get(["configuration", "baseconfig"]),
+        logpath=self._settings.get(["configuration", "logpath"]),
+    )]
+    ids = set([DEFAULT_PRINTER])
+    for printer in self._settings.get(["printers"]) or []:
+        printer_id = printer.get("id") or ""
+        if not _PRINTER_ID.match(printer_id) or printer_id in ids or not printer.get("config_path"):
+            continue
+        ids.add(printer_id)
+        printers.append(dict(
+            id=printer_id,
+            name=printer.get("name") or printer_id,
+            port=printer.get("port") or "",
+            config_path=printer["config_path"],
+            baseconfig=printer.get("baseconfig") or "printer.cfg",
+            logpath=printer.get("logpath") or "",
+        ))
+    return printers
+
+
+def get_printer(self, printer_id=None):
+    """Return a printer of get_printers, the default one without an id,
+    or None if there is no printer with the id.
+    """
+    printer_id = printer_id or DEFAULT_PRINTER
+    for printer in get_printers(self):
+        if printer["id"] == printer_id:
+            return printer
+    return None
+
+
+def get_config_path(printer):
+    return os.path.expanduser(printer["config_path"])
+
+
+def get_log_path(printer):
+    return os.path.expanduser(printer["logpath"])
+
+
+def get_backup_store(self, printer):
+    """Return the backup store of a printer.
+
+    The default printer keeps the store in the backups folder, the other
+    printers get their own store in backups/printers/<id>, with the same
+    policy.
+    """
+    if printer["id"] == DEFAULT_PRINTER:
+        return self._backup_store
+    with self._printers_lock:
+        store = self._backup_stores.get(printer["id"])
+        if store is None:
+            store = BackupStore(os.path.join(
+                self.get_plugin_data_folder(), "backups", "printers", printer["id"]))
+            store.set_policy(**self.get_backup_policy())
+            self._backup_stores[printer["id"]] = store
+        return store
+
+
+def get_live_stats(self, printer):
+    """Return the LiveStats following the klippy.log of a printer.
+
+    They only run a thread while a client follows the log.
+    """
+    with self._printers_lock:
+        live_stats = self._live_stats.get(printer["id"])
+        if live_stats is None:
+            printer_id = printer["id"]
+            live_stats = LiveStats(
+                self,
+                # the log path may change in the settings
+                lambda: get_log_path(get_printer(self, printer_id) or printer),
+                printer_id
+            )
+            self._live_stats[printer_id] = live_stats
+        return live_stats
@@ -8,6 +8,22 @@
   var OctoKlipperClient = function (base) {
     this.base = base;
     this.url = this.base.getBlueprintUrl("klipper");
+    // the Klipper printer of the config, backup and log requests,
+    // the default printer if not set
+    this.printer = undefined;
+  };
+
+  OctoKlipperClient.prototype.setPrinter = function (printer) {
+    this.printer = printer;
+  };
+
+  // the url of a request for the selected printer
+  OctoKlipperClient.prototype.printerUrl = function (path, params) {
+    params = _.extend({}, params);
+    if (this.printer) {
+      params.printer = this.printer;
+    }
+    return this.url + path + (_.isEmpty(params) ? "" : "?" + $.param(params));
   };
 
   OctoKlipperClient.prototype.restartKlipper = function (opts) {
@@ -15,29 +31,37 @@
   };
 
   OctoKlipperClient.prototype.getCfg = function (config, opts) {
-    return this.base.get(this.url + "config/" + config, opts);
+    return this.base.get(this.printerUrl("config/" + config), opts);
   };
 
   OctoKlipperClient.prototype.getCfgBak = function (backup, opts) {
-    return this.base.get(this.url + "backup/" + backup, opts);
+    return this.base.get(this.printerUrl("backup/" + backup), opts);
   };
 
-  OctoKlipperClient.prototype.listCfg = function (opts) {
-    return this.base.get(this.url + "config/list", opts);
+  var listParams = function (query) {
+    // optional sort ("name", "date" or "size"), offset and limit
+    return _.pick(query || {}, ["sort", "offset", "limit"]);
   };
 
-  OctoKlipperClient.prototype.listCfgBak = function (opts) {
-    return this.base.get(this.url + "backup/list", opts);
+  OctoKlipperClient.prototype.listCfg = function (opts, query) {
+    return this.base.get(this.printerUrl("config/list", listParams(query)), opts);
   };
 
-  OctoKlipperClient.prototype.checkCfg = function (content, opts) {
-    content = content || [];
+  OctoKlipperClient.prototype.listCfgBak = function (opts, query) {
+    return this.base.get(this.printerUrl("backup/list", listParams(query)), opts);
+  };
+
+  OctoKlipperClient.prototype.checkCfg = function (content, opts, filename, quiet) {
+    content = content || "";
 
+    // with a filename only the sections changed since the last check are validated again
     var data = {
       DataToCheck: content,
+      filename: filename || "",
+      quiet: quiet || false,
     };
 
-    return this.base.postJson(this.url + "config/check", data, opts);
+    return this.base.postJson(this.printerUrl("config/check"), data, opts);
   };
 
   OctoKlipperClient.prototype.saveCfg = function (content, filename, opts) {
@@ -49,19 +73,65 @@
       filename: filename,
     };
 
-    return this.base.postJson(this.url + "config/save", data, opts);
+    return this.base.postJson(this.printerUrl("config/save"), data, opts);
+  };
+
+  OctoKlipperClient.prototype.getCfgIncludes = function (base, opts) {
+    return this.base.get(this.printerUrl("config/includes", base ? { base: base } : {}), opts);
+  };
+
+  OctoKlipperClient.prototype.diffCfg = function (from, to, format, opts) {
+    // from and to: {config: filename}, {backup: id} or {content: text}
+    var data = {
+      from: from,
+      to: to,
+      format: format || "sections",
+    };
+
+    return this.base.postJson(this.printerUrl("config/diff"), data, opts);
   };
 
   OctoKlipperClient.prototype.deleteCfg = function (config, opts) {
-    return this.base.delete(this.url + "config/" + config, opts);
+    return this.base.delete(this.printerUrl("config/" + config), opts);
   };
 
   OctoKlipperClient.prototype.deleteBackup = function (backup, opts) {
-    return this.base.delete(this.url + "backup/" + backup, opts);
+    return this.base.delete(this.printerUrl("backup/" + backup), opts);
   };
 
   OctoKlipperClient.prototype.restoreBackup = function (backup, opts) {
-    return this.base.get(this.url + "backup/restore/" + backup, opts);
+    return this.base.get(this.printerUrl("backup/restore/" + backup), opts);
+  };
+
+  OctoKlipperClient.prototype.getMacros = function (opts) {
+    return this.base.get(this.url + "macros", opts);
+  };
+
+  OctoKlipperClient.prototype.executeMacro = function (id, values, opts) {
+    // id as returned by getMacros, values of the parameters in their order,
+    // missing ones take the default
+    var data = {
+      id: id,
+      values: values || [],
+    };
+
+    return this.base.postJson(this.url + "macros/execute", data, opts);
+  };
+
+  OctoKlipperClient.prototype.getPrinterState = function (opts) {
+    return this.base.get(this.url + "printer/state", opts);
+  };
+
+  OctoKlipperClient.prototype.getLog = function (before, limit, opts) {
+    var query = "?limit=" + (limit || 100);
+    if (before !== undefined) {
+      query += "&before=" + before;
+    }
+    return this.base.get(this.url + "log" + query, opts);
+  };
+
+  OctoKlipperClient.prototype.clearLog = function (opts) {
+    return this.base.delete(this.url + "log", opts);
   };
 
   OctoKlipperClient.prototype.restoreBackupFromUpload = function (file, data) {
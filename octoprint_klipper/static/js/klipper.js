@@ -35,7 +35,65 @@ $(function () {
     self.shortStatus_navbar = ko.observable();
     self.shortStatus_navbar_hover = ko.observable();
     self.shortStatus_sidebar = ko.observable();
-    self.logMessages = ko.observableArray();
+    self.printerSummary = ko.observable("");
+
+    // the Klipper printers, the default one of the connection and
+    // configuration settings first
+    self.klipperPrinters = ko.pureComputed(function () {
+      var klipper = self.settings.settings.plugins.klipper;
+      var printers = [{
+        id: "default",
+        name: gettext("Default"),
+        port: klipper.connection.port(),
+        baseconfig: klipper.configuration.baseconfig(),
+      }];
+      _.each(ko.unwrap(klipper.printers), function (printer) {
+        var id = ko.unwrap(printer.id);
+        if (id && id != "default") {
+          printers.push({
+            id: id,
+            name: ko.unwrap(printer.name) || id,
+            port: ko.unwrap(printer.port),
+            baseconfig: ko.unwrap(printer.baseconfig) || "printer.cfg",
+          });
+        }
+      });
+      return printers;
+    });
+    self.selectedKlipperPrinter = ko.observable("default");
+    self.selectedKlipperPrinter.subscribe(function (id) {
+      // config, backup and log requests are for the selected printer
+      OctoPrint.plugins.klipper.setPrinter(id == "default" ? undefined : id);
+      var printer = self.currentKlipperPrinter();
+      if (printer.port && self.connectionState.isErrorOrClosed()) {
+        self.connectionState.selectedPort(printer.port);
+      }
+    });
+    self.currentKlipperPrinter = function () {
+      return _.find(self.klipperPrinters(), { id: self.selectedKlipperPrinter() }) || self.klipperPrinters()[0];
+    };
+    self.klipperPrinters.subscribe(function (printers) {
+      // the selected printer was removed in the settings
+      if (!_.find(printers, { id: self.selectedKlipperPrinter() })) {
+        self.selectedKlipperPrinter("default");
+      }
+    });
+    // the printer objects cached by the plugin, kept up to date with its deltas
+    self.printerState = {};
+    self.printerStateVersion = undefined;
+    self.printerStateLoading = false;
+    self.printerStateQueue = [];
+    // all kept messages, only the ones in view are rendered
+    self.logMessages = [];
+    self.visibleLogMessages = ko.observableArray();
+    self.logPaddingTop = ko.observable(0);
+    self.logPaddingBottom = ko.observable(0);
+    self.logElement = undefined;
+    self.logFirstId = undefined;
+    self.logLoading = false;
+    self.logRenderPending = false;
+    self.logItemHeight = 24;
+    self.logOverscan = 200;
 
     self.popup = undefined;
 
@@ -134,26 +192,49 @@ $(function () {
       });
     };
 
-    self.executeMacro = function (macro) {
-      var paramObjRegex = /{(.*?)}/g;
+    // the macros compiled by the server, loaded once until the settings change
+    self.compiledMacros = undefined;
 
+    self.loadCompiledMacros = function () {
+      if (self.compiledMacros === undefined) {
+        self.compiledMacros = OctoPrint.plugins.klipper.getMacros().then(function (response) {
+          return response.macros;
+        });
+        self.compiledMacros.fail(function () {
+          self.compiledMacros = undefined;
+        });
+      }
+      return self.compiledMacros;
+    };
+
+    self.onEventSettingsUpdated = function () {
+      self.compiledMacros = undefined;
+    };
+
+    self.executeMacro = function (macro) {
       if (!self.hasRight("MACRO")) return;
 
-      if (macro.macro().match(paramObjRegex) == null) {
-        OctoPrint.control.sendGcode(
-          // Use .split to create an array of strings which is sent to
-          // OctoPrint.control.sendGcode instead of a single string.
-          macro.macro().split(/\r\n|\r|\n/)
-        );
-      } else {
-        self.paramMacroViewModel.process(macro);
+      // names need not be unique, the compiled macros are in the order of the settings
+      var index = self.settings.settings.plugins.klipper.macros().indexOf(macro);
+      self.loadCompiledMacros().done(function (macros) {
+        var compiled = macros[index];
+        if (compiled === undefined || compiled.name !== macro.name()) return;
+
+        if (compiled.params.length == 0) {
+          OctoPrint.plugins.klipper.executeMacro(compiled.id).fail(function () {
+            self.showPopUp("error", gettext("Macro"),
+              _.sprintf(gettext("Could not run %(name)s."), { name: _.escape(compiled.name) }));
+          });
+        } else {
+          self.paramMacroViewModel.process(compiled);
 
-        var dialog = $("#klipper_macro_dialog");
-        dialog.modal({
-          show: "true",
-          backdrop: "static",
-        });
-      }
+          var dialog = $("#klipper_macro_dialog");
+          dialog.modal({
+            show: "true",
+            backdrop: "static",
+          });
+        }
+      });
     };
 
     self.navbarClicked = function () {
@@ -173,12 +254,39 @@ $(function () {
     };
 
     self.onAfterBinding = function () {
-      self.connectionState.selectedPort(
-        self.settings.settings.plugins.klipper.connection.port()
-      );
+      self.connectionState.selectedPort(self.currentKlipperPrinter().port);
+      self.logElement = $("#tab_plugin_klipper_main .plugin-klipper-log")[0];
+      if (self.loginState.loggedIn()) {
+        self.loadLogHistory();
+        self.loadPrinterState();
+      }
+    };
+
+    self.onUserLoggedIn = function () {
+      self.loadLogHistory();
+      self.loadPrinterState();
+    };
+
+    self.onDataUpdaterReconnect = function () {
+      // the server may have restarted with a new state
+      if (self.loginState.loggedIn()) {
+        self.loadPrinterState();
+      }
+    };
+
+    self.onAfterTabChange = function (current) {
+      if (current == "#tab_plugin_klipper_main") {
+        self.renderLog();
+      }
     };
 
     self.onDataUpdaterPluginMessage = function (plugin, data) {
+      if (plugin == "klipper" && data.type == "batch") {
+        data.payload.forEach(function (message) {
+          self.onDataUpdaterPluginMessage(plugin, message);
+        });
+        return;
+      }
 
       if (plugin == "klipper") {
         switch (data.type) {
@@ -193,8 +301,14 @@ $(function () {
           case "status":
             self.shortStatus(data.payload, data.subtype);
             break;
+          case "stats":
+            // handled by the graph dialog
+            break;
+          case "printer_state":
+            self.applyPrinterDelta(data.payload);
+            break;
           default:
-            self.logMessage(data.time, data.subtype, data.payload);
+            self.logMessage(data.time, data.subtype, data.payload, data.id);
             self.shortStatus(data.payload, data.subtype)
             self.consoleMessage(data.subtype, data.payload);
         }
@@ -218,7 +332,89 @@ $(function () {
     };
 
 
-    self.logMessage = function (timestamp, type = "info", message) {
+    self.loadPrinterState = function () {
+      if (self.printerStateLoading) return;
+      self.printerStateLoading = true;
+      self.printerStateQueue = [];
+      OctoPrint.plugins.klipper.getPrinterState().done(function (snapshot) {
+        self.printerState = snapshot.state;
+        self.printerStateVersion = snapshot.version;
+        self.printerStateChanged(snapshot.state);
+      }).always(function () {
+        var queue = self.printerStateQueue;
+        self.printerStateLoading = false;
+        self.printerStateQueue = [];
+        queue.forEach(self.applyPrinterDelta);
+      });
+    };
+
+    self.applyPrinterDelta = function (delta) {
+      if (self.printerStateLoading) {
+        // deltas sent while the snapshot loads may be newer than it
+        self.printerStateQueue.push(delta);
+        return;
+      }
+      if (self.printerStateVersion === undefined || delta.version <= self.printerStateVersion) {
+        return;
+      }
+      if (delta.base > self.printerStateVersion) {
+        // a delta was missed
+        self.loadPrinterState();
+        return;
+      }
+      if (delta.reset) {
+        self.printerState = {};
+      }
+      _.each(delta.changes, function (fields, name) {
+        self.printerState[name] = _.extend(self.printerState[name] || {}, fields);
+      });
+      self.printerStateVersion = delta.version;
+      self.printerStateChanged(delta.changes);
+    };
+
+    self.printerStateChanged = function (changes) {
+      var webhooks = changes.webhooks || {};
+      var stats = changes.print_stats || {};
+      if (webhooks.state_message) {
+        self.shortStatus(webhooks.state_message.trim(), "info");
+      } else if (stats.message) {
+        self.shortStatus(stats.message, "info");
+      } else if (stats.state) {
+        var filename = self.printerState.print_stats.filename;
+        self.shortStatus("Klipper: " + stats.state + (filename ? " " + filename : ""), "info");
+      }
+      self.printerSummary(self.summarizePrinterState(self.printerState));
+    };
+
+    self.summarizePrinterState = function (state) {
+      var lines = [];
+      var toolhead = state.toolhead || {};
+      if (toolhead.position) {
+        lines.push(
+          _.escape(gettext("Homed")) + ": " + (_.escape(toolhead.homed_axes) || "-") + " &middot; " +
+          _.map(["X", "Y", "Z"], function (axis, i) {
+            return axis + " " + toolhead.position[i].toFixed(2);
+          }).join(" ")
+        );
+      }
+      var heaters = [];
+      _.each([["extruder", gettext("Extruder")], ["heater_bed", gettext("Bed")]], function (heater) {
+        var fields = state[heater[0]];
+        if (fields && fields.temperature !== undefined && fields.temperature !== null) {
+          heaters.push(_.escape(heater[1]) + " " + fields.temperature.toFixed(1) + "/" +
+            (fields.target || 0).toFixed(0) + "&deg;C");
+        }
+      });
+      if (heaters.length) {
+        lines.push(heaters.join(" &middot; "));
+      }
+      if (state.bed_mesh && state.bed_mesh.profile_name) {
+        lines.push(_.escape(gettext("Mesh")) + ": " + _.escape(state.bed_mesh.profile_name));
+      }
+      return lines.join("<br />");
+    };
+
+    self.logMessage = function (timestamp, type = "info", message, id) {
 
       if (!timestamp) {
         var today = new Date();
@@ -230,18 +426,153 @@ $(function () {
         self.showPopUp(type, "Error:", message);
       }
 
-      self.logMessages.push({
+      self.addLogMessages([self.logEntry(id, timestamp, type, message)], false);
+    };
+
+    self.logEntry = function (id, timestamp, type, message) {
+      return {
+        id: id,
         time: timestamp,
         type: type,
         msg: message.replace(/\n/gi, "<br />"),
+        height: undefined
+      };
+    };
+
+    self.logCapacity = function () {
+      return parseInt(self.settings.settings.plugins.klipper.configuration.log_history()) || 500;
+    };
+
+    self.lastLogId = function () {
+      for (var i = self.logMessages.length - 1; i >= 0; i--) {
+        if (self.logMessages[i].id !== undefined) {
+          return self.logMessages[i].id;
+        }
+      }
+      return undefined;
+    };
+
+    self.addLogMessages = function (entries, prepend) {
+      var el = self.logElement;
+      var atBottom = el && el.scrollTop + el.clientHeight >= el.scrollHeight - 5;
+      var lastId = self.lastLogId();
+
+      if (prepend) {
+        self.logMessages = entries.concat(self.logMessages);
+      } else {
+        entries.forEach(function (entry) {
+          // skip messages that already came with the history
+          if (entry.id === undefined || lastId === undefined || entry.id > lastId) {
+            self.logMessages.push(entry);
+          }
+        });
+      }
+      var excess = self.logMessages.length - self.logCapacity();
+      if (excess > 0) {
+        self.logMessages.splice(0, excess);
+      }
+      self.renderLog();
+      if (atBottom && !prepend) {
+        el.scrollTop = el.scrollHeight;
+        self.renderLog();
+      }
+    };
+
+    self.loadLogHistory = function () {
+      if (self.logLoading) return;
+      if (!self.loginState.hasPermission(self.access.permissions.MONITOR_TERMINAL)) return;
+      var before = self.logMessages.length ? self.logMessages[0].id : undefined;
+      var limit = Math.min(100, self.logCapacity() - self.logMessages.length);
+      if (limit <= 0 || (self.logMessages.length && before === undefined)) return;
+
+      self.logLoading = true;
+      OctoPrint.plugins.klipper.getLog(before, limit).done(function (response) {
+        self.logFirstId = response.first_id;
+        var entries = response.messages.map(function (data) {
+          return self.logEntry(data.id, data.time, data.subtype, data.payload);
+        });
+        var el = self.logElement;
+        var oldHeight = el ? el.scrollHeight : 0;
+        self.addLogMessages(entries, before !== undefined);
+        if (el && before !== undefined) {
+          // keep the messages in view where they are
+          el.scrollTop += el.scrollHeight - oldHeight;
+        } else if (el) {
+          el.scrollTop = el.scrollHeight;
+          self.renderLog();
+        }
+      }).always(function () {
+        self.logLoading = false;
+      });
+    };
+
+    self.onLogScroll = function () {
+      if (self.logRenderPending) return;
+      self.logRenderPending = true;
+      window.requestAnimationFrame(function () {
+        self.logRenderPending = false;
+        self.renderLog();
+        if (
+          self.logElement.scrollTop < self.logOverscan &&
+          self.logMessages.length &&
+          self.logMessages[0].id !== undefined &&
+          self.logFirstId !== undefined &&
+          self.logMessages[0].id > self.logFirstId
+        ) {
+          self.loadLogHistory();
+        }
       });
     };
 
+    // Render only the messages around the visible part of the log. Messages
+    // not rendered yet are counted with an estimated height.
+    self.renderLog = function () {
+      var el = self.logElement;
+      if (!el) return;
+      var top = el.scrollTop - self.logOverscan;
+      var bottom = el.scrollTop + el.clientHeight + self.logOverscan;
+      var count = self.logMessages.length;
+      var start = count;
+      var end = count;
+      var paddingTop = 0;
+      var paddingBottom = 0;
+      var y = 0;
+
+      for (var i = 0; i < count; i++) {
+        var height = self.logMessages[i].height || self.logItemHeight;
+        if (start == count && y + height > top) {
+          start = i;
+          paddingTop = y;
+        }
+        if (y >= bottom) {
+          end = i;
+          break;
+        }
+        y += height;
+      }
+      for (i = end; i < count; i++) {
+        paddingBottom += self.logMessages[i].height || self.logItemHeight;
+      }
+      self.logPaddingTop(paddingTop);
+      self.logPaddingBottom(paddingBottom);
+      self.visibleLogMessages(self.logMessages.slice(start, end));
+    };
+
+    self.measureLogItem = function (elements, entry) {
+      var item = $(elements).filter(".log-item");
+      if (item.length) {
+        entry.height = item.outerHeight(true) || undefined;
+      }
+    };
+
     self.consoleMessage = function (type, message) {
       if (
         self.settings.settings.plugins.klipper.configuration.debug_logging() === true
       ) {
-        if (type == "info") {
+        if (typeof message === "object" && message !== null) {
+          // structured debug record
+          console.debug("OctoKlipper : " + message.event, message.fields);
+        } else if (type == "info") {
           console.info("OctoKlipper : " + message);
         } else if (type == "debug") {
           console.debug("OctoKlipper : " + message);
@@ -253,7 +584,10 @@ $(function () {
     };
 
     self.onClearLog = function () {
-      self.logMessages.removeAll();
+      if (!self.loginState.hasPermission(self.access.permissions.PLUGIN_KLIPPER_CONFIG)) return;
+      self.logMessages = [];
+      self.renderLog();
+      OctoPrint.plugins.klipper.clearLog();
     };
 
     self.isActive = function () {
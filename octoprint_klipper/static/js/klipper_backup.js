@@ -48,6 +48,12 @@ $(function () {
       }
     };
 
+    self.klipperViewModel.selectedKlipperPrinter.subscribe(function () {
+      if (self.loginState.loggedIn()) {
+        self.listBakFiles();
+      }
+    });
+
     // initialize list helper
     self.backups = new ItemListHelper(
       "klipperBakFiles",
@@ -97,6 +103,21 @@ $(function () {
       });
     };
 
+    // show the unified diff of a backup against the file it was taken of
+    self.showDiff = function (backup) {
+      if (!self.loginState.hasPermission(self.access.permissions.PLUGIN_KLIPPER_CONFIG)) return;
+
+      OctoPrint.plugins.klipper.diffCfg({backup: backup.file}, {config: backup.name}, "unified")
+        .done(function (response) {
+          var text = response.identical ? gettext("No changes.") : response.unified;
+          $('#klipper_backups_dialog textarea').attr('rows', text.split(/\r\n|\r|\n/).length);
+          self.CfgContent(text);
+        })
+        .fail(function () {
+          self.CfgContent(_.sprintf(gettext("%(name)s does not exist in the config folder."), { name: backup.name }));
+        });
+    };
+
     self.removeCfg = function (backup) {
       if (!self.loginState.hasPermission(self.access.permissions.PLUGIN_KLIPPER_CONFIG)) return;
 
@@ -207,9 +228,7 @@ $(function () {
               true
             );
             self.klipperViewModel.consoleMessage("debug", "restoreCfg: " + filename + " / " + response);
-            self.markedForFileRestore.remove(function (item) {
-              return item.name == filename;
-            });
+            self.markedForFileRestore.remove(filename);
           })
           .fail(function () {
             deferred.notify(_.sprintf(gettext("Restoring of %(filename)s failed, continuing..."), { filename: _.escape(filename) }), false);
@@ -255,9 +274,7 @@ $(function () {
           .deleteBackup(filename)
           .done(function () {
             deferred.notify(_.sprintf(gettext("Deleted %(filename)s..."), { filename: _.escape(filename) }), true);
-            self.markedForFileRestore.remove(function (item) {
-              return item.name == filename;
-            });
+            self.markedForFileRestore.remove(filename);
           })
           .fail(function () {
             deferred.notify(_.sprintf(gettext("Deleting of %(filename)s failed, continuing..."), { filename: _.escape(filename) }), false);
@@ -26,6 +26,7 @@ $(function () {
     self.CfgContent = ko.observable("");
     self.loadedConfig = "";
     self.CfgChangedExtern = false;
+    self.changeMarkers = [];
 
     self.header = OctoPrint.getRequestHeaders({
       "content-type": "application/json",
@@ -42,6 +43,7 @@ $(function () {
 
     self.onShown = function () {
       self.checkExternChange();
+      self.validateBuffer();
       editor.focus();
       self.setEditorDivSize();
     };
@@ -104,6 +106,7 @@ $(function () {
     self.process = function (config) {
       return new Promise(function (resolve) {
         self.loadedConfig = config.content;
+        self.clearChangeMarkers();
         self.CfgFilename(config.file);
         self.CfgContent(config.content);
 
@@ -122,7 +125,53 @@ $(function () {
       });
     };
 
+    self.clearChangeMarkers = function () {
+      if (editor) {
+        self.changeMarkers.forEach(function (marker) {
+          editor.session.removeMarker(marker);
+        });
+      }
+      self.changeMarkers = [];
+    };
+
+    // highlight the lines that differ from the saved file,
+    // the server only returns the line numbers
+    self.showChanges = function () {
+      if (!editor || self.CfgFilename() == "") return;
+
+      OctoPrint.plugins.klipper.diffCfg({config: self.CfgFilename()}, {content: editor.session.getValue()})
+        .done(function (response) {
+          var Range = ace.require("ace/range").Range;
+          self.clearChangeMarkers();
+          response.changed_lines.forEach(function (row) {
+            self.changeMarkers.push(editor.session.addMarker(new Range(row, 0, row, 1), "klipper-changed-line", "fullLine"));
+          });
+          response.removed_at.forEach(function (row) {
+            self.changeMarkers.push(editor.session.addMarker(new Range(row, 0, row, 1), "klipper-removed-line", "fullLine"));
+          });
+          if (response.identical) {
+            self.klipperViewModel.showPopUp("info", gettext("Show Changes"), gettext("No changes against the saved file."));
+          } else {
+            var names = _.map(response.sections, function (section) {
+              return (section.name || gettext("(top)")) + ": " + section.status;
+            });
+            self.klipperViewModel.consoleMessage("debug", "Changed sections: " + names.join(", "));
+            editor.scrollToLine(response.changed_lines.concat(response.removed_at)[0], true, true);
+          }
+          self.editorFocusDelay(500);
+        })
+        .fail(function () {
+          self.klipperViewModel.showPopUp("warning", gettext("Show Changes"), gettext("The file is not saved yet."));
+        });
+    };
+
     self.onDataUpdaterPluginMessage = function (plugin, data) {
+      if (plugin == "klipper" && data.type == "batch") {
+        data.payload.forEach(function (message) {
+          self.onDataUpdaterPluginMessage(plugin, message);
+        });
+        return;
+      }
       //receive from backend after a SAVE_CONFIG
       if (plugin == "klipper" && data.type == "reload" && data.subtype == "config") {
         self.klipperViewModel.consoleMessage("debug", "onDataUpdaterPluginMessage klipper reload baseconfig");
@@ -134,7 +183,7 @@ $(function () {
     self.ConfigChangedAfterSave_Config = function () {
       if (!self.klipperViewModel.hasRight("CONFIG")) return;
 
-      if (self.CfgFilename() == self.settings.settings.plugins.klipper.configuration.baseconfig()) {
+      if (self.CfgFilename() == self.klipperViewModel.currentKlipperPrinter().baseconfig) {
         self.CfgChangedExtern = true;
         self.checkExternChange();
       }
@@ -142,7 +191,7 @@ $(function () {
 
     //check if the config was externally changed and ask for a reload
     self.checkExternChange = function() {
-      var baseconfig = self.settings.settings.plugins.klipper.configuration.baseconfig();
+      var baseconfig = self.klipperViewModel.currentKlipperPrinter().baseconfig;
       if (self.CfgChangedExtern && self.CfgFilename() == baseconfig) {
         if (editordialog.is(":visible")) {
 
@@ -193,8 +242,9 @@ $(function () {
         if (editor.session) {
           self.klipperViewModel.consoleMessage("debug", "checkSyntax started");
 
-          OctoPrint.plugins.klipper.checkCfg(editor.session.getValue())
+          OctoPrint.plugins.klipper.checkCfg(editor.session.getValue(), undefined, self.CfgFilename())
             .done(function (response) {
+              self.showDiagnostics(response.diagnostics);
               if (response.is_syntax_ok == true) {
                 self.klipperViewModel.showPopUp("success", gettext("SyntaxCheck"), gettext("SyntaxCheck OK"));
                 self.editorFocusDelay(1000);
@@ -211,6 +261,30 @@ $(function () {
       });
     };
 
+    // show the errors and warnings of the config check in the gutter
+    self.showDiagnostics = function (diagnostics) {
+      if (!editor) return;
+      editor.session.setAnnotations(_.map(diagnostics, function (diagnostic) {
+        return {
+          row: diagnostic.row,
+          column: diagnostic.column,
+          text: diagnostic.message,
+          type: diagnostic.severity,
+        };
+      }));
+    };
+
+    // check while typing, the server only validates the changed sections again
+    self.validateBuffer = _.debounce(function () {
+      if (!editor || !editordialog.is(":visible")) return;
+      if (self.settings.settings.plugins.klipper.configuration.parse_check() != true) return;
+
+      OctoPrint.plugins.klipper.checkCfg(editor.session.getValue(), undefined, self.CfgFilename(), true)
+        .done(function (response) {
+          self.showDiagnostics(response.diagnostics);
+        });
+    }, 500);
+
     self.saveCfg = function (options) {
       var options = options || {};
       var closing = options.closing || false;
@@ -309,6 +383,7 @@ $(function () {
             self.klipperViewModel.showPopUp("success", gettext("Reload Config"), gettext("File reloaded."));
             self.CfgChangedExtern = false;
             if (editor) {
+              self.clearChangeMarkers();
               editor.session.setValue(response.response.config);
               self.loadedConfig = response.response.config;
               editor.clearSelection();
@@ -352,6 +427,7 @@ $(function () {
       editor.session.on('change', function (delta) {
         self.CfgContent(editor.getValue());
         editor.resize();
+        self.validateBuffer();
       });
     };
 
@@ -371,6 +447,7 @@ $(function () {
           if (response.saved === true) {
             self.klipperViewModel.showPopUp("success", gettext("Save Config"), gettext("File saved."));
             self.loadedConfig = editor.session.getValue(); //set loaded config to current for resetting dirtyEditor
+            self.clearChangeMarkers();
             if (closing) {
               editordialog.modal('hide');
             }
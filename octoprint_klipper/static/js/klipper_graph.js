@@ -29,9 +29,49 @@ function KlipperGraphViewModel(parameters) {
    self.availableLogFiles = ko.observableArray();
    self.logFile = ko.observable();
    self.klippylogFile = ko.observable();
+   self.klippylogNextOffset = ko.observable(0);
+   self.klippylogEof = ko.observable(true);
    self.status = ko.observable();
    self.datasets = ko.observableArray();
    self.datasetFill = ko.observable(false);
+   self.jobId = undefined;
+   self.awaitingJob = false;
+   self.earlyMessages = {};
+   self.progress = ko.observable(0);
+   self.timeWindows = [
+      {name: gettext("Whole log"), seconds: 0},
+      {name: gettext("Last 20 minutes"), seconds: 1200},
+      {name: gettext("Last hour"), seconds: 3600},
+      {name: gettext("Last 4 hours"), seconds: 14400}
+   ];
+   self.timeWindow = ko.observable(0);
+   self.logRange = undefined;
+   self.analyzedLogFile = undefined;
+   self.plot = undefined;
+   self.availableMcus = ko.observableArray();
+   self.selectedMcu = ko.observable();
+   self.showFrequency = ko.observable(false);
+   self.sessions = ko.observableArray();
+   self.sessionRange = undefined;
+   self.live = ko.observable(false);
+   self.liveClientId = Math.random().toString(36).slice(2);
+   self.liveTimer = undefined;
+   self.liveWindow = 600;
+
+   self.live.subscribe(function(enabled) {
+      if (enabled) {
+         self.startLive();
+      } else {
+         self.stopLive();
+      }
+   });
+
+   self.selectedMcu.subscribe(function() {
+      self.drawChart();
+   });
+   self.showFrequency.subscribe(function() {
+      self.drawChart();
+   });
    self.canvas;
    self.canvasContext;
    self.chart;
@@ -53,6 +93,16 @@ function KlipperGraphViewModel(parameters) {
       if(self.loginState.loggedIn()) {
          self.listLogFiles();
       }
+
+      $("#klipper_graph_dialog").on("hidden", function() {
+         self.live(false);
+      });
+      // the logs of the selected printer
+      $("#klipper_graph_dialog").on("shown", function(event) {
+         if (event.target.id == "klipper_graph_dialog") {
+            self.listLogFiles();
+         }
+      });
    }
 
    self.onUserLoggedIn = function(user) {
@@ -67,7 +117,7 @@ function KlipperGraphViewModel(parameters) {
         "headers": self.header,
         "processData": false,
         "dataType": "json",
-        "data": JSON.stringify({command: "listLogFiles"})
+        "data": JSON.stringify({command: "listLogFiles", printer: OctoPrint.plugins.klipper.printer})
       }
 
       $.ajax(settings).done(function (response) {
@@ -98,7 +148,8 @@ function KlipperGraphViewModel(parameters) {
       return moment(val, "X");
    }
 
-   self.loadData = function() {
+   self.loadLogData = function(append) {
+      var offset = append ? self.klippylogNextOffset() : 0;
       var settings = {
         "crossDomain": true,
         "url": self.apiUrl,
@@ -108,105 +159,459 @@ function KlipperGraphViewModel(parameters) {
         "dataType": "json",
         "data": JSON.stringify(
            {
-              command: "getStats",
-              logFile: self.logFile()
+              command: "getLogData",
+              printer: OctoPrint.plugins.klipper.printer,
+              logFile: self.logFile(),
+              offset: offset
            }
         )
       }
 
+      $.ajax(settings).done(function (response) {
+         if (append) {
+            self.klippylogFile(self.klippylogFile() + response.data);
+         } else {
+            self.klippylogFile(response.data);
+         }
+         self.klippylogNextOffset(response.next_offset);
+         self.klippylogEof(response.eof);
+      });
+   }
+
+   self.loadMoreLogData = function() {
+      self.loadLogData(true);
+   }
+
+   self.getStatsRequest = function() {
+      var request = {
+         command: "getStats",
+         printer: OctoPrint.plugins.klipper.printer,
+         logFile: self.logFile(),
+         // two points per pixel are enough for the chart
+         maxPoints: Math.max(500, self.canvas.width * 2)
+      };
+
+      if (self.sessionRange) {
+         request.from = self.sessionRange.start;
+         request.to = self.sessionRange.end;
+      } else if (self.timeWindow() > 0 && self.logRange && self.analyzedLogFile == self.logFile()) {
+         request.from = self.logRange.end - self.timeWindow();
+      }
+      return request;
+   }
+
+   self.loadSession = function(session) {
+      self.sessionRange = session;
+      self.loadData();
+      self.sessionRange = undefined;
+   }
+
+   self.formatSessionTime = function(seconds) {
+      var hours = Math.floor(seconds / 3600);
+      var minutes = Math.floor(seconds % 3600 / 60);
+      return hours + ":" + ("0" + minutes).slice(-2) + ":" + ("0" + Math.floor(seconds % 60)).slice(-2);
+   }
+
+   self.loadData = function() {
+      self.live(false);
+      var settings = {
+        "crossDomain": true,
+        "url": self.apiUrl,
+        "method": "POST",
+        "headers": self.header,
+        "processData": false,
+        "dataType": "json",
+        "data": JSON.stringify(self.getStatsRequest())
+      }
+
+      self.progress(0);
       self.showSpinner(true);
+      self.awaitingJob = true;
+      self.earlyMessages = {};
 
       $.ajax(settings).done(function (response) {
-         self.status("")
-         self.datasetFill(false);
-
+         if (response.result) {
+            self.showResult(response.result);
+            return;
+         }
+         self.jobId = response.jobId;
+         // the job may have finished before the response arrived
+         if (self.jobId in self.earlyMessages) {
+            self.handleJobMessage(self.earlyMessages[self.jobId]);
+         }
+      }).fail(function () {
          self.showSpinner(false);
-         self.klippylogFile(response.logfiledata);
+      }).always(function () {
+         self.awaitingJob = false;
+         self.earlyMessages = {};
+      });
+   }
 
-         if("error" in response.plot) {
-            self.status(response.plot.error);
-         } else {
-            self.datasets.removeAll();
-            self.datasets.push(
-            {
-               label: "MCU Load",
-               backgroundColor: "rgba(199, 44, 59, 0.5)",
-               borderColor: "rgb(199, 44, 59)",
-               yAxisID: 'y-axis-1',
-               data: response.plot.loads
-            });
+   self.liveRequest = function(enable) {
+      return $.ajax({
+        "crossDomain": true,
+        "url": self.apiUrl,
+        "method": "POST",
+        "headers": self.header,
+        "processData": false,
+        "dataType": "json",
+        "data": JSON.stringify({
+          command: "liveStats",
+          printer: OctoPrint.plugins.klipper.printer,
+          clientId: self.liveClientId,
+          enable: enable
+        })
+      });
+   }
 
-            self.datasets.push(
-            {
-               label: "Bandwith",
-               backgroundColor: "rgba(255, 130, 1, 0.5)",
-               borderColor: "rgb(255, 130, 1)",
-               yAxisID: 'y-axis-1',
-               data: response.plot.bwdeltas
-            });
+   // follow the active klippy.log, the server pushes the new points
+   self.startLive = function() {
+      self.liveRequest(true).done(function(response) {
+         self.liveWindow = response.window;
+         self.status(gettext("Live"));
+         self.showLivePlot(response.live);
+         // renew the lease while the live view is on
+         self.liveTimer = setInterval(function() {
+            self.liveRequest(true);
+         }, response.lease * 500);
+      }).fail(function() {
+         self.live(false);
+      });
+   }
 
-            self.datasets.push(
-            {
-               label: "Host Buffer",
-               backgroundColor: "rgba(0, 145, 106, 0.5)",
-               borderColor: "rgb(0, 145, 106)",
-               yAxisID: 'y-axis-1',
-               data: response.plot.buffers
-            });
+   self.stopLive = function() {
+      if (self.liveTimer !== undefined) {
+         clearInterval(self.liveTimer);
+         self.liveTimer = undefined;
+      }
+      self.status("");
+      self.liveRequest(false);
+   }
+
+   self.showLivePlot = function(plot) {
+      plot.live = true;
+      self.plot = plot;
+      self.sessions([]);
+      self.availableMcus(Object.keys(plot.mcus).sort());
+      if (!(self.selectedMcu() in plot.mcus)) {
+         self.selectedMcu(plot.mcu);
+      }
+      self.drawChart();
+   }
+
+   self.appendLivePoints = function(points) {
+      var plot = self.plot;
+      if (!plot || !plot.live || plot.times.length == 0) {
+         self.showLivePlot(points);
+         return;
+      }
+      var size = plot.times.length;
+      var added = points.times.length;
+      _.each(points.mcus, function(series, name) {
+         if (!(name in plot.mcus)) {
+            var empty = _.map(_.range(size), function() { return null; });
+            plot.mcus[name] = {loads: empty.slice(), bwdeltas: empty.slice(), awake: empty.slice()};
+            self.availableMcus(Object.keys(plot.mcus).sort());
+         }
+      });
+      _.each(plot.mcus, function(series, name) {
+         var other = points.mcus[name];
+         _.each(["loads", "bwdeltas", "awake"], function(key) {
+            series[key] = series[key].concat(other ? other[key] : _.map(_.range(added), function() { return null; }));
+         });
+      });
+      _.each(["times", "buffers", "stalls", "retransmits"], function(key) {
+         plot[key] = plot[key].concat(points[key]);
+      });
 
-            self.datasets.push(
-            {
-               label: "Awake Time",
-               backgroundColor: "rgba(33, 64, 95, 0.5)",
-               borderColor: "rgb(33, 64, 95)",
-               yAxisID: 'y-axis-1',
-               data: response.plot.awake
+      // drop the points that left the window
+      var start = plot.times[plot.times.length - 1] - self.liveWindow;
+      var cut = _.sortedIndex(plot.times, start);
+      if (cut > 0) {
+         _.each(["times", "buffers", "stalls", "retransmits"], function(key) {
+            plot[key] = plot[key].slice(cut);
+         });
+         _.each(plot.mcus, function(series) {
+            _.each(["loads", "bwdeltas", "awake"], function(key) {
+               series[key] = series[key].slice(cut);
             });
+         });
+      }
+      self.updateChart();
+   }
 
-            self.chart = new Chart(self.canvas, {
-               type: "line",
-               data: {
-                  labels: response.plot.times,
-                  datasets: self.datasets()
-               },
-               options: {
-                  elements:{
-                     line: {
-                        tension: 0
-                     }
-                  },
-                  scales: {
-                     xAxes: [{
-                        type: 'time',
-                        time: {
-                           parser:  self.convertTime,
-                           tooltipFormat: "HH:mm",
-                           displayFormats: {
-                              minute: "HH:mm",
-                              second: "HH:mm",
-                              millisecond: "HH:mm"
-                           }
-                        },
-                        scaleLabel: {
-                           display: true,
-                           labelString: 'Time'
-                        }
-                     }],
-                     yAxes: [{
-                        scaleLabel: {
-                           display: true,
-                           labelString: '%'
-                        },
-                        position: 'left',
-                        id: 'y-axis-1'
+   self.cancelLoadData = function() {
+      if (self.jobId === undefined) {
+         self.showSpinner(false);
+         return;
+      }
+      var settings = {
+        "crossDomain": true,
+        "url": self.apiUrl,
+        "method": "POST",
+        "headers": self.header,
+        "processData": false,
+        "dataType": "json",
+        "data": JSON.stringify({command: "cancelStats", jobId: self.jobId})
+      }
+      $.ajax(settings);
+      self.jobId = undefined;
+      self.showSpinner(false);
+   }
+
+   self.onDataUpdaterPluginMessage = function(plugin, data) {
+      if (plugin == "klipper" && data.type == "batch") {
+         data.payload.forEach(function(message) {
+            self.onDataUpdaterPluginMessage(plugin, message);
+         });
+         return;
+      }
+      if (plugin != "klipper" || data.type != "stats") {
+         return;
+      }
+      if (data.subtype == "live") {
+         if (self.live() && data.payload.printer == (OctoPrint.plugins.klipper.printer || "default")) {
+            self.appendLivePoints(data.payload);
+         }
+         return;
+      }
+      if (self.awaitingJob && data.subtype != "progress") {
+         self.earlyMessages[data.payload.jobId] = data;
+      }
+      if (data.payload.jobId == self.jobId) {
+         self.handleJobMessage(data);
+      }
+   }
+
+   self.handleJobMessage = function(data) {
+      switch (data.subtype) {
+         case "progress":
+            self.progress(data.payload.progress);
+            break;
+         case "result":
+            self.jobId = undefined;
+            self.showResult(data.payload.result);
+            break;
+         case "error":
+            self.jobId = undefined;
+            self.showSpinner(false);
+            self.status(data.payload.error);
+            break;
+         case "cancelled":
+            self.jobId = undefined;
+            self.showSpinner(false);
+            break;
+      }
+   }
+
+   self.showResult = function(response) {
+      self.status("")
+      self.datasetFill(false);
+
+      self.showSpinner(false);
+      self.loadLogData(false);
+
+      if("error" in response.plot) {
+         self.status(response.plot.error);
+      } else {
+         self.analyzedLogFile = self.logFile();
+         self.logRange = response.plot.range;
+         self.plot = response.plot;
+         self.sessions(response.sessions || []);
+         self.availableMcus(Object.keys(self.plot.mcus).sort());
+         if (!(self.selectedMcu() in self.plot.mcus)) {
+            self.selectedMcu(self.plot.mcu);
+         }
+         self.drawChart();
+      }
+   }
+
+   self.toPoints = function(times, values) {
+      var points = [];
+      for (var i = 0; i < times.length; i++) {
+         points.push({x: times[i], y: values[i]});
+      }
+      return points;
+   }
+
+   // update the data of the chart without creating it again
+   self.updateChart = function() {
+      if (_.isEmpty(self.plot.mcus)) {
+         return;
+      }
+      var datasets = self.buildDatasets(self.plot).datasets;
+      if (!self.chart || self.chart.data.datasets.length != datasets.length) {
+         self.drawChart();
+         return;
+      }
+      for (var i = 0; i < datasets.length; i++) {
+         self.chart.data.datasets[i].data = datasets[i].data;
+      }
+      self.chart.update(0);
+   }
+
+   self.buildDatasets = function(plot) {
+      var mcu = plot.mcus[self.selectedMcu()] || plot.mcus[plot.mcu];
+      var frequency = plot.frequency[self.selectedMcu()];
+      var datasets = [];
+
+      datasets.push(
+      {
+         label: "MCU Load",
+         backgroundColor: "rgba(199, 44, 59, 0.5)",
+         borderColor: "rgb(199, 44, 59)",
+         yAxisID: 'y-axis-1',
+         data: self.toPoints(plot.times, mcu.loads)
+      });
+
+      datasets.push(
+      {
+         label: "Bandwith",
+         backgroundColor: "rgba(255, 130, 1, 0.5)",
+         borderColor: "rgb(255, 130, 1)",
+         yAxisID: 'y-axis-1',
+         data: self.toPoints(plot.times, mcu.bwdeltas)
+      });
+
+      datasets.push(
+      {
+         label: "Host Buffer",
+         backgroundColor: "rgba(0, 145, 106, 0.5)",
+         borderColor: "rgb(0, 145, 106)",
+         yAxisID: 'y-axis-1',
+         data: self.toPoints(plot.times, plot.buffers)
+      });
+
+      datasets.push(
+      {
+         label: "Awake Time",
+         backgroundColor: "rgba(33, 64, 95, 0.5)",
+         borderColor: "rgb(33, 64, 95)",
+         yAxisID: 'y-axis-1',
+         data: self.toPoints(plot.times, mcu.awake)
+      });
+
+      var yAxes = [{
+         scaleLabel: {
+            display: true,
+            labelString: '%'
+         },
+         position: 'left',
+         id: 'y-axis-1'
+      }];
+
+      if (self.showFrequency() && frequency) {
+         datasets.push(
+         {
+            label: "Frequency",
+            backgroundColor: "rgba(120, 60, 160, 0.5)",
+            borderColor: "rgb(120, 60, 160)",
+            yAxisID: 'y-axis-2',
+            data: self.toPoints(frequency.times, frequency.freq)
+         });
+
+         datasets.push(
+         {
+            label: "Adjusted Frequency",
+            backgroundColor: "rgba(90, 90, 90, 0.5)",
+            borderColor: "rgb(90, 90, 90)",
+            yAxisID: 'y-axis-2',
+            data: self.toPoints(frequency.times, frequency.adj)
+         });
+
+         yAxes.push({
+            scaleLabel: {
+               display: true,
+               labelString: 'MHz'
+            },
+            position: 'right',
+            id: 'y-axis-2'
+         });
+      }
+
+      if (plot.stalls) {
+         // only the live view has the events of every point
+         datasets.push(
+         {
+            label: "Print Stalls",
+            backgroundColor: "rgba(230, 200, 0, 0.5)",
+            borderColor: "rgb(230, 200, 0)",
+            yAxisID: 'y-axis-3',
+            data: self.toPoints(plot.times, plot.stalls)
+         });
+
+         datasets.push(
+         {
+            label: "Retransmits",
+            backgroundColor: "rgba(200, 0, 200, 0.5)",
+            borderColor: "rgb(200, 0, 200)",
+            yAxisID: 'y-axis-3',
+            data: self.toPoints(plot.times, plot.retransmits)
+         });
+
+         yAxes.push({
+            scaleLabel: {
+               display: true,
+               labelString: gettext('Events')
+            },
+            position: 'right',
+            ticks: {
+               beginAtZero: true
+            },
+            id: 'y-axis-3'
+         });
+      }
+
+      for (var i = 0; i < datasets.length; i++) {
+         datasets[i].fill = self.datasetFill();
+      }
+      return {datasets: datasets, yAxes: yAxes};
+   }
+
+   self.drawChart = function() {
+      if (!self.plot || _.isEmpty(self.plot.mcus)) {
+         return;
+      }
+      var built = self.buildDatasets(self.plot);
+      var yAxes = built.yAxes;
+      self.datasets(built.datasets);
+
+      if (self.chart) {
+         self.chart.destroy();
+      }
+      self.chart = new Chart(self.canvas, {
+         type: "line",
+         data: {
+            datasets: self.datasets()
+         },
+         options: {
+            elements:{
+               line: {
+                  tension: 0
+               }
+            },
+            scales: {
+               xAxes: [{
+                  type: 'time',
+                  time: {
+                     parser:  self.convertTime,
+                     tooltipFormat: "HH:mm",
+                     displayFormats: {
+                        minute: "HH:mm",
+                        second: "HH:mm",
+                        millisecond: "HH:mm"
                      }
-                     ]
                   },
-                  legend: {
-
+                  scaleLabel: {
+                     display: true,
+                     labelString: 'Time'
                   }
-               }
-            });
+               }],
+               yAxes: yAxes
+            },
+            legend: {
+
+            }
          }
       });
    }
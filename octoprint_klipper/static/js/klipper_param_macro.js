@@ -18,63 +18,48 @@ $(function() {
         var self = this;
 
         self.parameters = ko.observableArray();
-        self.interpolatedCmd;
-        self.macro;
+        self.macroId = undefined;
         self.macroName = ko.observable();
-
-        var paramObjRegex = /{(.*?)}/g;
-        var keyValueRegex = /(\w*)\s*:\s*([\w\s°"|\.]*)/g;
-
-        self.process = function(macro) {
-           self.macro = macro.macro();
-           self.macroName(macro.name());
-
-           var matches = self.macro.match(paramObjRegex);
-           var params = [];
-
-           for (var i=0; i < matches.length; i++) {
-              var obj = {};
-              var res = keyValueRegex.exec(matches[i]);
-
-              while (res != null) {
-                 if("options" == res[1]) {
-                    obj["options"] = res[2].trim().split("|");
-                 } else {
-                    obj[res[1]] = res[2].trim();
-                 }
-                 res = keyValueRegex.exec(matches[i]);
-              }
-
-              if(!("label" in obj)) {
-                 obj["label"] = "Input " + (i+1);
-              }
-
-              if(!("unit" in obj)) {
-                 obj["unit"] = "";
-              }
-
-              if("default" in obj) {
-                 obj["value"] = obj["default"];
-              }
-
-              params.push(obj);
-           }
-           self.parameters(params);
+        self.error = ko.observable();
+        self.running = ko.observable(false);
+
+        // the macro as compiled by the server, with the schema of its parameters
+        self.process = function(compiled) {
+           self.macroId = compiled.id;
+           self.macroName(compiled.name);
+           self.error(undefined);
+
+           self.parameters(_.map(compiled.params, function(param) {
+              return _.extend({}, param, {
+                 value: ko.observable(param.default === null ? "" : param.default),
+                 error: ko.observable()
+              });
+           }));
         }
 
         self.executeMacro = function() {
-           var i=-1;
-
-           function replaceParams(match) {
-              i++;
-              return self.parameters()[i]["value"];
-           }
-           // Use .split to create an array of strings which is sent to
-           // OctoPrint.control.sendGcode instead of a single string.
-           expanded = self.macro.replace(paramObjRegex, replaceParams)
-           expanded = expanded.split(/\r\n|\r|\n/);
-
-           OctoPrint.control.sendGcode(expanded);
+           var values = _.map(self.parameters(), function(param) {
+              param.error(undefined);
+              return param.value();
+           });
+           self.error(undefined);
+           self.running(true);
+
+           // the server checks the values before it sends the G-code
+           OctoPrint.plugins.klipper.executeMacro(self.macroId, values).done(function() {
+              $("#klipper_macro_dialog").modal("hide");
+           }).fail(function(response) {
+              var errors = response.responseJSON ? response.responseJSON.errors : undefined;
+              if (errors) {
+                 _.each(errors, function(error) {
+                    self.parameters()[error.param].error(error.message);
+                 });
+              } else {
+                 self.error(_.sprintf(gettext("Could not run the macro (%(status)s)."), {status: response.status}));
+              }
+           }).always(function() {
+              self.running(false);
+           });
         }
     }
 
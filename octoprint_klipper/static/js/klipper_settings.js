@@ -79,6 +79,11 @@ $(function () {
       self.loadBaseConfig();
     };
 
+    self.klipperViewModel.selectedKlipperPrinter.subscribe(function () {
+      self.listCfgFiles();
+      self.loadBaseConfig();
+    });
+
     self.listCfgFiles = function () {
       self.klipperViewModel.consoleMessage("debug", "listCfgFiles started");
 
@@ -93,7 +98,7 @@ $(function () {
     self.loadBaseConfig = function () {
       if (!self.klipperViewModel.hasRight("CONFIG")) return;
 
-      var baseconfig = self.settings.settings.plugins.klipper.configuration.baseconfig();
+      var baseconfig = self.klipperViewModel.currentKlipperPrinter().baseconfig;
       if (baseconfig != "") {
         self.klipperViewModel.consoleMessage("debug", "loadBaseConfig:" + baseconfig);
         OctoPrint.plugins.klipper.getCfg(baseconfig).done(function (response) {
@@ -267,6 +272,21 @@ $(function () {
       });
     };
 
+    self.addPrinter = function () {
+      self.settings.settings.plugins.klipper.printers.push({
+        id: "printer" + (self.settings.settings.plugins.klipper.printers().length + 2),
+        name: "",
+        port: "",
+        config_path: "",
+        baseconfig: "printer.cfg",
+        logpath: "",
+      });
+    };
+
+    self.removePrinter = function (printer) {
+      self.settings.settings.plugins.klipper.printers.remove(printer);
+    };
+
     self.removeMacro = function (macro) {
       self.settings.settings.plugins.klipper.macros.remove(macro);
     };
@@ -317,6 +337,12 @@ $(function () {
     };
 
     self.onDataUpdaterPluginMessage = function (plugin, data) {
+      if (plugin == "klipper" && data.type == "batch") {
+        data.payload.forEach(function (message) {
+          self.onDataUpdaterPluginMessage(plugin, message);
+        });
+        return;
+      }
       if (plugin == "klipper" && data.type == "reload" && data.subtype == "configlist") {
         self.klipperViewModel.consoleMessage("debug", "onDataUpdaterPluginMessage klipper reload configlist");
         self.listCfgFiles();
@@ -1,3 +1,10 @@
+import logging
+import os
+import stat
+import tempfile
+
+_replace = getattr(os, "replace", os.rename)
+
 def log_info(self, message):
     self._octoklipper_logger.info(message)
     send_message(
@@ -8,7 +15,14 @@ def log_info(self, message):
         payload = message
     )
 
-def log_debug(self, message):
+def log_debug(self, message, *args):
+    '''
+    Log a debug message, formatted with args only if debug logging is enabled
+    '''
+    if not self._octoklipper_logger.isEnabledFor(logging.DEBUG):
+        return
+    if args:
+        message = message.format(*args)
     self._octoklipper_logger.debug(message)
     self._logger.info(message)
     send_message(
@@ -19,6 +33,32 @@ def log_debug(self, message):
         payload = message
     )
 
+def log_event(self, event, **fields):
+    '''
+    Log a structured debug record if debug logging is enabled.
+
+    The debug log gets the event with its fields as key=value pairs, the
+    frontend console gets event and fields as they are.
+    '''
+    if not self._octoklipper_logger.isEnabledFor(logging.DEBUG):
+        return
+    self._octoklipper_logger.debug(
+        "%s %s", event, " ".join("{}={!r}".format(key, value) for key, value in sorted(fields.items())))
+    send_message(
+        self,
+        type = "console",
+        subtype = "debug",
+        title = event,
+        payload = dict(event = event, fields = fields)
+    )
+
+def set_debug_logging(self):
+    '''
+    Set the level of the debug logger from the setting configuration.debug_logging
+    '''
+    self._octoklipper_logger.setLevel(
+        logging.DEBUG if self._settings.get_boolean(["configuration", "debug_logging"]) else logging.INFO)
+
 def log_error(self, error):
     self._octoklipper_logger.error(error)
     self._logger.error(error)
@@ -98,7 +138,7 @@ def file_exist(self, filepath):
     '''
     from os import path
     if not path.isfile(filepath):
-        log_debug(self, "File: <br />" + filepath + "<br /> does not exist!")
+        log_debug(self, "File: <br />{}<br /> does not exist!", filepath)
         send_message(
             self,
             type = "PopUp",
@@ -120,15 +160,96 @@ def key_exist(dict, key1, key2):
 def send_message(self, type, subtype, title = "", payload = ""):
         """
         Send Message over API to FrontEnd
+
+        Once the plugin has started the message goes through its message
+        bus, which sends it with the other messages of the next batch.
         """
-        import datetime
-        self._plugin_manager.send_plugin_message(
-            self._identifier,
-            dict(
-                time = datetime.datetime.now().strftime("%H:%M:%S"),
-                type = type,
-                subtype = subtype,
-                title = title,
-                payload = payload
-            )
+        import time
+        message = dict(
+            time = time.strftime("%H:%M:%S"),
+            type = type,
+            subtype = subtype,
+            title = title,
+            payload = payload
         )
+        bus = getattr(self, "_message_bus", None)
+        if bus is not None:
+            bus.post(message)
+        else:
+            self._plugin_manager.send_plugin_message(self._identifier, message)
+
+def get_int_param(data, key, default=None):
+    '''
+    Returns an integer parameter of an API request or aborts with 400
+    '''
+    return _get_number_param(data, key, int, default)
+
+def get_float_param(data, key, default=None):
+    '''
+    Returns a float parameter of an API request or aborts with 400
+    '''
+    return _get_number_param(data, key, float, default)
+
+def _get_number_param(data, key, number_type, default):
+    value = data.get(key)
+    if value is None or value == "":
+        return default
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        import flask
+        flask.abort(400, description="Invalid request, {} is not a number".format(key))
+
+def write_file_atomic(path, data, mode=None):
+    '''
+    Write bytes to a file so that it has either the old or the new content,
+    even after a power loss: the data is written to a temporary file in the
+    same folder and synced, then the file is replaced and the folder synced.
+    A symlink is written through, the file it points to is replaced. The
+    file keeps its permissions and owner, a new file gets mode or 0644.
+    '''
+    path = os.path.realpath(path)
+    folder = os.path.dirname(path)
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        file_stat = None
+        mode = 0o644 if mode is None else mode
+    else:
+        mode = stat.S_IMODE(file_stat.st_mode)
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        if file_stat is not None and hasattr(os, "chown"):
+            try:
+                os.chown(tmp_path, file_stat.st_uid, file_stat.st_gid)
+            except OSError:
+                # only root may give a file away, the owner stays ours
+                pass
+        _replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_folder(folder)
+
+def fsync_folder(folder):
+    '''
+    Sync a folder to make a rename in it durable, where the OS supports it
+    '''
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
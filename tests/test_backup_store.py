@@ -0,0 +1,131 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+
+import pytest
+
+from octoprint_klipper.backupStore import BackupStore
+
+DAY = 86400.
+
+
+@pytest.fixture
+def folder(tmpdir):
+    return str(tmpdir.join("backups"))
+
+
+def blobs(store):
+    return sorted(os.listdir(store.blob_folder))
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_content_is_stored_once(folder, compress):
+    store = BackupStore(folder, compress=compress)
+    first = store.add_content(b"[printer]\n", "printer.cfg", 1000.)
+    # unchanged content is not backed up again
+    assert store.add_content(b"[printer]\n", "printer.cfg", 2000.) == first
+    store.add_content(b"[printer]\n", "macros/printer.cfg", 3000.)
+    assert len(store.list()[0]) == 2
+    assert len(blobs(store)) == 1
+    assert store.read(first["id"]) == b"[printer]\n"
+    assert first["compressed"] == compress
+
+
+def test_versions_and_latest(folder):
+    store = BackupStore(folder, thin_after_days=0)
+    store.add_content(b"a", "printer.cfg", 1000.)
+    second = store.add_content(b"b", "printer.cfg", 2000.)
+    store.add_content(b"a", "printer.cfg", 3000.)
+    assert store.latest("printer.cfg")["time"] == 3000.
+    assert store.read(second["id"]) == b"b"
+    assert len(blobs(store)) == 2
+
+
+def test_manifest_is_reloaded(folder):
+    entry = BackupStore(folder).add_content(b"a", "printer.cfg", 1000.)
+    store = BackupStore(folder)
+    assert store.get(entry["id"]) == entry
+    assert store.read(entry["id"]) == b"a"
+    assert store.read("unknown") is None
+
+
+def test_keep_per_file(folder):
+    store = BackupStore(folder, keep_per_file=3, thin_after_days=0)
+    for i in range(5):
+        store.add_content("{}".format(i).encode("ascii"), "printer.cfg", 1000. + i)
+    store.add_content(b"other", "mcu.cfg", 1000.)
+    entries = store.list(sort="date")[0]
+    assert [e["time"] for e in entries if e["name"] == "printer.cfg"] == [1004., 1003., 1002.]
+    assert len(blobs(store)) == 4
+    assert store.list()[1] == 4
+
+
+def test_thin_after_days(folder):
+    store = BackupStore(folder, keep_per_file=0, thin_after_days=10)
+    old = time.mktime((2020, 5, 1, 12, 0, 0, 0, 0, -1))
+    for i in range(3):
+        store.add_content("old {}".format(i).encode("ascii"), "printer.cfg", old + i * 60)
+    now = time.time()
+    for i in range(3):
+        store.add_content("new {}".format(i).encode("ascii"), "printer.cfg", now - i * 60)
+    times = sorted(e["time"] for e in store.list()[0])
+    # the newest of the old day and all recent ones
+    assert times == [old + 120] + sorted(now - i * 60 for i in range(3))
+
+
+def test_stricter_policy_applies_right_away(folder):
+    store = BackupStore(folder, keep_per_file=0, thin_after_days=0)
+    for i in range(4):
+        store.add_content("{}".format(i).encode("ascii"), "printer.cfg", 1000. + i)
+    store.set_policy(keep_per_file=2)
+    assert [e["time"] for e in store.list()[0]] == [1003., 1002.]
+    assert len(blobs(store)) == 2
+
+
+def test_delete_removes_unreferenced_blobs(folder):
+    store = BackupStore(folder)
+    first = store.add_content(b"a", "printer.cfg", 1000.)
+    second = store.add_content(b"a", "macros.cfg", 1000.)
+    assert first["id"] != second["id"]
+    assert store.delete(first["id"])
+    assert len(blobs(store)) == 1
+    assert store.delete(second["id"])
+    assert blobs(store) == []
+    assert not store.delete(second["id"])
+
+
+def test_list_pages_and_sorts(folder):
+    store = BackupStore(folder)
+    store.add_content(b"1", "b.cfg", 1000.)
+    store.add_content(b"22", "a.cfg", 2000.)
+    store.add_content(b"333", "C.cfg", 3000.)
+    assert [e["name"] for e in store.list(sort="name")[0]] == ["a.cfg", "b.cfg", "C.cfg"]
+    assert [e["size"] for e in store.list(sort="size")[0]] == [3, 2, 1]
+    entries, total = store.list(sort="date", offset=1, limit=1)
+    assert [e["name"] for e in entries] == ["a.cfg"]
+    assert total == 3
+
+
+def test_migrate_folder(tmpdir, folder):
+    old_folder = tmpdir.mkdir("bak")
+    old_folder.join("printer.cfg").write("[printer]\n")
+    old_folder.join("mcu.cfg").write("[mcu]\n")
+    store = BackupStore(folder)
+    assert store.migrate_folder(str(old_folder)) == 2
+    assert not old_folder.check()
+    assert sorted(e["name"] for e in store.list()[0]) == ["mcu.cfg", "printer.cfg"]
@@ -0,0 +1,108 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from octoprint_klipper.configDiff import changed_lines, diff_configs, split_sections
+
+FROM = """\
+# my printer
+[printer]
+kinematics: corexy
+max_accel: 3000
+
+[gcode_macro PARK]
+gcode:
+  G1 X0 Y0
+
+[gcode_macro PARK]
+gcode:
+  G1 X10 Y10
+
+[fan]
+pin: PA8
+"""
+
+TO = """\
+# my printer
+[printer]
+kinematics: corexy
+max_accel: 5000
+
+[gcode_macro PARK]
+gcode:
+  G1 X0 Y0
+
+[gcode_macro PARK]
+gcode:
+  G1 X20 Y20
+
+[heater_fan hotend]
+pin: PA7
+"""
+
+
+def test_split_sections():
+    sections = split_sections(FROM.splitlines())
+    assert [(key, start) for key, start, lines in sections] == [
+        ("", 0), ("printer", 1), ("gcode_macro PARK", 5),
+        ("gcode_macro PARK#2", 9), ("fan", 13)]
+    assert sections[1][2] == ["[printer]", "kinematics: corexy", "max_accel: 3000", ""]
+
+
+def test_split_sections_without_preamble():
+    assert split_sections(["[mcu]", "serial: /dev/ttyACM0"]) == [
+        ("mcu", 0, ["[mcu]", "serial: /dev/ttyACM0"])]
+    assert split_sections([]) == []
+
+
+def test_changed_lines():
+    a = ["a", "b", "c", "d"]
+    b = ["a", "B", "c", "e", "f"]
+    assert changed_lines(a, b) == ([1, 3, 4], [])
+    assert changed_lines(["a", "b", "c"], ["a", "c"]) == ([], [1])
+
+
+def test_identical():
+    result = diff_configs(FROM, FROM)
+    assert result["identical"]
+    assert result["sections"] == []
+    assert result["changed_lines"] == []
+
+
+def test_sections():
+    result = diff_configs(FROM, TO)
+    assert not result["identical"]
+    assert [(s["name"], s["status"]) for s in result["sections"]] == [
+        ("printer", "changed"), ("gcode_macro PARK#2", "changed"),
+        ("fan", "removed"), ("heater_fan hotend", "added")]
+    printer = result["sections"][0]["hunks"]
+    assert printer == [dict(
+        from_start=2, from_count=4, to_start=2, to_count=4,
+        lines=[" [printer]", " kinematics: corexy",
+               "-max_accel: 3000", "+max_accel: 5000", " "])]
+    removed = result["sections"][2]["hunks"][0]
+    assert (removed["from_start"], removed["from_count"], removed["to_count"]) == (14, 2, 0)
+    added = result["sections"][3]["hunks"][0]
+    assert (added["to_start"], added["to_count"], added["from_count"]) == (14, 2, 0)
+    assert added["lines"] == ["+[heater_fan hotend]", "+pin: PA7"]
+    assert result["changed_lines"] == [3, 11, 13, 14]
+
+
+def test_unified():
+    result = diff_configs(FROM, TO, "printer.cfg", "editor", format="unified", context=0)
+    assert result["unified"].splitlines()[:5] == [
+        "--- printer.cfg", "+++ editor", "@@ -4 +4 @@", "-max_accel: 3000", "+max_accel: 5000"]
+    assert "sections" not in result
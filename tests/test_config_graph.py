@@ -0,0 +1,84 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import io
+import os
+
+from octoprint_klipper.configGraph import ConfigGraph
+
+
+def write(folder, name, content):
+    path = os.path.join(str(folder), name)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io.open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def test_sections_in_the_order_klipper_reads_them(tmpdir):
+    write(tmpdir, "printer.cfg", "[include macros/*.cfg]\n[printer]\nkinematics: corexy\n[include mcu.cfg]\n")
+    write(tmpdir, "macros/b.cfg", "[gcode_macro B]\ngcode:\n")
+    write(tmpdir, "macros/a.cfg", "[gcode_macro A]\ngcode:\n")
+    write(tmpdir, "mcu.cfg", "[mcu]\nserial: /dev/ttyACM0\n\n[printer]\nmax_accel: 3000\n")
+    graph = ConfigGraph().resolve(str(tmpdir), "printer.cfg")
+    assert [f["file"] for f in graph["files"]] == [
+        "printer.cfg", os.path.join("macros", "a.cfg"), os.path.join("macros", "b.cfg"), "mcu.cfg"]
+    assert graph["files"][0]["includes"] == [
+        os.path.join("macros", "a.cfg"), os.path.join("macros", "b.cfg"), "mcu.cfg"]
+    assert [s["name"] for s in graph["sections"]] == [
+        "gcode_macro A", "gcode_macro B", "printer", "mcu"]
+    assert graph["sections"][2]["definitions"] == [
+        dict(file="printer.cfg", row=1), dict(file="mcu.cfg", row=3)]
+    assert graph["cycles"] == []
+    assert graph["missing"] == []
+
+
+def test_includes_are_relative_to_the_including_file(tmpdir):
+    write(tmpdir, "printer.cfg", "[include sub/main.cfg]\n")
+    write(tmpdir, "sub/main.cfg", "[include extra.cfg]\n")
+    write(tmpdir, "sub/extra.cfg", "[fan]\npin: PA8\n")
+    graph = ConfigGraph().resolve(str(tmpdir), "printer.cfg")
+    assert graph["sections"] == [dict(name="fan", definitions=[
+        dict(file=os.path.join("sub", "extra.cfg"), row=0)])]
+
+
+def test_cycles_and_missing_includes(tmpdir):
+    write(tmpdir, "printer.cfg", "[include a.cfg]\n[include missing.cfg]\n[include none*.cfg]\n")
+    write(tmpdir, "a.cfg", "[include b.cfg]\n")
+    write(tmpdir, "b.cfg", "[include a.cfg]\n")
+    graph = ConfigGraph().resolve(str(tmpdir), "printer.cfg")
+    assert graph["cycles"] == [["a.cfg", "b.cfg", "a.cfg"]]
+    # a glob without matches is fine, like in Klipper
+    assert graph["missing"] == [dict(file="printer.cfg", row=1, include="missing.cfg")]
+
+
+def test_a_file_included_twice_is_read_twice(tmpdir):
+    write(tmpdir, "printer.cfg", "[include common.cfg]\n[include common.cfg]\n")
+    write(tmpdir, "common.cfg", "[idle_timeout]\n")
+    graph = ConfigGraph().resolve(str(tmpdir), "printer.cfg")
+    assert [f["file"] for f in graph["files"]] == ["printer.cfg", "common.cfg", "common.cfg"]
+    assert len(graph["sections"][0]["definitions"]) == 2
+    assert graph["cycles"] == []
+
+
+def test_changed_files_are_parsed_again(tmpdir):
+    graph = ConfigGraph()
+    path = write(tmpdir, "printer.cfg", "[printer]\n")
+    assert [s["name"] for s in graph.resolve(str(tmpdir), "printer.cfg")["sections"]] == ["printer"]
+    write(tmpdir, "printer.cfg", "[printer]\n[mcu]\n")
+    os.utime(path, (1, 1))
+    assert [s["name"] for s in graph.resolve(str(tmpdir), "printer.cfg")["sections"]] == ["printer", "mcu"]
@@ -0,0 +1,107 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+from octoprint_klipper.configValidator import ConfigValidator, ERROR, WARNING
+
+CONFIG = """\
+[mcu]
+serial: /dev/serial/by-id/usb-Klipper_stm32f446xx-if00
+
+[mcu host]
+serial: /tmp/klipper_host_mcu
+
+[printer]
+kinematics: corexy
+max_velocity: 300
+max_accel: 3000
+
+[stepper_x]
+step_pin: PF13
+dir_pin: !PF12
+enable_pin: !PF14
+endstop_pin: ^host:gpiochip0/gpio20
+microsteps: 16
+rotation_distance: 40
+position_endstop: 0
+position_max: 250
+
+[tmc2209 stepper_x]
+uart_pin: PC4
+run_current: 0.800
+stealthchop_threshold: 999999.5 ; always stealthchop
+
+[gcode_macro START]
+gcode:
+  G28
+  SET_HEATER_TEMPERATURE HEATER=extruder TARGET={params.TEMP|default(200)}
+"""
+
+
+def validate(content, filename=None, validator=None):
+    return (validator or ConfigValidator()).validate(content, filename)
+
+
+def test_valid_config_has_no_diagnostics():
+    result = validate(CONFIG)
+    assert result["diagnostics"] == []
+    assert result["is_syntax_ok"]
+
+
+@pytest.mark.parametrize("line", [
+    "stealthchop_threshold: 0",
+    "stealthchop_threshold: 120.5",
+    "endstop_pin: host:gpiochip0/gpio20",
+    "endstop_pin: ^!ar5",
+    "endstop_pin: probe:z_virtual_endstop",
+    "kinematics: some_new_kinematics",
+    "hardware_pwm: False",
+])
+def test_false_positives(line):
+    diagnostics = validate("[stepper_x]\n" + line + "\n")["diagnostics"]
+    assert [d for d in diagnostics if d["severity"] == ERROR] == []
+
+
+@pytest.mark.parametrize("line, option", [
+    ("microsteps: 16.5", "microsteps"),
+    ("rotation_distance: forty", "rotation_distance"),
+    ("control: pi", "control"),
+    ("step_pin: PF13 PF14", "step_pin"),
+])
+def test_type_errors(line, option):
+    result = validate("[stepper_x]\n" + line + "\n")
+    assert [(d["row"], d["severity"], d["option"]) for d in result["diagnostics"]] == [(1, ERROR, option)]
+    assert not result["is_syntax_ok"]
+
+
+def test_untyped_sections_are_not_checked():
+    assert validate("[gcode_macro X]\nspeed: {params.SPEED}\nstep_pin: a b\n")["diagnostics"] == []
+
+
+def test_structure_errors():
+    result = validate("max_accel: 1\n[printer]\n  continued\nno separator\nmax_accel: 2\nmax_accel: 3\n")
+    assert [(d["row"], d["severity"]) for d in result["diagnostics"]] == [
+        (0, ERROR), (2, ERROR), (3, ERROR), (5, WARNING)]
+
+
+def test_only_changed_sections_are_validated_again():
+    validator = ConfigValidator()
+    assert validate(CONFIG, "printer.cfg", validator)["validated"] == 6
+    changed = CONFIG.replace("max_accel: 3000", "max_accel: fast")
+    result = validate(changed, "printer.cfg", validator)
+    assert result["validated"] == 1
+    assert [(d["row"], d["option"]) for d in result["diagnostics"]] == [(9, "max_accel")]
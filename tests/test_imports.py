@@ -0,0 +1,53 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# everything but plugin.py and cfgUtils.py, which serve the API with flask
+MODULES = [
+    "octoprint_klipper",
+    "octoprint_klipper.apiSocket",
+    "octoprint_klipper.backupStore",
+    "octoprint_klipper.configDiff",
+    "octoprint_klipper.configGraph",
+    "octoprint_klipper.configValidator",
+    "octoprint_klipper.fileIndex",
+    "octoprint_klipper.liveStats",
+    "octoprint_klipper.logAnalysis",
+    "octoprint_klipper.macroCompiler",
+    "octoprint_klipper.messageBus",
+    "octoprint_klipper.printerState",
+    "octoprint_klipper.printers",
+    "octoprint_klipper.util",
+    "octoprint_klipper.modules.KlipperLogAnalyzer",
+    "octoprint_klipper.modules.KlipperLogFile",
+    "octoprint_klipper.modules.KlipperLogIndex",
+    "octoprint_klipper.modules.KlipperResultCache",
+    "octoprint_klipper.modules.KlipperStatsStore",
+]
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_without_octoprint(module):
+    # a None entry in sys.modules makes the import fail even if OctoPrint is installed
+    code = "import sys; sys.modules.update(octoprint=None, flask=None); import {}".format(module)
+    subprocess.check_call([sys.executable, "-c", code], cwd=ROOT)
@@ -0,0 +1,71 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import gzip
+import io
+
+import pytest
+
+from octoprint_klipper.modules.KlipperLogAnalyzer import KlipperLogAnalyzer
+from octoprint_klipper.modules.KlipperLogFile import lzma
+
+LINE = ("Stats {:.1f}: gcodein=0 mcu: mcu_awake=0.010 mcu_task_avg=0.000010"
+        " mcu_task_stddev=0.000005 bytes_write={} bytes_read=0 bytes_retransmit=0"
+        " freq=16000000 print_time=0.000 buffer_time=1.000 print_stall=0\n")
+
+LOG = "".join(LINE.format(100. + 5. * i, 1000 + 300 * i) for i in range(2000)).encode("ascii")
+
+
+def compress(compression, data):
+    if compression == "xz":
+        return lzma.compress(data)
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def test_plain_log(tmpdir):
+    path = tmpdir.join("klippy.log")
+    path.write_binary(LOG)
+    result = KlipperLogAnalyzer(str(path)).analyze()
+    assert result["plot"]["samples"] == 1999
+    assert "error" not in result["plot"]
+
+
+@pytest.mark.parametrize("compression", ["gz", "xz"])
+def test_compressed_log(tmpdir, compression):
+    if compression == "xz" and lzma is None:
+        pytest.skip("needs the lzma module")
+    path = tmpdir.join("klippy.log.1." + compression)
+    path.write_binary(compress(compression, LOG))
+    assert KlipperLogAnalyzer(str(path)).analyze()["plot"]["samples"] == 1999
+
+
+@pytest.mark.parametrize("compression, cut", [("gz", 0.5), ("gz", None), ("xz", 0.5), ("xz", None)])
+def test_truncated_or_corrupt_compressed_log(tmpdir, compression, cut):
+    if compression == "xz" and lzma is None:
+        pytest.skip("needs the lzma module")
+    data = bytearray(compress(compression, LOG))
+    if cut:
+        data = data[:int(len(data) * cut)]
+    else:
+        data[len(data) // 2] ^= 0xff
+    path = tmpdir.join("klippy.log.1." + compression)
+    path.write_binary(bytes(data))
+    result = KlipperLogAnalyzer(str(path)).analyze()
+    assert "truncated or corrupt" in result["plot"]["error"]
+    assert result["sessions"] == []
@@ -0,0 +1,157 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+
+import pytest
+
+from octoprint_klipper.modules.KlipperLogAnalyzer import KlipperLogAnalyzer
+from octoprint_klipper.modules.KlipperLogIndex import KlipperLogIndex
+
+RESTART = "Start printer at Sun Apr 23 10:00:00 2023 (1682236800.0 {:.1f})"
+
+
+def stats_line(i):
+    sampletime = 100. + 5. * i
+    line = ("Stats {:.1f}: gcodein=0 mcu: mcu_awake=0.010 mcu_task_avg=0.000010"
+            " mcu_task_stddev=0.000005 bytes_write={} bytes_read={} bytes_retransmit=0"
+            " freq=16000000 print_time={:.3f} buffer_time={:.3f} print_stall=0").format(
+                sampletime, 1000 + 300 * i, 2000 + 500 * i, 5. * i, (i % 5) * 0.5)
+    if i % 3:
+        # a second mcu that is not in every sample
+        line += " toolhead: mcu_awake=0.020 bytes_write={} bytes_retransmit=0 freq=16000000".format(
+            500 + 100 * i)
+    return line
+
+
+def log_lines(samples):
+    lines = []
+    for i in range(samples):
+        if i % 40 == 7:
+            lines.append(RESTART.format(100. + 5. * i))
+        lines.append(stats_line(i))
+    return lines
+
+
+def write(path, lines, mode="w"):
+    with open(path, mode) as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def as_dict(store):
+    return dict(
+        times=list(store.times),
+        columns={key: [v if v == v else None for v in column] for key, column in store.columns.items()},
+    )
+
+
+def full_parse(log_file):
+    analyzer = KlipperLogAnalyzer(log_file)
+    checkpoints = []
+    store = analyzer.parse_log(log_file, checkpoints=checkpoints)
+    return store, checkpoints
+
+
+@pytest.fixture
+def log_file(tmpdir):
+    return str(tmpdir.join("klippy.log"))
+
+
+@pytest.fixture
+def index_folder(tmpdir):
+    return str(tmpdir.join("logindex"))
+
+
+def indexed_stats(log_file, index_folder):
+    return KlipperLogAnalyzer(log_file, index_folder=index_folder).load_indexed_stats()
+
+
+def test_incremental_parse_equals_full_parse(log_file, index_folder):
+    lines = log_lines(200)
+    # split right after a restart line, before its sample
+    cuts = [0, 25, 49, 50, 150, len(lines)]
+    assert lines[48].startswith("Start printer")
+    open(log_file, "w").close()
+    for start, end in zip(cuts, cuts[1:]):
+        write(log_file, lines[start:end], "a")
+        store = indexed_stats(log_file, index_folder)
+
+    full_store, checkpoints = full_parse(log_file)
+    assert as_dict(store) == as_dict(full_store)
+    index = KlipperLogIndex(index_folder, log_file)
+    assert index.load()
+    assert as_dict(index.load_store()) == as_dict(full_store)
+    assert [tuple(c) for c in index.meta["checkpoints"]] == checkpoints
+    assert index.meta["offset"] == os.path.getsize(log_file)
+    assert not index.meta["restart"]
+
+
+def test_restart_marks_the_first_sample_after_it(log_file, index_folder):
+    write(log_file, [stats_line(0), RESTART.format(104.)])
+    assert list(indexed_stats(log_file, index_folder).column("restart")) == [0.]
+    write(log_file, [stats_line(1), stats_line(2)], "a")
+    assert list(indexed_stats(log_file, index_folder).column("restart")) == [0., 1., 0.]
+
+
+def test_checkpoints_only_at_interval_boundaries(log_file, index_folder):
+    lines = [stats_line(i) for i in range(100)]
+    open(log_file, "w").close()
+    for start in range(0, len(lines), 7):
+        write(log_file, lines[start:start + 7], "a")
+        indexed_stats(log_file, index_folder)
+    index = KlipperLogIndex(index_folder, log_file)
+    index.load()
+    times = [checkpoint[0] for checkpoint in index.meta["checkpoints"]]
+    interval = KlipperLogAnalyzer.CHECKPOINT_INTERVAL
+    # the first sample and the first one of every interval, not of every refresh
+    assert times == [100.] + [t for t in range(105, 600, 5) if t % interval == 0]
+    with open(log_file, "rb") as f:
+        data = f.read()
+    for sampletime, offset in index.meta["checkpoints"]:
+        assert data[offset:].startswith("Stats {:.1f}:".format(sampletime).encode("ascii"))
+
+
+def test_unterminated_line_is_left_for_the_next_refresh(log_file, index_folder):
+    with open(log_file, "w") as f:
+        f.write(stats_line(0) + "\n" + stats_line(1)[:30])
+    assert len(indexed_stats(log_file, index_folder)) == 1
+    with open(log_file, "a") as f:
+        f.write(stats_line(1)[30:] + "\n")
+    store = indexed_stats(log_file, index_folder)
+    assert as_dict(store) == as_dict(full_parse(log_file)[0])
+
+
+def test_rotated_log_resets_the_index(log_file, index_folder):
+    write(log_file, [stats_line(i) for i in range(10)])
+    assert len(indexed_stats(log_file, index_folder)) == 10
+    os.remove(log_file)
+    write(log_file, [stats_line(i) for i in range(50, 53)])
+    store = indexed_stats(log_file, index_folder)
+    assert list(store.times) == [350., 355., 360.]
+
+
+def test_window_from_checkpoints_equals_full_parse(log_file, index_folder):
+    write(log_file, log_lines(300))
+    indexed_stats(log_file, index_folder)
+    store, basetime = KlipperLogAnalyzer(log_file, index_folder=index_folder).load_window_stats(700., 900.)
+    assert basetime == 100.
+    full_store = full_parse(log_file)[0]
+    times = list(store.times)
+    assert times[0] <= 700. - 2 * KlipperLogAnalyzer.STATS_INTERVAL
+    assert times[-1] > 900.
+    start = list(full_store.times).index(times[0])
+    assert times == list(full_store.times)[start:start + len(times)]
@@ -0,0 +1,95 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+from octoprint_klipper.macroCompiler import MacroCache, compile_macro, compile_param, expand_macro
+
+MACRO = ("SET_HEATER_TEMPERATURE HEATER=extruder TARGET={label:Target Temperature, unit:C, default:190,"
+         " min:0, max:300}\nM117 {label:Message}\nSET_PRESSURE_ADVANCE SMOOTH_TIME={options:0.02|0.04}")
+
+
+def test_compile_param_types():
+    assert compile_param("label:Speed, default:100", 1)["type"] == "float"
+    assert compile_param("default:fast", 1)["type"] == "string"
+    assert compile_param("options:a|b", 1)["type"] == "enum"
+    assert compile_param("type:int, default:2", 1)["type"] == "int"
+    param = compile_param("unit:mm, min:-1.5, max:10", 3)
+    assert (param["label"], param["unit"], param["default"], param["min"], param["max"]) == (
+        "Input 3", "mm", None, -1.5, 10.)
+
+
+def test_compile_macro():
+    compiled = compile_macro(MACRO)
+    assert len(compiled["parts"]) == len(compiled["params"]) + 1
+    assert compiled["parts"][0] == "SET_HEATER_TEMPERATURE HEATER=extruder TARGET="
+    assert [p["label"] for p in compiled["params"]] == ["Target Temperature", "Message", "Input 3"]
+    assert compiled["params"][2]["options"] == ["0.02", "0.04"]
+
+
+def test_expand_macro():
+    compiled = compile_macro(MACRO)
+    lines, errors = expand_macro(compiled, [None, "Hello", "0.04"])
+    assert errors == []
+    assert lines == [
+        "SET_HEATER_TEMPERATURE HEATER=extruder TARGET=190",
+        "M117 Hello",
+        "SET_PRESSURE_ADVANCE SMOOTH_TIME=0.04"]
+
+
+def test_macro_without_params():
+    assert expand_macro(compile_macro("G28\nM112"), []) == (["G28", "M112"], [])
+
+
+@pytest.mark.parametrize("values, param, message", [
+    (["abc", "x", "0.02"], 0, "The value must be a number"),
+    (["301", "x", "0.02"], 0, "The value must be at most 300"),
+    (["-1", "x", "0.02"], 0, "The value must be at least 0"),
+    ([None, None, "0.02"], 1, "A value is required"),
+    ([None, "  ", "0.02"], 1, "A value is required"),
+    ([None, "a\nG28", "0.02"], 1, "The value must be a single line"),
+    ([None, "x", "0.03"], 2, "The value must be one of 0.02, 0.04"),
+])
+def test_expansion_errors(values, param, message):
+    lines, errors = expand_macro(compile_macro(MACRO), values)
+    assert lines == []
+    assert errors == [dict(param=param, message=message)]
+
+
+def test_all_errors_are_reported():
+    lines, errors = expand_macro(compile_macro(MACRO), ["abc"])
+    assert [e["param"] for e in errors] == [0, 1, 2]
+
+
+def test_int_and_enum_without_options():
+    lines, errors = expand_macro(compile_macro("G4 P{type:int} T{type:enum, default:a}"), ["1.5", None])
+    assert errors == [dict(param=0, message="The value must be an integer"),
+                      dict(param=1, message="The parameter has no options")]
+
+
+def test_cache_ids_and_recompiling():
+    cache = MacroCache()
+    macros = [dict(name="Park", macro="G1 X{default:0}"), dict(name="Park", macro="G28")]
+    assert cache.update(macros) == 2
+    schemas = cache.schemas()
+    assert [s["name"] for s in schemas] == ["Park", "Park"]
+    assert schemas[0]["id"] != schemas[1]["id"]
+    assert cache.get(schemas[1]["id"]) == compile_macro("G28")
+    # only the changed macro is compiled again, the moved one gets a new id
+    assert cache.update([dict(name="Park", macro="G28"), dict(name="Park", macro="G1 X{default:5}")]) == 1
+    assert cache.get(schemas[0]["id"]) is None
+    assert cache.get(schemas[1]["id"]) is None
+    assert cache.get("unknown") is None
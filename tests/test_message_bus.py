@@ -0,0 +1,137 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import logging
+
+import pytest
+
+from octoprint_klipper.messageBus import MessageBus
+
+
+class PluginManager(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send_plugin_message(self, identifier, message):
+        self.sent.append(message)
+
+
+class Plugin(object):
+
+    def __init__(self):
+        self._identifier = "klipper"
+        self._plugin_manager = PluginManager()
+        self._logger = logging.getLogger("test")
+
+
+def message(message_type, subtype="info", payload=""):
+    return dict(type=message_type, subtype=subtype, title="", payload=payload)
+
+
+@pytest.fixture
+def plugin():
+    return Plugin()
+
+
+@pytest.fixture
+def bus(plugin):
+    # the worker thread waits longer than the tests take, they flush
+    bus = MessageBus(plugin, interval=60, max_pending=3, history_size=4)
+    yield bus
+    bus.flush()
+
+
+def test_messages_are_sent_as_one_batch(bus, plugin):
+    bus.post(message("log", payload="a"))
+    bus.post(message("PopUp", payload="b"))
+    bus.flush()
+    assert len(plugin._plugin_manager.sent) == 1
+    batch = plugin._plugin_manager.sent[0]
+    assert batch["type"] == "batch"
+    assert [m["payload"] for m in batch["payload"]] == ["a", "b"]
+    bus.flush()
+    assert len(plugin._plugin_manager.sent) == 1
+
+
+def test_single_message_is_sent_as_is(bus, plugin):
+    bus.post(message("PopUp", payload="a"))
+    bus.flush()
+    assert plugin._plugin_manager.sent == [message("PopUp", payload="a")]
+
+
+def test_status_is_coalesced(bus, plugin):
+    bus.post(message("status", payload="connecting"))
+    bus.post(message("log", payload="a"))
+    bus.post(message("status", payload="ready"))
+    bus.flush()
+    assert [m["payload"] for m in plugin._plugin_manager.sent[0]["payload"]] == ["ready", "a"]
+
+
+def test_printer_state_deltas_are_merged(bus, plugin):
+    bus.post(message("printer_state", "delta", dict(
+        base=1, version=2, reset=False, changes=dict(extruder=dict(temperature=200.)))))
+    bus.post(message("printer_state", "delta", dict(
+        base=2, version=3, reset=False, changes=dict(
+            extruder=dict(target=210.), heater_bed=dict(temperature=60.)))))
+    bus.flush()
+    assert plugin._plugin_manager.sent[0]["payload"] == dict(
+        base=1, version=3, reset=False, changes=dict(
+            extruder=dict(temperature=200., target=210.), heater_bed=dict(temperature=60.)))
+
+
+def test_full_queue_drops_debug_and_sends_the_rest(bus, plugin):
+    for n in range(3):
+        bus.post(message("log", payload=n))
+    bus.post(message("console", "debug", "dropped"))
+    assert plugin._plugin_manager.sent == []
+    # any other message sends the pending batch first
+    bus.post(message("log", payload=3))
+    assert [m["payload"] for m in plugin._plugin_manager.sent[0]["payload"]] == [
+        0, 1, 2, "1 debug messages dropped"]
+    bus.flush()
+    assert plugin._plugin_manager.sent[1]["payload"] == 3
+
+
+def test_history(bus):
+    for n in range(6):
+        bus.post(message("log", payload=n))
+    bus.post(message("PopUp", payload="not kept"))
+    history = bus.history()
+    assert [m["payload"] for m in history["messages"]] == [2, 3, 4, 5]
+    assert [m["id"] for m in history["messages"]] == [3, 4, 5, 6]
+    assert (history["first_id"], history["capacity"]) == (3, 4)
+    assert [m["id"] for m in bus.history(before=5, limit=1)["messages"]] == [4]
+    assert bus.history(limit=0)["messages"] == []
+
+
+def test_history_size_and_clear(bus):
+    for n in range(4):
+        bus.post(message("log", payload=n))
+    bus.set_history_size(2)
+    assert [m["payload"] for m in bus.history()["messages"]] == [2, 3]
+    bus.clear_history()
+    assert bus.history() == dict(messages=[], first_id=None, capacity=2)
+    bus.post(message("log", payload=4))
+    # ids keep increasing
+    assert bus.history()["first_id"] == 5
+
+
+def test_shutdown_sends_the_pending_messages(plugin):
+    bus = MessageBus(plugin, interval=0.01)
+    bus.post(message("PopUp", payload="a"))
+    bus.shutdown()
+    assert plugin._plugin_manager.sent == [message("PopUp", payload="a")]
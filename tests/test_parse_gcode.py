@@ -0,0 +1,63 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import pytest
+
+pytest.importorskip("octoprint")
+
+from octoprint_klipper import plugin as klipper_plugin
+
+
+@pytest.fixture
+def plugin(monkeypatch):
+    plugin = klipper_plugin.KlipperPlugin()
+    plugin.info = []
+    plugin.errors = []
+    monkeypatch.setattr(klipper_plugin, "log_info", lambda self, message: self.info.append(message))
+    monkeypatch.setattr(klipper_plugin, "log_error", lambda self, message: self.errors.append(message))
+    monkeypatch.setattr(klipper_plugin, "update_status", lambda self, subtype, status: None)
+    return plugin
+
+
+def test_firmware_version_of_m115_ack(plugin):
+    line = "ok FIRMWARE_NAME:Klipper FIRMWARE_VERSION:v0.12.0-114-ga77d0790"
+    assert plugin.on_parse_gcode(None, line) == line
+    assert plugin.info == ["Firmware version: v0.12.0-114-ga77d0790"]
+
+
+def test_firmware_version_of_m115_response(plugin):
+    plugin.on_parse_gcode(None, "// FIRMWARE_NAME:Klipper FIRMWARE_VERSION:v0.12.0-114-ga77d0790")
+    assert plugin.info == ["Firmware version: v0.12.0-114-ga77d0790"]
+
+
+def test_ok_and_temperature_lines_pass(plugin):
+    for line in ("ok", "ok T:210.1 /210.0 B:60.0 /60.0", " T:210.1 /210.0 B:60.0 /60.0"):
+        assert plugin.on_parse_gcode(None, line) == line
+    assert plugin.info == []
+    assert plugin.errors == []
+
+
+def test_response_is_logged_when_it_ends(plugin):
+    plugin.on_parse_gcode(None, "// Klipper state: Ready")
+    plugin.on_parse_gcode(None, "// second line")
+    assert plugin.info == []
+    plugin.on_parse_gcode(None, "ok")
+    assert plugin.info == [" Klipper state: Ready second line"]
+
+
+def test_error_line(plugin):
+    plugin.on_parse_gcode(None, "!! Move out of range: 0.000 0.000 -5.000 [0.000]")
+    assert plugin.errors == [" Move out of range: 0.000 0.000 -5.000 [0.000]"]
@@ -0,0 +1,94 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+
+from octoprint_klipper.modules.KlipperResultCache import KlipperResultCache
+
+
+def result(size):
+    return dict(plot=dict(times=[1.] * size))
+
+
+def size_of(value):
+    return len(json.dumps(value))
+
+
+def test_key_changes_with_the_log_and_the_parameters(tmpdir):
+    log_file = tmpdir.join("klippy.log")
+    log_file.write("Stats 1.0:\n")
+    key = KlipperResultCache.make_key(str(log_file), max_points=100)
+    assert KlipperResultCache.make_key(str(log_file), max_points=100) == key
+    assert KlipperResultCache.make_key(str(log_file), max_points=200) != key
+    log_file.write("Stats 2.0:\n", mode="a")
+    assert KlipperResultCache.make_key(str(log_file), max_points=100) != key
+
+
+def test_least_recently_used_is_evicted():
+    cache = KlipperResultCache(max_memory=2 * size_of(result(10)))
+    cache.put("a", result(10))
+    cache.put("b", result(10))
+    assert cache.get("a") == result(10)
+    cache.put("c", result(10))
+    assert cache.get("b") is None
+    assert cache.get("a") == result(10)
+    assert cache.get("c") == result(10)
+    info = cache.info()
+    assert (info["entries"], info["hits"], info["misses"], info["evictions"]) == (2, 3, 1, 1)
+    assert info["memory"] == 2 * size_of(result(10))
+
+
+def test_too_large_results_are_not_kept_in_memory():
+    cache = KlipperResultCache(max_memory=size_of(result(10)))
+    cache.put("a", result(100))
+    assert cache.get("a") is None
+    assert cache.info()["memory"] == 0
+
+
+def test_replacing_an_entry_updates_the_memory():
+    cache = KlipperResultCache()
+    cache.put("a", result(10))
+    cache.put("a", result(20))
+    assert cache.get("a") == result(20)
+    assert cache.info()["memory"] == size_of(result(20))
+
+
+def test_disk_tier_survives_a_new_cache(tmpdir):
+    folder = str(tmpdir.join("cache"))
+    KlipperResultCache(cache_folder=folder).put("a", result(10))
+    KlipperResultCache(cache_folder=folder).put("b", result(10), persist=False)
+    cache = KlipperResultCache(cache_folder=folder)
+    assert cache.get("a") == result(10)
+    assert cache.get("b") is None
+    assert cache.info()["disk_hits"] == 1
+    # now from memory
+    assert cache.get("a") == result(10)
+    assert cache.info()["hits"] == 1
+
+
+def test_disk_tier_is_bounded(tmpdir):
+    folder = str(tmpdir.join("cache"))
+    entry_size = size_of(result(100)) + 100
+    cache = KlipperResultCache(max_memory=0, cache_folder=folder, max_disk=int(2.5 * entry_size))
+    for i, key in enumerate(("a", "b", "c")):
+        cache.put(key, result(100))
+        path = cache._disk_file(key)
+        os.utime(path, (1000 + i, 1000 + i))
+    cache.put("d", result(100))
+    assert len(os.listdir(folder)) == 2
+    assert cache.get("a") is None
+    assert cache.get("d") == result(100)
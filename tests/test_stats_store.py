@@ -0,0 +1,80 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from octoprint_klipper.modules.KlipperStatsStore import KlipperStatsStore
+
+
+def values(column):
+    return [None if v != v else v for v in column]
+
+
+def make_store(samples):
+    store = KlipperStatsStore()
+    for sampletime, fields in samples:
+        store.append(sampletime, fields)
+    return store
+
+
+def test_append_fills_missing_values():
+    store = make_store([
+        (1., dict(a=1.)),
+        (2., dict(a=2., b=20.)),
+        (3., dict(b=30.)),
+    ])
+    assert len(store) == 3
+    assert list(store.times) == [1., 2., 3.]
+    assert sorted(store.keys()) == ["a", "b"]
+    assert values(store.columns["a"]) == [1., 2., None]
+    assert values(store.columns["b"]) == [None, 20., 30.]
+    assert store.missing == {"a", "b"}
+
+
+def test_full_column_is_returned_as_is():
+    store = make_store([(1., dict(a=1., b=1.)), (2., dict(a=2.))])
+    assert store.column("a") is store.columns["a"]
+    assert list(store.column("b", -1.)) == [1., -1.]
+    assert list(store.column("unknown")) == [0., 0.]
+
+
+def test_extend_aligns_the_columns():
+    store = make_store([(1., dict(a=1.)), (2., dict(a=2.))])
+    store.extend(make_store([(3., dict(b=30.))]))
+    assert list(store.times) == [1., 2., 3.]
+    assert values(store.columns["a"]) == [1., 2., None]
+    assert values(store.columns["b"]) == [None, None, 30.]
+    assert store.missing == {"a", "b"}
+
+
+def test_extend_equals_append():
+    samples = [(float(i), {"k{}".format(i % 3): float(i), "t": float(i)}) for i in range(10)]
+    store = make_store(samples[:4])
+    store.extend(make_store(samples[4:]))
+    full_store = make_store(samples)
+    assert list(store.times) == list(full_store.times)
+    assert {k: values(c) for k, c in store.columns.items()} == \
+        {k: values(c) for k, c in full_store.columns.items()}
+    assert store.missing == full_store.missing
+
+
+def test_tail():
+    store = make_store([(1., dict(a=1.)), (2., dict(a=2., b=2.)), (3., dict(a=3., b=3.))])
+    tail = store.tail(2)
+    assert list(tail.times) == [2., 3.]
+    assert list(tail.columns["b"]) == [2., 3.]
+    # b has no missing value in the last samples
+    assert tail.missing == set()
+    assert len(store.tail(10)) == 3
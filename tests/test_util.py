@@ -0,0 +1,51 @@
+# <Octoprint Klipper Plugin>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import logging
+
+import pytest
+
+from octoprint_klipper.util import set_debug_logging
+
+
+class Settings(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def get_boolean(self, path):
+        return bool(self.values.get(tuple(path)))
+
+
+class Plugin(object):
+
+    def __init__(self, values):
+        self._settings = Settings(values)
+        self._octoklipper_logger = logging.getLogger("octoprint.plugins.klipper.test")
+
+
+@pytest.mark.parametrize("enabled, level", [(True, logging.DEBUG), (False, logging.INFO)])
+def test_debug_logging_level_at_startup(enabled, level):
+    plugin = Plugin({("configuration", "debug_logging"): enabled})
+    set_debug_logging(plugin)
+    assert plugin._octoklipper_logger.level == level
+    assert plugin._octoklipper_logger.isEnabledFor(logging.DEBUG) == enabled
+
+
+def test_debug_logging_ignores_the_top_level_key():
+    plugin = Plugin({("debug_logging",): True})
+    set_debug_logging(plugin)
+    assert plugin._octoklipper_logger.level == logging.INFO